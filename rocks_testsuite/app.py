@@ -1,15 +1,21 @@
 import argparse
+import asyncio
 import json
 import logging
 import os
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-import coloredlogs
-import uvicorn
+import jinja2
 from fastapi import FastAPI, HTTPException, Request, Response, WebSocket
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
+from rocks_testsuite import media, reports
+from rocks_testsuite.jobs import Job, JobManager
+from rocks_testsuite.logs import setup_logging
+from rocks_testsuite.result import dumps
+from rocks_testsuite.result_stream import junit_xml
+from rocks_testsuite.static_assets import StaticAssets
 from rocks_testsuite.test_session import TestSession, TestSessionManager
 
 _logger = logging.getLogger("rocks.app")
@@ -19,9 +25,8 @@ base_dir = os.path.dirname(__file__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # logging needs to be configured here for proper reload behavior
-    log_level = os.environ["TESTSUITE_LOG_LEVEL"] or logging.INFO
-    _setup_logging(log_level)
+    # These use httpx, which isn't needed to import the app
+    from rocks_testsuite import capabilities, inprocess, ratelimit
 
     # This might (probably will) change later
     config_file = os.environ.get("TESTSUITE_CONFIG")
@@ -31,26 +36,91 @@ async def lifespan(app: FastAPI):
     else:
         config = {}
 
+    # logging needs to be configured here for proper reload behavior
+    log_level = os.environ.get("TESTSUITE_LOG_LEVEL") or logging.INFO
+    _setup_logging(log_level, config.get("log-limits"))
+    for key, env_name in [
+        ("select-tests", "TESTSUITE_SELECT_TESTS"),
+        ("select-levels", "TESTSUITE_SELECT_LEVELS"),
+        ("target-app", "TESTSUITE_TARGET_APP"),
+    ]:
+        if os.environ.get(env_name):
+            config[key] = os.environ[env_name]
+
     app.state.config = config
+    store = reports.configure(config)
+    _logger.info("Saving reports to %s", store.root)
+    ratelimit.configure(config)
+    media.configure(config)
+    capabilities.configure(config)
     app.state.session_manager = TestSessionManager()
-    yield
+    app.state.job_manager = JobManager(app.state.session_manager, templates.env, config)
+    app.state.job_manager.start()
+    precompile_templates()
+    warm_up = asyncio.create_task(asyncio.to_thread(_warm_up))
+    retention = asyncio.create_task(_report_retention(store, config))
+    try:
+        async with inprocess.serve(app, config):
+            yield
+    finally:
+        retention.cancel()
+        with suppress(asyncio.CancelledError):
+            await retention
+        await app.state.job_manager.stop()
+        await warm_up
+
+
+async def _report_retention(store: reports.ReportStore, config: dict):
+    max_age_days = config.get("report-max-age-days")
+    max_total_mb = config.get("report-max-total-mb")
+    if not (max_age_days or max_total_mb):
+        return
+    while True:
+        try:
+            deleted = await asyncio.to_thread(
+                store.collect,
+                max_age_days * 86400 if max_age_days else None,
+                int(max_total_mb * 1024 * 1024) if max_total_mb else None,
+            )
+        except Exception:
+            # Try again next interval rather than stopping retention for good
+            _logger.error("Report retention failed", exc_info=True)
+        else:
+            if deleted:
+                _logger.info("Report retention deleted %d files", deleted)
+        await asyncio.sleep(config.get("report-gc-interval", 3600))
+
+
+def precompile_templates():
+    """Compile all templates (and fill the bytecode cache) before first use."""
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+
+
+def _warm_up():
+    # Heavy modules are imported lazily so the app can serve pages sooner.
+    # Load them, and generate the shared actor keys, off the event loop
+    # before the first test session needs them.
+    static_assets.precompress()
+    from rocks_testsuite import c2s_tests, signatures  # noqa: F401
+    from rocks_testsuite.test_session import get_key_pair
+
+    get_key_pair()
 
 
 app = FastAPI(lifespan=lifespan)
 
-app.mount(
-    "/static",
-    StaticFiles(directory=f"{base_dir}/static"),
-    name="static",
-)
+static_assets = StaticAssets(f"{base_dir}/static")
 
-app.mount(
-    "/download-report",
-    StaticFiles(directory=f"{base_dir}/reports"),
-    name="reports",
-)
+app.mount("/static", static_assets, name="static")
 
-templates = Jinja2Templates(directory=f"{base_dir}/templates")
+templates = Jinja2Templates(
+    directory=f"{base_dir}/templates",
+    bytecode_cache=jinja2.FileSystemBytecodeCache(
+        os.environ.get("TESTSUITE_TEMPLATE_CACHE")
+    ),
+)
+templates.env.globals["static_url"] = static_assets.url
 
 
 @app.head("/")
@@ -66,13 +136,15 @@ def head():
 
 
 @app.get("/")
-def app_page(request: Request):
-    return templates.TemplateResponse("app.jinja", {"request": request})
+def app_page(request: Request, spectate: str | None = None):
+    return templates.TemplateResponse(
+        "app.jinja", {"request": request, "spectate": spectate}
+    )
 
 
 # emulating activitypub actors and endpoints
-@app.route("/ap/u/{session_id}/{actor_id}", methods=["GET", "POST"])
-@app.route("/ap/u/{session_id}/{actor_id}/{path:path}", methods=["GET", "POST"])
+@app.route("/ap/u/{session_id}/{actor_id}", methods=["GET", "HEAD", "POST"])
+@app.route("/ap/u/{session_id}/{actor_id}/{path:path}", methods=["GET", "HEAD", "POST"])
 async def activitypub(request: Request) -> Response:
     session = request.app.state.session_manager.sessions.get(
         request.path_params["session_id"]
@@ -87,12 +159,128 @@ async def activitypub(request: Request) -> Response:
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     state = websocket.app.state
-    session = TestSession(websocket, templates.env, state.config)
+    session = TestSession(websocket, templates.env, dict(state.config))
     try:
         state.session_manager.sessions[session.id] = session
         await session.run()
     finally:
         del state.session_manager.sessions[session.id]
+        await session.close()
+
+
+@app.websocket("/spectate/{session_id}")
+async def spectate(websocket: WebSocket, session_id: str):
+    """Stream a running session's messages read-only."""
+    session = websocket.app.state.session_manager.sessions.get(session_id)
+    if session is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    async def forward(subscriber):
+        async for message in subscriber.messages():
+            await websocket.send_text(message)
+
+    async def drain():
+        # Spectators don't send anything, this ends when they leave
+        async for _ in websocket.iter_text():
+            pass
+
+    with session.spectators.subscribe() as subscriber:
+        forwarding = asyncio.create_task(forward(subscriber))
+        leaving = asyncio.create_task(drain())
+        done, pending = await asyncio.wait(
+            [forwarding, leaving], return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(forwarding, leaving, return_exceptions=True)
+    if leaving in pending and not forwarding.exception():
+        # The session ended, or "try again later" if the spectator fell behind
+        await websocket.close(code=1013 if subscriber.dropped else 1000)
+
+
+REPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "gz": "application/gzip",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@app.get("/download-report/{filename}")
+def download_report(filename: str):
+    report_id, _, suffix = filename.partition(".")
+    if suffix == "junit.xml":
+        return _junit_report(report_id)
+    path = reports.get_store().find(report_id, "." + suffix)
+    if path is None:
+        raise HTTPException(404, detail="Unknown report")
+    return FileResponse(path, media_type=REPORT_MEDIA_TYPES[suffix.rpartition(".")[2]])
+
+
+def _junit_report(report_id: str) -> StreamingResponse:
+    """JUnit XML generated from the streamed results, also while running."""
+    path = reports.get_store().find(report_id, ".results.ndjson")
+    if path is None:
+        raise HTTPException(404, detail="Unknown report")
+
+    def stream():
+        with open(path) as fp:
+            yield from junit_xml(fp, f"rocks-testsuite {report_id}")
+
+    return StreamingResponse(stream(), media_type="application/xml")
+
+
+@app.post("/jobs")
+async def submit_job(request: Request):
+    try:
+        job = request.app.state.job_manager.submit(
+            await request.json(), str(request.base_url)
+        )
+    except ValueError as ex:
+        raise HTTPException(422, detail=str(ex))
+    except asyncio.QueueFull:
+        raise HTTPException(
+            503, detail="Job queue is full", headers={"Retry-After": "30"}
+        )
+    return JSONResponse(
+        job.to_json(), status_code=202, headers={"Location": f"/jobs/{job.id}"}
+    )
+
+
+def _get_job(request: Request, job_id: str) -> Job:
+    job = request.app.state.job_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Unknown job")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+def job_status(request: Request, job_id: str, after: int = 0):
+    return JSONResponse(_get_job(request, job_id).to_json(after))
+
+
+@app.get("/jobs/{job_id}/events")
+def job_events(request: Request, job_id: str, after: int = 0):
+    job = _get_job(request, job_id)
+
+    async def stream():
+        async for event in job.follow(after):
+            yield dumps(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}/report")
+def job_report(request: Request, job_id: str):
+    job = _get_job(request, job_id)
+    if job.status != "complete":
+        raise HTTPException(409, detail=f"Job is {job.status}")
+    path = reports.get_store().find(job.session.id)
+    if path is None:
+        # Deleted by the report retention
+        raise HTTPException(404, detail="Unknown report")
+    return FileResponse(path, media_type="application/json")
 
 
 @app.get("/healthcheck")
@@ -100,14 +288,13 @@ def health_check():
     return "OK"
 
 
-def _setup_logging(level_name: int | str):
+def _setup_logging(level_name: int | str, limits: dict | None = None):
     # Hack to avoid silly uvicorn.error level naming
-    logging.root.setLevel(logging.getLevelName(level_name))
     logging.getLogger("uvicorn.error").name = "uvicorn"
-    coloredlogs.install(
-        milliseconds=True,
-        level=level_name,
-        fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
+    setup_logging(
+        level_name,
+        fmt=os.environ.get("TESTSUITE_LOG_FORMAT") or "text",
+        limits=limits,
     )
 
 
@@ -116,6 +303,14 @@ def main():
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=8000)
     parser.add_argument("--config", help="optional config file")
+    parser.add_argument(
+        "--select",
+        help="comma-separated test id glob patterns to run (e.g. 'outbox:create*')",
+    )
+    parser.add_argument(
+        "--levels",
+        help="comma-separated requirement levels to run (e.g. 'MUST,SHOULD')",
+    )
     parser.add_argument(
         "--reload",
         action="store_true",
@@ -127,6 +322,16 @@ def main():
         choices=["NOTSET", "DEBUG", "INFO", "WARN", "ERROR", "CRITICAL"],
         default="INFO",
     )
+    parser.add_argument(
+        "--log_format",
+        choices=["text", "json"],
+        default="text",
+        help="json writes one object per line with session and test ids",
+    )
+    parser.add_argument(
+        "--target_app",
+        help="Import path (module:app) of an ASGI or WSGI app to test in-process",
+    )
     args = parser.parse_args()
     if args.reload:
         args.reload_includes = [
@@ -139,11 +344,20 @@ def main():
 
     if args.config:
         os.environ["TESTSUITE_CONFIG"] = args.config
+    if args.select:
+        os.environ["TESTSUITE_SELECT_TESTS"] = args.select
+    if args.levels:
+        os.environ["TESTSUITE_SELECT_LEVELS"] = args.levels
+    if args.target_app:
+        os.environ["TESTSUITE_TARGET_APP"] = args.target_app
 
     # Passing log level via env for reload behavior
     os.environ["TESTSUITE_LOG_LEVEL"] = args.log_level
+    os.environ["TESTSUITE_LOG_FORMAT"] = args.log_format
     _setup_logging(args.log_level)
     _logger.info("ActivityPub test suite")
+    import uvicorn
+
     uvicorn.run(
         "rocks_testsuite.app:app",
         log_config=None,
@@ -0,0 +1,96 @@
+import asyncio
+import collections
+import logging
+from contextlib import contextmanager
+from typing import AsyncIterator, Iterator
+
+_logger = logging.getLogger("rocks.session")
+
+DEFAULT_SPECTATOR_BUFFER = 256
+DEFAULT_SPECTATOR_HISTORY = 1000
+
+
+class Subscriber:
+    """A spectator's view of a session's messages.
+
+    Messages sent before it subscribed (up to the history size) come first.
+    If it falls more than a buffer behind, it is dropped: ``dropped`` is
+    set and its messages end, so the spectator can reconnect to catch up.
+    """
+
+    def __init__(self, history: list[str], buffer: int):
+        self._history = history
+        self._queue: asyncio.Queue[str | None] = asyncio.Queue(buffer)
+        self.dropped = False
+
+    def offer(self, message: str) -> bool:
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.end(dropped=True)
+            return False
+
+    def end(self, dropped: bool = False):
+        if dropped:
+            self.dropped = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            self.end(dropped=True)
+
+    async def messages(self) -> AsyncIterator[str]:
+        history, self._history = self._history, []
+        for message in history:
+            yield message
+        while (message := await self._queue.get()) is not None:
+            yield message
+
+
+class Broadcaster:
+    """Sends a session's serialized messages to its spectators.
+
+    Publishing never waits: each spectator has its own bounded buffer, so a
+    slow one can't hold up the session or the other spectators.
+    """
+
+    def __init__(
+        self,
+        buffer: int = DEFAULT_SPECTATOR_BUFFER,
+        history: int = DEFAULT_SPECTATOR_HISTORY,
+    ):
+        self._buffer = buffer
+        self._history: collections.deque[str] = collections.deque(maxlen=history)
+        self._subscribers: set[Subscriber] = set()
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, message: str):
+        self._history.append(message)
+        for subscriber in list(self._subscribers):
+            if not subscriber.offer(message):
+                self._subscribers.discard(subscriber)
+                _logger.warning("Dropped a spectator that fell behind")
+
+    @contextmanager
+    def subscribe(self) -> Iterator[Subscriber]:
+        subscriber = Subscriber(list(self._history), self._buffer)
+        if self.closed:
+            subscriber.end()
+        else:
+            self._subscribers.add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def close(self):
+        """End the spectators' streams once they've sent what's buffered."""
+        self.closed = True
+        for subscriber in self._subscribers:
+            subscriber.end()
+        self._subscribers.clear()
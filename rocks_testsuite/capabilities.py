@@ -0,0 +1,186 @@
+import asyncio
+import copy
+import logging
+import time
+from typing import Any
+from urllib.parse import urljoin, urlsplit
+
+from rocks_testsuite.transport import async_client
+
+_logger = logging.getLogger("rocks.session")
+
+DEFAULT_CAPABILITY_TTL = 600
+# Seconds before a probe request is given up on (the capability is unknown)
+PROBE_TIMEOUT = 10.0
+COLLECTIONS = ["inbox", "outbox", "followers", "following", "liked"]
+ENDPOINTS = [
+    "uploadMedia",
+    "oauthAuthorizationEndpoint",
+    "oauthTokenEndpoint",
+    "proxyUrl",
+    "sharedInbox",
+]
+# C2S tests and the capabilities they can't run without
+REQUIREMENTS: dict[str, list[tuple[str, str, str]]] = {
+    "test_outbox_upload_media": [
+        ("endpoints", "uploadMedia", "uploadMedia endpoint not supported")
+    ],
+    "test_outbox_activity_follow_undo": [
+        ("collections", "following", "No following collection")
+    ],
+    "test_outbox_activity_like": [("collections", "liked", "Like not supported")],
+    "test_outbox_activity_add_remove": [
+        ("objects", "Collection", "Collection objects not supported")
+    ],
+}
+
+
+class CapabilityCache:
+    """Capability maps by actor URI, shared by the sessions testing it."""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[float, dict[str, Any]]] = {}
+
+    def get(self, actor_uri: str, ttl: float) -> dict[str, Any] | None:
+        entry = self._entries.get(actor_uri)
+        if entry is None or time.monotonic() - entry[0] > ttl:
+            return None
+        return entry[1]
+
+    def put(self, actor_uri: str, capabilities: dict[str, Any]):
+        self._entries[actor_uri] = (time.monotonic(), capabilities)
+
+    def update(self, actor_uri: str, section: str, name: str, value: bool | None):
+        entry = self._entries.get(actor_uri)
+        if entry is not None:
+            entry[1].setdefault(section, {})[name] = value
+
+
+_cache = CapabilityCache()
+# Seconds a probe is reused. A server setting, so sessions and jobs can't
+# change it.
+_ttl: float = DEFAULT_CAPABILITY_TTL
+
+
+def configure(config: dict[str, Any]):
+    global _ttl
+    _ttl = float(config.get("capability-cache-ttl", DEFAULT_CAPABILITY_TTL))
+
+
+class Capabilities:
+    """What the server under test supports, probed before the tests run.
+
+    Each capability is True, False or None (unknown). Only capabilities known
+    to be missing make tests not applicable, so probe errors never skip a
+    test. Tests can record what they find out, for later sessions.
+    """
+
+    def __init__(self, session, actor_uri: str, capabilities: dict[str, Any]):
+        self._session = session
+        self._actor_uri = actor_uri
+        self.map = capabilities
+        session.metrics["capabilities"] = capabilities
+
+    def get(self, section: str, name: str) -> bool | None:
+        return self.map.get(section, {}).get(name)
+
+    def record(self, section: str, name: str, value: bool | None):
+        self.map.setdefault(section, {})[name] = value
+        if _cacheable(self._session):
+            _cache.update(self._actor_uri, section, name, value)
+
+    def unsupported(self, test_name: str) -> str | None:
+        """Why the test can't run on this server, if it can't."""
+        for section, name, reason in REQUIREMENTS.get(test_name, []):
+            if self.get(section, name) is False:
+                return reason
+        return None
+
+
+def _cacheable(session) -> bool:
+    # Cassettes need the same requests in record and replay sessions
+    return session.cassette_mode is None
+
+
+async def preflight(session, profile: dict[str, Any], token: str) -> Capabilities:
+    """Probe the actor's collections, endpoints and NodeInfo concurrently,
+    or reuse a recent probe of the same actor."""
+    actor_uri = profile["id"]
+    cached = _cache.get(actor_uri, _ttl) if _cacheable(session) else None
+    if cached is not None:
+        _logger.info("Using cached capabilities of %s", actor_uri)
+        return Capabilities(
+            session, actor_uri, {**copy.deepcopy(cached), "cached": True}
+        )
+    started = time.monotonic()
+    endpoints = profile.get("endpoints")
+    endpoints = endpoints if isinstance(endpoints, dict) else {}
+    names = [name for name in COLLECTIONS if isinstance(profile.get(name), str)]
+    async with async_client(timeout=PROBE_TIMEOUT) as client:
+        probes = [_probe_collection(client, profile[name], token) for name in names]
+        *collections, nodeinfo = await asyncio.gather(
+            *probes, _probe_nodeinfo(client, actor_uri)
+        )
+    # Collections missing from the profile are unknown, so the tests needing
+    # them still run (and fail)
+    found = dict(zip(names, collections))
+    capabilities = {
+        "collections": {name: found.get(name) for name in COLLECTIONS},
+        "endpoints": {name: isinstance(endpoints.get(name), str) for name in ENDPOINTS},
+        "objects": {},
+        "nodeinfo": nodeinfo,
+        "probe-seconds": round(time.monotonic() - started, 3),
+    }
+    if _cacheable(session):
+        _cache.put(actor_uri, copy.deepcopy(capabilities))
+    return Capabilities(session, actor_uri, {**capabilities, "cached": False})
+
+
+async def _probe_collection(client, uri: str, token: str) -> bool | None:
+    try:
+        response = await client.get(
+            uri,
+            headers={
+                "Accept": "application/activity+json",
+                "Authorization": f"Bearer {token}",
+            },
+        )
+    except Exception as ex:
+        _logger.info("Capability probe of %s failed: %s", uri, ex)
+        return None
+    if response.status_code in [404, 410, 501]:
+        return False
+    # Inboxes (and private collections) may not be readable, that's fine
+    return True if response.is_success else None
+
+
+async def _probe_nodeinfo(client, actor_uri: str) -> dict[str, Any] | None:
+    """The server's software and protocols from its NodeInfo, if it has one."""
+    parts = urlsplit(actor_uri)
+    well_known = f"{parts.scheme}://{parts.netloc}/.well-known/nodeinfo"
+    try:
+        response = await client.get(well_known, headers={"Accept": "application/json"})
+        if not response.is_success:
+            return None
+        links = [
+            link
+            for link in response.json().get("links", [])
+            if isinstance(link, dict) and isinstance(link.get("href"), str)
+        ]
+        if not links:
+            return None
+        # The rel is the schema URI, ending with its version
+        latest = max(links, key=lambda link: str(link.get("rel")))
+        response = await client.get(urljoin(well_known, latest["href"]))
+        response.raise_for_status()
+        document = response.json()
+    except Exception as ex:
+        _logger.info("NodeInfo probe of %s failed: %s", well_known, ex)
+        return None
+    software = document.get("software")
+    software = software if isinstance(software, dict) else {}
+    return {
+        "software": software.get("name"),
+        "version": software.get("version"),
+        "protocols": document.get("protocols"),
+    }
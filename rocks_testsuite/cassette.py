@@ -0,0 +1,161 @@
+import base64
+import collections
+import gzip
+import json
+from typing import Any
+
+import httpx
+
+from rocks_testsuite.transport import SessionTransport
+
+CASSETTE_VERSION = 1
+
+# Headers that no longer apply once the body is stored decoded
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def _encode_body(body: bytes | None) -> tuple[str | None, str]:
+    if body is None:
+        return None, "none"
+    try:
+        return body.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode("ascii"), "base64"
+
+
+def _decode_body(body: str | None, encoding: str) -> bytes:
+    if body is None:
+        return b""
+    if encoding == "base64":
+        return base64.b64decode(body)
+    return body.encode("utf-8")
+
+
+class Cassette:
+    """Recorded HTTP interactions and test actor URIs for one session."""
+
+    def __init__(
+        self,
+        interactions: list[dict[str, Any]] | None = None,
+        actors: list[str] | None = None,
+        info: dict[str, Any] | None = None,
+    ):
+        self.interactions = interactions or []
+        self.actors = actors or []
+        self.info = info or {}
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        with gzip.open(path, "rt", encoding="utf-8") as fp:
+            data = json.load(fp)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+        return cls(data["interactions"], data["actors"], data.get("info"))
+
+    def save(self, path: str):
+        with gzip.open(path, "wt", encoding="utf-8") as fp:
+            json.dump(
+                {
+                    "version": CASSETTE_VERSION,
+                    "info": self.info,
+                    "actors": self.actors,
+                    "interactions": self.interactions,
+                },
+                fp,
+                separators=(",", ":"),
+            )
+
+    def record(self, request: httpx.Request, response: httpx.Response, body: bytes):
+        try:
+            request_body = request.content
+        except httpx.RequestNotRead:
+            # Streamed uploads aren't buffered just to record them
+            request_body = None
+        request_text, request_encoding = _encode_body(request_body)
+        response_text, response_encoding = _encode_body(body)
+        self.interactions.append(
+            {
+                "method": request.method,
+                "url": str(request.url),
+                "request": request_text,
+                "request_encoding": request_encoding,
+                "status": response.status_code,
+                "headers": [
+                    [name, value]
+                    for name, value in response.headers.multi_items()
+                    if name.lower() not in _DROPPED_HEADERS
+                ],
+                "body": response_text,
+                "encoding": response_encoding,
+            }
+        )
+
+
+class RecordingTransport(SessionTransport):
+    """Forwards requests and records every interaction into a cassette."""
+
+    def __init__(
+        self, cassette: Cassette, transport: httpx.AsyncBaseTransport | None = None
+    ):
+        super().__init__(transport)
+        self.cassette = cassette
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._transport.handle_async_request(request)
+        # Decode through a temporary response so the stored body is plain
+        body = await httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=response.stream,
+            request=request,
+        ).aread()
+        self.cassette.record(request, response, body)
+        return httpx.Response(
+            response.status_code,
+            headers=[
+                (name, value)
+                for name, value in response.headers.multi_items()
+                if name.lower() not in _DROPPED_HEADERS
+            ],
+            content=body,
+            request=request,
+            extensions=response.extensions,
+        )
+
+
+class ReplayTransport(SessionTransport):
+    """Answers requests from a cassette without touching the network.
+
+    Interactions are matched by method and URL in recorded order. When the
+    recorded responses for a request are used up, the last one is repeated
+    (polling loops may run a different number of times).
+    """
+
+    def __init__(self, cassette: Cassette):
+        super().__init__(None)
+        self._pending: dict[tuple[str, str], collections.deque] = (
+            collections.defaultdict(collections.deque)
+        )
+        self._last: dict[tuple[str, str], dict[str, Any]] = {}
+        for interaction in cassette.interactions:
+            key = (interaction["method"], interaction["url"])
+            self._pending[key].append(interaction)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = (request.method, str(request.url))
+        pending = self._pending.get(key)
+        if pending:
+            interaction = self._last[key] = pending.popleft()
+        elif key in self._last:
+            interaction = self._last[key]
+        else:
+            raise httpx.ConnectError(
+                f"No recorded interaction for {request.method} {request.url}",
+                request=request,
+            )
+        return httpx.Response(
+            interaction["status"],
+            headers=interaction["headers"],
+            content=_decode_body(interaction["body"], interaction["encoding"]),
+            request=request,
+        )
@@ -0,0 +1,213 @@
+"""Slow and lossy links between the suite and the server under test.
+
+``fault-injection`` is a list of rules. The first rule whose ``route`` (a
+glob pattern matched against the URL) and ``methods`` match a request
+applies to it::
+
+    {"route": "*/outbox*", "methods": ["POST"],
+     "latency": {"distribution": "normal", "mean": 0.2, "stddev": 0.05},
+     "bandwidth": 65536, "error-rate": 0.05, "error-status": 503,
+     "drop-rate": 0.01}
+
+Latency is added once per request. Bandwidth (bytes per second) paces the
+request and response bodies. Injected errors are answered without sending
+the request. Dropped requests are sent, but the response is lost and the
+client gets a read error. ``fault-injection-scale`` makes all rules worse
+(or better) by a factor, and ``fault-injection-seed`` makes runs
+repeatable.
+"""
+
+import asyncio
+import fnmatch
+import logging
+import random
+from typing import Any, AsyncIterator
+
+import httpx
+
+from rocks_testsuite.result import TestResults, outcome_of
+
+_logger = logging.getLogger("rocks.faults")
+
+DISTRIBUTIONS = ["fixed", "uniform", "normal", "exponential"]
+DEFAULT_ERROR_STATUS = 503
+
+
+class Latency:
+    def __init__(self, spec: Any, scale: float):
+        if isinstance(spec, (int, float)):
+            spec = {"mean": spec}
+        if not isinstance(spec, dict):
+            raise ValueError("'latency' must be seconds or an object")
+        self.distribution = spec.get("distribution", "fixed")
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency distribution {self.distribution!r}, "
+                f"expected one of: {', '.join(DISTRIBUTIONS)}"
+            )
+        mean = float(spec.get("mean", 0))
+        self.mean = mean * scale
+        self.stddev = float(spec.get("stddev", 0)) * scale
+        self.min = float(spec.get("min", 0)) * scale
+        self.max = float(spec.get("max", 2 * mean)) * scale
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "uniform":
+            return rng.uniform(self.min, self.max)
+        if self.distribution == "normal":
+            return max(0.0, rng.gauss(self.mean, self.stddev))
+        if self.distribution == "exponential":
+            return rng.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        return self.mean
+
+
+class FaultRule:
+    def __init__(self, spec: Any, scale: float = 1.0):
+        if not isinstance(spec, dict):
+            raise ValueError("Fault injection rules must be objects")
+        self.route = spec.get("route", "*")
+        if not isinstance(self.route, str):
+            raise ValueError("'route' must be a URL pattern")
+        methods = spec.get("methods")
+        if methods is not None and (
+            not isinstance(methods, list)
+            or not all(isinstance(method, str) for method in methods)
+        ):
+            raise ValueError("'methods' must be a list of HTTP methods")
+        self.methods = {method.upper() for method in methods} if methods else None
+        self.latency = Latency(spec["latency"], scale) if "latency" in spec else None
+        bandwidth = spec.get("bandwidth")
+        self.bandwidth = float(bandwidth) / scale if bandwidth and scale else None
+        self.error_rate = _rate(spec, "error-rate", scale)
+        self.error_status = int(spec.get("error-status", DEFAULT_ERROR_STATUS))
+        self.drop_rate = _rate(spec, "drop-rate", scale)
+        self.stats = {
+            "requests": 0,
+            "delay-seconds": 0.0,
+            "errors": 0,
+            "drops": 0,
+        }
+
+    def matches(self, request: httpx.Request) -> bool:
+        if self.methods and request.method not in self.methods:
+            return False
+        return fnmatch.fnmatchcase(str(request.url), self.route)
+
+
+def _rate(spec: dict[str, Any], key: str, scale: float) -> float:
+    rate = float(spec.get(key, 0))
+    if not 0 <= rate <= 1:
+        raise ValueError(f"'{key}' must be between 0 and 1")
+    return min(rate * scale, 1.0)
+
+
+def parse_rules(config: dict[str, Any]) -> list[FaultRule]:
+    """The configured fault injection rules. Raises ValueError if invalid."""
+    specs = config.get("fault-injection") or []
+    if not isinstance(specs, list):
+        raise ValueError("'fault-injection' must be a list of rules")
+    scale = float(config.get("fault-injection-scale", 1))
+    if scale < 0:
+        raise ValueError("'fault-injection-scale' can't be negative")
+    try:
+        return [FaultRule(spec, scale) for spec in specs]
+    except (TypeError, KeyError) as ex:
+        raise ValueError(f"Invalid fault injection rule: {ex}")
+
+
+class _ThrottledStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, rule: FaultRule):
+        self._stream = stream
+        self._rule = rule
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            delay = len(chunk) / self._rule.bandwidth
+            self._rule.stats["delay-seconds"] += delay
+            await asyncio.sleep(delay)
+            yield chunk
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class FaultInjectionTransport(httpx.AsyncBaseTransport):
+    """Adds latency, bandwidth limits, errors and dropped connections to the
+    requests matching the rules. Other requests pass through."""
+
+    def __init__(
+        self,
+        rules: list[FaultRule],
+        transport: httpx.AsyncBaseTransport | None = None,
+        seed: Any = None,
+    ):
+        self.rules = rules
+        self._transport = transport or httpx.AsyncHTTPTransport()
+        self._random = random.Random(seed)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        rule = next((rule for rule in self.rules if rule.matches(request)), None)
+        if rule is None:
+            return await self._transport.handle_async_request(request)
+        stats = rule.stats
+        stats["requests"] += 1
+        delay = rule.latency.sample(self._random) if rule.latency else 0.0
+        if rule.bandwidth and isinstance(request.stream, httpx.ByteStream):
+            # Known length, and the body may be sent again on retries
+            delay += len(request.content) / rule.bandwidth
+        elif rule.bandwidth:
+            request.stream = _ThrottledStream(request.stream, rule)
+        stats["delay-seconds"] += delay
+        await asyncio.sleep(delay)
+        if rule.error_rate and self._random.random() < rule.error_rate:
+            stats["errors"] += 1
+            _logger.debug("Injected %d for %s", rule.error_status, request.url)
+            return httpx.Response(
+                rule.error_status, text="Injected fault", request=request
+            )
+        response = await self._transport.handle_async_request(request)
+        if rule.drop_rate and self._random.random() < rule.drop_rate:
+            stats["drops"] += 1
+            _logger.debug("Dropped the response for %s", request.url)
+            await response.aclose()
+            raise httpx.ReadError(
+                "Connection dropped (injected fault)", request=request
+            )
+        if rule.bandwidth:
+            response.stream = _ThrottledStream(response.stream, rule)
+        return response
+
+    def metrics(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "route": rule.route,
+                "methods": sorted(rule.methods) if rule.methods else None,
+                **rule.stats,
+                "delay-seconds": round(rule.stats["delay-seconds"], 3),
+            }
+            for rule in self.rules
+        ]
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def result_changes(
+    baseline: dict[str, TestResults], results: dict[str, TestResults]
+) -> dict[str, dict[str, dict[str, str | None]]]:
+    """Tests with a different outcome than in the baseline run, by group."""
+    changes: dict[str, dict[str, dict[str, str | None]]] = {}
+    for group in sorted(baseline.keys() | results.keys()):
+        before = baseline.get(group, {})
+        after = results.get(group, {})
+        for test_id in sorted(before.keys() | after.keys()):
+            outcomes = [
+                outcome_of(run[test_id]).name.lower() if test_id in run else None
+                for run in [before, after]
+            ]
+            if outcomes[0] != outcomes[1]:
+                changes.setdefault(group, {})[test_id] = {
+                    "baseline": outcomes[0],
+                    "result": outcomes[1],
+                }
+    return changes
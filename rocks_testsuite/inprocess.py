@@ -0,0 +1,148 @@
+"""Testing Python ActivityPub servers in the suite's process.
+
+With ``target-app`` set to an import path (``package.module:app``), the
+server under test is loaded into the suite's process and the tests' requests
+are passed to it as ASGI calls instead of going over the network. Requests
+for the suite's own URLs (the test actors) are passed to the suite app the
+same way, so a run doesn't open any sockets. WSGI apps are adapted to ASGI.
+"""
+
+import asyncio
+import importlib
+import inspect
+import logging
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Callable
+
+import httpx
+
+_logger = logging.getLogger("rocks.app")
+
+ASGIApp = Callable[..., Any]
+
+# (app under test, suite app) while serving
+_apps: tuple[ASGIApp, ASGIApp] | None = None
+
+
+def load_app(path: str) -> Any:
+    module_name, _, attribute = path.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Expected 'module:attribute', got {path!r}")
+    app = importlib.import_module(module_name)
+    for name in attribute.split("."):
+        app = getattr(app, name)
+    return app
+
+
+def as_asgi(app: Any, interface: str | None = None) -> ASGIApp:
+    """The app as an ASGI app. The interface is guessed if not given."""
+    if interface is None:
+        call = app if inspect.isroutine(app) else getattr(app, "__call__", app)
+        interface = "asgi" if inspect.iscoroutinefunction(call) else "wsgi"
+    if interface == "wsgi":
+        from starlette.middleware.wsgi import WSGIMiddleware
+
+        return WSGIMiddleware(app)
+    if interface != "asgi":
+        raise ValueError(f"Unknown app interface {interface!r}")
+    return app
+
+
+async def _next_message(sent: asyncio.Queue, task: asyncio.Task) -> dict | None:
+    """The app's next lifespan message, or None if it stopped instead."""
+    getter = asyncio.ensure_future(sent.get())
+    await asyncio.wait([getter, task], return_when=asyncio.FIRST_COMPLETED)
+    if getter.done():
+        return getter.result()
+    getter.cancel()
+    # Apps without lifespan support raise for the lifespan scope
+    with suppress(Exception):
+        task.result()
+    return None
+
+
+@asynccontextmanager
+async def _lifespan(app: ASGIApp) -> AsyncIterator[dict[str, Any]]:
+    """Run the app's startup and shutdown. Yields the lifespan state."""
+    received: asyncio.Queue[dict] = asyncio.Queue()
+    sent: asyncio.Queue[dict] = asyncio.Queue()
+    state: dict[str, Any] = {}
+    scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": state}
+    task = asyncio.create_task(app(scope, received.get, sent.put))
+    await received.put({"type": "lifespan.startup"})
+    message = await _next_message(sent, task)
+    if message is None:
+        yield state
+        return
+    if message["type"] == "lifespan.startup.failed":
+        raise RuntimeError(f"App startup failed: {message.get('message')}")
+    try:
+        yield state
+    finally:
+        await received.put({"type": "lifespan.shutdown"})
+        await _next_message(sent, task)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+def _with_state(app: ASGIApp, state: dict[str, Any]) -> ASGIApp:
+    # httpx doesn't pass the lifespan state to requests like servers do
+    async def app_with_state(scope, receive, send):
+        if scope["type"] in ["http", "websocket"]:
+            scope = {**scope, "state": dict(state)}
+        await app(scope, receive, send)
+
+    return app_with_state
+
+
+@asynccontextmanager
+async def serve(suite_app: ASGIApp, config: dict[str, Any]) -> AsyncIterator[None]:
+    """Load and start the configured app under test, if any, for the
+    lifetime of the suite app."""
+    global _apps
+    path = config.get("target-app")
+    if not path:
+        yield
+        return
+    target = as_asgi(load_app(path), config.get("target-app-interface"))
+    async with _lifespan(target) as state:
+        _apps = (_with_state(target, state), suite_app)
+        _logger.info("Testing %s in-process", path)
+        try:
+            yield
+        finally:
+            _apps = None
+
+
+class InProcessTransport(httpx.AsyncBaseTransport):
+    """Passes requests for the suite's host to the suite app and all
+    others to the app under test."""
+
+    def __init__(self, target: ASGIApp, suite: ASGIApp, suite_host: str):
+        # Errors in the apps become 500 responses, like over the network
+        self._target = httpx.ASGITransport(target, raise_app_exceptions=False)
+        self._suite = httpx.ASGITransport(suite, raise_app_exceptions=False)
+        self._suite_host = suite_host
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.netloc.decode("ascii") == self._suite_host:
+            return await self._suite.handle_async_request(request)
+        return await self._target.handle_async_request(request)
+
+
+def target_transport(suite_base_url: str) -> InProcessTransport | None:
+    """A transport to the app under test, if it's served in-process."""
+    if _apps is None:
+        return None
+    return InProcessTransport(*_apps, httpx.URL(suite_base_url).netloc.decode("ascii"))
+
+
+def suite_transport() -> httpx.AsyncBaseTransport:
+    """A transport for the app under test's own requests to the test actors.
+
+    Apps that make requests with httpx can use this in their test setup so
+    their deliveries to the suite don't go over the network either.
+    """
+    if _apps is None:
+        raise RuntimeError("No app is being tested in-process")
+    return httpx.ASGITransport(_apps[1], raise_app_exceptions=False)
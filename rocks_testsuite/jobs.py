@@ -0,0 +1,308 @@
+import asyncio
+import collections
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator
+
+import jinja2
+
+from rocks_testsuite.logs import log_context
+from rocks_testsuite.media import upload_media_size
+from rocks_testsuite.result import dumps
+from rocks_testsuite.selection import TestSelection
+from rocks_testsuite.test_session import TestSession, TestSessionManager
+
+_logger = logging.getLogger("rocks.jobs")
+
+TEST_TYPES = ["testing-client", "testing-c2s-server", "testing-s2s-server"]
+PROJECT_INFO_KEYS = ["project-name", "website", "repo"]
+# Spec keys that only answer the session's questions
+ANSWER_KEYS = ["answers", "project-info", "auth-token"]
+# Per-run settings a spec can make, like the setup form's. Everything else
+# (reports, rate limits, workers, files) only comes from the config file.
+RUN_CONFIG_KEYS = [
+    *TEST_TYPES,
+    "actor-id",
+    "select-tests",
+    "select-levels",
+    "rerun-report",
+    "record-http",
+    "replay-cassette",
+    "verbose-debugging",
+    "shared-inbox",
+    "capability-preflight",
+    "upload-media-size",
+    "s2s-benchmark",
+    "s2s-benchmark-actors",
+    "s2s-benchmark-concurrency",
+    "s2s-benchmark-timeout",
+    "pagination-probe",
+    "pagination-probe-collection",
+    "pagination-probe-size",
+    "pagination-probe-concurrency",
+    "pagination-probe-max-pages",
+    "fault-injection",
+    "fault-injection-scale",
+    "fault-injection-seed",
+    "fault-injection-baseline",
+]
+# Upper bounds on the per-run counts a spec can set, so one job can't make
+# the suite create unbounded actors, pages or connections
+RUN_CONFIG_LIMITS = {
+    "s2s-benchmark-actors": 1000,
+    "s2s-benchmark-concurrency": 100,
+    "pagination-probe-size": 100000,
+    "pagination-probe-concurrency": 100,
+    "pagination-probe-max-pages": 100000,
+}
+
+
+class JobError(Exception):
+    """A job needed input that its run spec didn't provide."""
+
+
+class Job:
+    def __init__(self, spec: dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.status = "queued"
+        self.error: str | None = None
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.events: list[dict[str, Any]] = []
+        self.session: "JobSession | None" = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ["complete", "failed"]
+
+    def publish(self, event: dict[str, Any]):
+        self.events.append(event)
+        # Wake current waiters and start a new generation for later ones
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_status(self, status: str, error: str | None = None):
+        self.status = status
+        self.error = error
+        self.publish({"type": "status", "status": status, "error": error})
+
+    async def follow(self, after: int = 0) -> AsyncIterator[dict[str, Any]]:
+        """Yield events after the given index until the job is done."""
+        while True:
+            while after < len(self.events):
+                yield self.events[after]
+                after += 1
+            if self.done:
+                return
+            await self._changed.wait()
+
+    def to_json(self, after: int = 0) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "session": self.session.id if self.session else None,
+            "event_count": len(self.events),
+            "events": self.events[after:],
+            "report": f"/jobs/{self.id}/report" if self.status == "complete" else None,
+            "results": (
+                f"/download-report/{self.session.id}.results.ndjson"
+                if self.session
+                else None
+            ),
+            "junit": (
+                f"/download-report/{self.session.id}.junit.xml"
+                if self.session
+                else None
+            ),
+        }
+
+
+class JobSession(TestSession):
+    """A test session that answers prompts from a job's run spec."""
+
+    def __init__(
+        self, job: Job, env: jinja2.Environment, config: dict[str, Any], base_url: str
+    ):
+        self.job = job
+        self._base_url = base_url
+        super().__init__(None, env, config)
+
+    def _describe_client(self) -> str:
+        return f"job={self.job.id}"
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url
+
+    async def send_json(self, payload: dict[str, Any]):
+        self.spectators.publish(dumps(payload))
+        self.job.publish(payload)
+
+    async def send_question(
+        self,
+        template_name: str,
+        context: dict[str, Any] | None = None,
+    ) -> dict[str, Any]:
+        answers = self._answer(template_name, context or {})
+        _logger.debug("Question: template=%s", template_name)
+        return answers
+
+    def _answer(self, template_name: str, context: dict[str, Any]) -> dict[str, Any]:
+        spec = self.job.spec
+        if template_name == "setup.jinja":
+            return {key: bool(spec.get(key)) for key in TEST_TYPES}
+        elif template_name == "get_actor_uri.jinja":
+            if context.get("actor_uri"):
+                raise JobError(f"Failed to retrieve actor {context['actor_uri']}")
+            return {"actor-id": spec["actor-id"]}
+        elif template_name == "get_auth_token.jinja":
+            return {"auth-token": spec.get("auth-token", "")}
+        elif template_name == "questions.jinja":
+            answers = spec.get("answers") or {}
+            return {
+                question["id"]: bool(answers.get(question["id"], False))
+                for question in context["questions"]
+            }
+        elif template_name == "s2s_benchmark_post.jinja":
+            raise JobError("The fan-out benchmark needs an 'auth-token' to post")
+        elif template_name == "project_info.jinja":
+            if context.get("message"):
+                raise JobError("Incomplete project information")
+            return dict(spec["project-info"])
+        return {}
+
+
+def validate_spec(spec: Any) -> dict[str, Any]:
+    if not isinstance(spec, dict):
+        raise ValueError("Run spec must be a JSON object")
+    unknown = spec.keys() - {*RUN_CONFIG_KEYS, *ANSWER_KEYS}
+    if unknown:
+        raise ValueError(f"Unknown run spec keys: {', '.join(sorted(unknown))}")
+    if not any(spec.get(key) for key in TEST_TYPES):
+        raise ValueError(f"Select at least one of: {', '.join(TEST_TYPES)}")
+    if spec.get("testing-c2s-server") and not spec.get("actor-id"):
+        raise ValueError("C2S server tests require 'actor-id'")
+    if spec.get("s2s-benchmark") and not spec.get("actor-id"):
+        raise ValueError("The fan-out benchmark requires 'actor-id'")
+    if spec.get("s2s-benchmark") and not spec.get("testing-s2s-server"):
+        raise ValueError("The fan-out benchmark requires 'testing-s2s-server'")
+    if spec.get("pagination-probe") and not spec.get("testing-c2s-server"):
+        raise ValueError("The pagination probe requires 'testing-c2s-server'")
+    for key, limit in RUN_CONFIG_LIMITS.items():
+        value = spec.get(key)
+        if value is not None and (
+            isinstance(value, bool)
+            or not isinstance(value, int)
+            or not 0 < value <= limit
+        ):
+            raise ValueError(f"'{key}' must be a whole number from 1 to {limit}")
+    TestSelection.from_config(spec, {})
+    if "upload-media-size" in spec:
+        upload_media_size(spec["upload-media-size"])
+    if spec.get("fault-injection"):
+        from rocks_testsuite.faults import parse_rules
+
+        parse_rules(spec)
+    answers = spec.get("answers", {})
+    if not isinstance(answers, dict):
+        raise ValueError("'answers' must map question ids to booleans")
+    project_info = spec.get("project-info")
+    if not isinstance(project_info, dict) or not all(
+        project_info.get(key) for key in PROJECT_INFO_KEYS
+    ):
+        raise ValueError(f"'project-info' must include {', '.join(PROJECT_INFO_KEYS)}")
+    return spec
+
+
+def run_config(config: dict[str, Any], spec: dict[str, Any]) -> dict[str, Any]:
+    """The config file settings with the spec's per-run settings applied."""
+    return {
+        **config,
+        **{key: value for key, value in spec.items() if key in RUN_CONFIG_KEYS},
+    }
+
+
+class JobManager:
+    """Runs submitted test jobs from a bounded queue with a fixed worker pool."""
+
+    def __init__(
+        self,
+        session_manager: TestSessionManager,
+        env: jinja2.Environment,
+        config: dict[str, Any],
+    ):
+        self._session_manager = session_manager
+        self._templates = env
+        self._config = config
+        self._worker_count = int(config.get("job-workers", 2))
+        self._retained = int(config.get("job-retention-count", 1000))
+        self._queue: asyncio.Queue[tuple[Job, str]] = asyncio.Queue(
+            int(config.get("job-queue-size", 100))
+        )
+        self._workers: list[asyncio.Task] = []
+        self.jobs: collections.OrderedDict[str, Job] = collections.OrderedDict()
+
+    def start(self):
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"job-worker-{i}")
+            for i in range(self._worker_count)
+        ]
+        _logger.info("Job workers started: count=%d", self._worker_count)
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, spec: Any, base_url: str) -> Job:
+        """Queue a run. Raises ValueError or asyncio.QueueFull."""
+        job = Job(validate_spec(spec))
+        self._queue.put_nowait((job, base_url))
+        self.jobs[job.id] = job
+        self._prune()
+        _logger.info(
+            "Job queued: queued=%d", self._queue.qsize(), extra={"job": job.id}
+        )
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[: max(0, len(self.jobs) - self._retained)]:
+            del self.jobs[job_id]
+
+    async def _work(self):
+        while True:
+            job, base_url = await self._queue.get()
+            try:
+                await self._run(job, base_url)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, base_url: str):
+        config = run_config(self._config, job.spec)
+        session = JobSession(job, self._templates, config, base_url)
+        job.session = session
+        job.started = time.time()
+        job.set_status("running")
+        self._session_manager.sessions[session.id] = session
+        try:
+            with log_context(job=job.id):
+                await session.run()
+            job.finished = time.time()
+            job.set_status("complete")
+        except Exception as ex:
+            _logger.error("Job failed", exc_info=True, extra={"job": job.id})
+            job.finished = time.time()
+            job.set_status("failed", str(ex))
+        finally:
+            del self._session_manager.sessions[session.id]
+            await session.close()
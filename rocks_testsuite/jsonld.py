@@ -0,0 +1,265 @@
+"""JSON-LD normalization for comparing ActivityStreams documents.
+
+Servers may return compacted documents with extra prefixes (``as:Public``),
+or fully expanded ones, which are equivalent to the plain JSON the tests
+post. The helpers here expand documents enough to compare them: terms,
+compact IRIs and node references are resolved and single values, lists and
+``@id`` objects are treated alike.
+
+Remote contexts are never fetched. The ActivityStreams and security contexts
+are bundled (``data/jsonld_contexts.json``) and other remote contexts are
+ignored, so the ActivityStreams context is also the fallback for documents
+without one. Processed contexts are memoized, so normalizing a document
+only costs a walk over it. Expanded documents are memoized too, so looking
+up several properties of a document expands it once.
+"""
+
+import json
+import os
+from functools import lru_cache
+from typing import Any, Iterable
+
+AS = "https://www.w3.org/ns/activitystreams"
+AS_PUBLIC = AS + "#Public"
+# Larger documents (like big collection pages) are expanded on every lookup
+MAX_MEMOIZED_JSON = 65536
+# Ways of writing the Public collection id in compacted documents
+_PUBLIC_ALIASES = {"Public", "as:Public", AS_PUBLIC}
+
+
+class _Term:
+    __slots__ = ("iri", "is_id", "container")
+
+    def __init__(self, iri: str, is_id: bool = False, container: str | None = None):
+        self.iri = iri
+        self.is_id = is_id
+        self.container = container
+
+
+# Active context: term (or prefix) -> definition. Processed contexts are
+# cached and never changed, so they can be used as cache keys by identity.
+Context = dict[str, _Term]
+
+
+class _ActiveContext:
+    __slots__ = ("terms",)
+
+    def __init__(self, terms: Context):
+        self.terms = terms
+
+
+def _context_url(url: str) -> str:
+    url = url.strip().rstrip("#").removesuffix(".jsonld")
+    if url.startswith("http://"):
+        url = "https://" + url[len("http://") :]
+    if url == "https://w3id.org/security/v2":
+        # Only the v1 terms are bundled, which v2 includes
+        url = "https://w3id.org/security/v1"
+    return url
+
+
+@lru_cache
+def _bundled_contexts() -> dict[str, Any]:
+    filepath = os.path.join(os.path.dirname(__file__), "data", "jsonld_contexts.json")
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def _expand_iri(context: Context, value: str, vocab: bool) -> str:
+    if vocab and value in context:
+        return context[value].iri
+    prefix, sep, suffix = value.partition(":")
+    if sep and not suffix.startswith("//") and prefix in context:
+        return context[prefix].iri + suffix
+    return value
+
+
+def _define(context: Context, definitions: dict[str, Any]):
+    for term, definition in definitions.items():
+        if term.startswith("@"):
+            continue
+        if definition is None:
+            context.pop(term, None)
+        elif isinstance(definition, str):
+            context[term] = _Term(_expand_iri(context, definition, True))
+        elif isinstance(definition, dict):
+            iri = definition.get("@id", term)
+            context[term] = _Term(
+                _expand_iri(context, iri, True),
+                definition.get("@type") == "@id",
+                definition.get("@container"),
+            )
+
+
+@lru_cache(maxsize=256)
+def _process_context(parent: _ActiveContext | None, local: str) -> _ActiveContext:
+    """Apply a local context (as JSON) to a parent context."""
+    context = dict(parent.terms) if parent else {}
+    local_context = json.loads(local)
+    for entry in _as_list(local_context):
+        if entry is None:
+            context = dict(_base_context().terms)
+        elif isinstance(entry, str):
+            bundled = _bundled_contexts().get(_context_url(entry))
+            if bundled:
+                _define(context, bundled["@context"])
+        elif isinstance(entry, dict):
+            _define(context, entry)
+    return _ActiveContext(context)
+
+
+@lru_cache
+def _base_context() -> _ActiveContext:
+    return _process_context(None, json.dumps(AS))
+
+
+def _extend(context: _ActiveContext, local: Any) -> _ActiveContext:
+    return _process_context(context, json.dumps(local, sort_keys=True))
+
+
+def expand(
+    document: dict[str, Any] | list, _context: _ActiveContext | None = None
+) -> dict[str, Any]:
+    """Expand a document to ``{property IRI: [values]}``.
+
+    Node references become ``{"@id": iri}``, embedded nodes are expanded
+    recursively and ``@type`` is a list of IRIs. Ordering is kept, but only
+    ``@list`` containers (like ``orderedItems``) are meaningfully ordered.
+    """
+    if isinstance(document, list):
+        # Expanded documents are arrays of nodes
+        document = document[0] if document else {}
+    active_context = _context or _base_context()
+    if "@context" in document:
+        active_context = _extend(active_context, document["@context"])
+    context = active_context.terms
+    node: dict[str, Any] = {}
+    for key, value in document.items():
+        if key == "@context" or value is None:
+            continue
+        iri = _expand_iri(context, key, True)
+        if iri == "@id":
+            node["@id"] = _expand_iri(context, value, False)
+        elif iri == "@type":
+            node["@type"] = [_expand_iri(context, t, True) for t in _as_list(value)]
+        elif iri.startswith("@"):
+            node[iri] = value
+        else:
+            term = context.get(key)
+            expanded = node.setdefault(iri, [])
+            expanded.extend(_expand_values(active_context, term, value))
+    return node
+
+
+@lru_cache(maxsize=256)
+def _expand_json(text: str) -> dict[str, Any]:
+    return expand(json.loads(text))
+
+
+def _expanded(document: dict[str, Any] | list) -> dict[str, Any]:
+    """The memoized expansion of a document. It's shared, so don't change it."""
+    # Keyed by content, since the tests change documents they have looked at
+    text = json.dumps(document)
+    if len(text) > MAX_MEMOIZED_JSON:
+        return expand(document)
+    return _expand_json(text)
+
+
+def _expand_values(
+    active_context: _ActiveContext, term: _Term | None, value: Any
+) -> list:
+    if term is not None and term.container == "@language" and isinstance(value, dict):
+        return [
+            {"@value": text, "@language": language}
+            for language, text in value.items()
+            if text is not None
+        ]
+    if isinstance(value, dict) and "@list" in value:
+        value = value["@list"]
+    context = active_context.terms
+    values = []
+    for item in _as_list(value):
+        if item is None:
+            continue
+        if isinstance(item, dict):
+            if "@value" in item:
+                values.append(item)
+            elif set(item) <= {"@id", "id"}:
+                values.append({"@id": _expand_iri(context, _node_id(item), False)})
+            else:
+                values.append(expand(item, active_context))
+        elif isinstance(item, str) and term is not None and term.is_id:
+            values.append({"@id": _expand_iri(context, item, False)})
+        else:
+            values.append({"@value": item})
+    return values
+
+
+def _node_id(item: dict[str, Any]) -> str:
+    return item.get("@id") or item.get("id")
+
+
+def _as_list(value: Any) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def _term_iri(term: str) -> str:
+    return _expand_iri(_base_context().terms, term, True)
+
+
+def _normalize_id(iri: str) -> str:
+    return AS_PUBLIC if iri in _PUBLIC_ALIASES else iri
+
+
+def values(document: dict[str, Any], term: str) -> list:
+    """Expanded values of an ActivityStreams property."""
+    return _expanded(document).get(_term_iri(term), [])
+
+
+def has(document: dict[str, Any], term: str) -> bool:
+    return bool(values(document, term))
+
+
+def id_list(document: dict[str, Any], term: str) -> list[str]:
+    """Ids of a property's values (references or nodes) in document order.
+
+    Plain strings are taken as ids too, since some documents use terms the
+    bundled contexts don't type as ``@id``.
+    """
+    result = {}
+    for value in values(document, term):
+        if "@id" in value:
+            result[_normalize_id(value["@id"])] = None
+        elif isinstance(value.get("@value"), str):
+            result[_normalize_id(value["@value"])] = None
+    return list(result)
+
+
+def ids(document: dict[str, Any], term: str) -> list[str]:
+    """Sorted, distinct ids of a property's values, for comparing as sets."""
+    return sorted(id_list(document, term))
+
+
+def id_of(obj: dict[str, Any] | list | str | None) -> str | None:
+    """The id of a node, or of a reference given as a string."""
+    if isinstance(obj, (dict, list)):
+        node_id = _expanded(obj).get("@id")
+        return _normalize_id(node_id) if node_id else None
+    return _normalize_id(obj) if obj else None
+
+
+def literal(document: dict[str, Any], term: str) -> Any:
+    """The first literal value of a property, or None."""
+    for value in values(document, term):
+        if "@value" in value:
+            return value["@value"]
+    return None
+
+
+def has_type(document: dict[str, Any], type_term: str) -> bool:
+    return _term_iri(type_term) in _expanded(document).get("@type", [])
+
+
+def same_ids(a: Iterable[str], b: Iterable[str]) -> bool:
+    """Whether two collections of ids are equal as sets."""
+    return {_normalize_id(i) for i in a} == {_normalize_id(i) for i in b}
@@ -0,0 +1,247 @@
+import atexit
+import copy
+import enum
+import json
+import logging
+import logging.handlers
+import numbers
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+TEXT_FORMAT = "%(asctime)s,%(msecs)03d %(levelname)s [%(name)s] %(message)s"
+TEXT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Values of these LogRecord attributes are only written if they are set
+CONTEXT_FIELDS = ["session", "test", "job"]
+
+_context: ContextVar[dict[str, Any]] = ContextVar("log_context", default={})
+_listener: logging.handlers.QueueListener | None = None
+
+
+@contextmanager
+def log_context(**fields: Any):
+    """Add fields (e.g. session and test ids) to records logged in this context."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the current log context onto the record.
+
+    Runs in the caller, since context variables aren't visible to the writer
+    thread.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, value in _context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Per-logger sampling and rate limits, configured as::
+
+        {"rocks.session": {"sample": 0.1, "per-second": 20}}
+
+    ``sample`` is the fraction of records kept and ``per-second`` caps the
+    rate (with a burst of the same size). Warnings and errors always pass.
+    """
+
+    def __init__(self, limits: dict[str, dict[str, float]] | None = None):
+        super().__init__()
+        self._limits = limits or {}
+        self._buckets: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _limit(self, name: str) -> tuple[str, dict[str, float]] | None:
+        """The configured logger name that covers this one, and its limits."""
+        while True:
+            if name in self._limits:
+                return name, self._limits[name]
+            if "." not in name:
+                return None
+            name = name.rpartition(".")[0]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self._limits:
+            return True
+        match = self._limit(record.name)
+        if match is None:
+            return True
+        # Child loggers share the budget of the name that was configured
+        prefix, limit = match
+        sample = limit.get("sample")
+        if sample is not None and random.random() >= sample:
+            self.dropped += 1
+            return False
+        rate = limit.get("per-second")
+        if rate:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(prefix, (rate, now))
+                tokens = min(rate, tokens + (now - last) * rate)
+                if tokens < 1:
+                    self._buckets[prefix] = [tokens, now]
+                    self.dropped += 1
+                    return False
+                self._buckets[prefix] = [tokens - 1, now]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with context fields as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _text_formatter(stream) -> logging.Formatter:
+    if not stream.isatty():
+        return logging.Formatter(TEXT_FORMAT, TEXT_DATE_FORMAT)
+    # Imported here since it's only needed for terminal output
+    import coloredlogs
+
+    return coloredlogs.ColoredFormatter(TEXT_FORMAT, TEXT_DATE_FORMAT)
+
+
+def setup_logging(
+    level: int | str,
+    fmt: str = "text",
+    limits: dict[str, dict[str, float]] | None = None,
+):
+    """Route all logging through a queue to a background writer thread.
+
+    Records are filtered (level, sampling, rate limits) in the caller, so the
+    arguments of dropped records are never formatted. Formatting the message
+    and the output line and writing it happen on the writer thread, so
+    logging from the event loop never waits on the terminal.
+    """
+    global _listener
+    stop_logging()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        JsonFormatter() if fmt == "json" else _text_formatter(stream_handler.stream)
+    )
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(limits))
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.root
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(logging.getLevelName(level) if isinstance(level, str) else level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# A %-style conversion in a log message, capturing its type character
+_CONVERSION = re.compile(
+    r"%(?:\([^)]*\))?[#0+ -]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?(.)"
+)
+# Containers that a shallow copy snapshots cheaply
+_COPYABLE = (dict, list, set, bytearray)
+
+
+class _FrozenArg:
+    """The text of a log argument that may change before it's formatted.
+
+    Only the conversions the message uses are made.
+    """
+
+    __slots__ = ("text", "representation")
+
+    def __init__(self, value: Any, text: bool, representation: bool):
+        self.text = str(value) if text else None
+        self.representation = repr(value) if representation else None
+
+    def __str__(self) -> str:
+        return self.text if self.text is not None else str(self.representation)
+
+    def __repr__(self) -> str:
+        return self.representation if self.representation is not None else self.text
+
+
+def _shareable(value: Any) -> bool:
+    if isinstance(value, (str, bytes, numbers.Number, enum.Enum)) or value is None:
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return all(_shareable(item) for item in value)
+    return False
+
+
+def _snapshot(value: Any, conversions: set[str]) -> Any:
+    if _shareable(value):
+        return value
+    if type(value) in _COPYABLE:
+        # Formatted by the writer thread. Nested values are shared, but
+        # copying the top level is much cheaper than formatting it here.
+        return copy.copy(value)
+    return _FrozenArg(
+        value,
+        text=bool(conversions - {"r", "a"}),
+        representation=bool(conversions & {"r", "a"}),
+    )
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats the whole record (including the traceback)
+        # here. The message is formatted by the writer thread instead, so
+        # arguments the caller could still change are only snapshotted.
+        record = logging.makeLogRecord(record.__dict__)
+        if not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        conversions = set(_CONVERSION.findall(record.msg)) - {"%"}
+        if isinstance(record.args, tuple):
+            record.args = tuple(_snapshot(arg, conversions) for arg in record.args)
+        elif record.args:
+            # A single mapping argument, for %(name)s formats
+            record.args = {
+                key: _snapshot(arg, conversions) for key, arg in record.args.items()
+            }
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+atexit.register(stop_logging)
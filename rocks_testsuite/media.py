@@ -0,0 +1,158 @@
+import json
+import mmap
+import os
+import tempfile
+import uuid
+from typing import Any, AsyncIterator, Iterator
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_UPLOAD_MEDIA_SIZE = 4 * 1024 * 1024
+# Largest generated upload, so runs can't fill the disk
+MAX_UPLOAD_MEDIA_SIZE = 64 * 1024 * 1024
+
+# A file to upload instead of generated data. It's sent to the server under
+# test, so it's only taken from the server's config file, never from a
+# session or job.
+_upload_media_file: str | None = None
+
+
+def configure(config: dict[str, Any]):
+    global _upload_media_file
+    _upload_media_file = config.get("upload-media-file")
+
+
+def upload_media_file() -> str | None:
+    return _upload_media_file
+
+
+def upload_media_size(value: Any = None) -> int:
+    """The size of the generated upload. Raises ValueError if it's invalid or
+    over the limit."""
+    if value is None:
+        return DEFAULT_UPLOAD_MEDIA_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("'upload-media-size' must be a number of bytes")
+    if not 0 <= size <= MAX_UPLOAD_MEDIA_SIZE:
+        raise ValueError(
+            f"'upload-media-size' must be between 0 and {MAX_UPLOAD_MEDIA_SIZE} bytes"
+        )
+    return size
+
+
+class MappedPayload:
+    """A read-only memory map of a media file used as an upload payload.
+
+    If no path is given, a temporary file of the requested size is generated
+    in chunks and removed when the payload is closed. Either way, the payload
+    bytes are paged in by the OS as they're sent instead of being held in memory.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        size: int = 1024 * 1024,
+        media_type: str = "application/octet-stream",
+    ):
+        self.media_type = media_type
+        self._temporary = path is None
+        if path is None:
+            upload_media_size(size)
+            fd, path = tempfile.mkstemp(prefix="rocks-media-")
+            with os.fdopen(fd, "wb") as fp:
+                pattern = os.urandom(CHUNK_SIZE)
+                remaining = size
+                while remaining > 0:
+                    fp.write(pattern[: min(remaining, CHUNK_SIZE)])
+                    remaining -= CHUNK_SIZE
+        self.path = path
+        self.filename = os.path.basename(path)
+        self._fp = open(path, "rb")
+        self.size = os.fstat(self._fp.fileno()).st_size
+        self._map = (
+            mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.size
+            else None
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._fp.close()
+        if self._temporary:
+            os.unlink(self.path)
+
+    def chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[memoryview]:
+        if self._map is None:
+            return
+        view = memoryview(self._map)
+        try:
+            for offset in range(0, self.size, chunk_size):
+                yield view[offset : offset + chunk_size]
+        finally:
+            view.release()
+
+
+class MultipartUpload:
+    """A streamed ``multipart/form-data`` body with ``file`` and ``object`` parts."""
+
+    def __init__(self, payload: MappedPayload, obj: dict[str, Any]):
+        self.payload = payload
+        self.boundary = uuid.uuid4().hex
+        object_part = json.dumps(obj).encode("utf-8")
+        self._head = (
+            f"--{self.boundary}\r\n"
+            'Content-Disposition: form-data; name="object"\r\n'
+            "Content-Type: application/activity+json\r\n\r\n"
+        ).encode("utf-8")
+        self._head += object_part + (
+            f"\r\n--{self.boundary}\r\n"
+            'Content-Disposition: form-data; name="file"; '
+            f'filename="{payload.filename}"\r\n'
+            f"Content-Type: {payload.media_type}\r\n\r\n"
+        ).encode("utf-8")
+        self._tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.bytes_sent = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def content_length(self) -> int:
+        return len(self._head) + self.payload.size + len(self._tail)
+
+    def _parts(self) -> Iterator[bytes | memoryview]:
+        yield self._head
+        yield from self.payload.chunks()
+        yield self._tail
+
+    def digest(self) -> str:
+        from rocks_testsuite.signatures import digest_header
+
+        return digest_header(self._parts())
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {
+            "Content-Type": self.content_type,
+            "Content-Length": str(self.content_length),
+            "Digest": self.digest(),
+        }
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        self.bytes_sent = 0
+        for part in self._parts():
+            # The transport needs bytes; copying one chunk at a time keeps
+            # the resident size bounded by the chunk size.
+            chunk = bytes(part)
+            self.bytes_sent += len(chunk)
+            yield chunk
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import statistics
+import time
+import uuid
+from typing import Any
+
+from rocks_testsuite import jsonld
+from rocks_testsuite.c2s_tests import APClient
+from rocks_testsuite.s2s_tests import _distribution
+
+_logger = logging.getLogger("rocks.session")
+
+DEFAULT_PROBE_COLLECTION = "outbox"
+DEFAULT_PROBE_SIZE = 1000
+DEFAULT_PROBE_CONCURRENCY = 10
+DEFAULT_PROBE_MAX_PAGES = 10000
+# Collections that can be filled by posting to the outbox
+SEEDABLE_COLLECTIONS = ["outbox", "liked"]
+# Points in the latency by offset curve saved in the report
+CURVE_POINTS = 50
+# Last/first quarter page latency ratio reported as growing with depth
+DEPTH_GROWTH_RATIO = 1.5
+
+
+class PaginationProbe:
+    """Measures how the server under test pages through a large collection.
+
+    The collection (``outbox`` or ``liked`` of the C2S actor) is seeded to
+    the target size through the outbox, then walked with ``first``/``next``.
+    Page latencies by offset show whether the server's paging slows down
+    with depth, as offset-based pagination does. Other collections, like
+    ``followers``, are walked as they are.
+    """
+
+    def __init__(self, session, client: APClient):
+        self._session = session
+        self._client = client
+        config = session.config
+        self.collection = config.get(
+            "pagination-probe-collection", DEFAULT_PROBE_COLLECTION
+        )
+        self.size = int(config.get("pagination-probe-size", DEFAULT_PROBE_SIZE))
+        self.max_pages = int(
+            config.get("pagination-probe-max-pages", DEFAULT_PROBE_MAX_PAGES)
+        )
+        self._semaphore = asyncio.Semaphore(
+            int(config.get("pagination-probe-concurrency", DEFAULT_PROBE_CONCURRENCY))
+        )
+        self._seeded = 0
+        self._seed_failures = 0
+
+    async def run(self):
+        session = self._session
+        collection_uri = self._client.profile.get(self.collection)
+        if not isinstance(collection_uri, str):
+            await session.send_notice_str(
+                f"Skipping the pagination probe: the actor has no "
+                f"{self.collection} collection."
+            )
+            return
+        collection = await self._client.get_json(collection_uri)
+        started = time.monotonic()
+        await self._seed(jsonld.literal(collection, "totalItems") or 0)
+        seed_seconds = time.monotonic() - started
+        await session.send_notice_str(f"Pagination probe: walking {collection_uri}...")
+        pages, truncated = await self._walk(collection_uri)
+        metrics = _metrics(pages)
+        metrics.update(
+            {
+                "collection": self.collection,
+                "uri": collection_uri,
+                "target-size": self.size,
+                "seeded": self._seeded,
+                "seed-failures": self._seed_failures,
+                "seed-seconds": seed_seconds,
+                "truncated": truncated,
+            }
+        )
+        session.metrics["pagination-probe"] = metrics
+        await session.send_notice_str(_metrics_table(metrics))
+
+    async def _seed(self, current_size: int):
+        count = self.size - current_size
+        if count <= 0:
+            return
+        if self.collection not in SEEDABLE_COLLECTIONS:
+            await self._session.send_notice_str(
+                f"The {self.collection} collection can't be filled through the "
+                f"outbox. Probing its {current_size} current items."
+            )
+            return
+        await self._session.send_notice_str(
+            f"Pagination probe: adding {count} items to the {self.collection} "
+            f"collection ({current_size} now)..."
+        )
+        progress_step = max(count // 10, 1)
+
+        async def seed_item(index: int):
+            async with self._semaphore:
+                try:
+                    await self._seed_item(index)
+                    self._seeded += 1
+                except Exception as ex:
+                    self._seed_failures += 1
+                    _logger.warning("Pagination probe seeding failed: %s", ex)
+            done = self._seeded + self._seed_failures
+            if done % progress_step == 0 and done < count:
+                await self._session.send_notice_str(f"Seeded {done}/{count} items")
+
+        await asyncio.gather(*(seed_item(i) for i in range(count)))
+
+    async def _seed_item(self, index: int):
+        # Not addressed to anyone, so followers aren't flooded
+        response = await self._client.post_to_outbox(
+            {
+                "type": "Create",
+                "object": {
+                    "type": "Note",
+                    "content": f"Pagination probe {index} {uuid.uuid4()}",
+                },
+            }
+        )
+        if self.collection == "liked":
+            await self._client.post_to_outbox(
+                {"type": "Like", "object": response.headers["Location"]}
+            )
+
+    async def _walk(self, collection_uri: str) -> tuple[list[tuple], bool]:
+        """Fetch the collection's pages in order.
+
+        Returns (offset, item count, seconds) for each page, and whether the
+        walk stopped at the page limit.
+        """
+        started = time.monotonic()
+        collection = await self._client.get_json(collection_uri)
+        items = len(jsonld.id_list(collection, "items"))
+        pages = [(0, items, time.monotonic() - started)]
+        offset = items
+        page_uris = jsonld.id_list(collection, "first")
+        seen = set()
+        while page_uris and page_uris[0] not in seen:
+            if len(pages) > self.max_pages:
+                return pages, True
+            page_uri = page_uris[0]
+            seen.add(page_uri)
+            started = time.monotonic()
+            page = await self._client.get_json(page_uri)
+            items = len(jsonld.id_list(page, "items"))
+            pages.append((offset, items, time.monotonic() - started))
+            offset += items
+            page_uris = jsonld.id_list(page, "next")
+        return pages, False
+
+
+def _metrics(pages: list[tuple]) -> dict[str, Any]:
+    # The first entry is the collection itself, the rest are its pages
+    latencies = [seconds for _, _, seconds in pages[1:]] or [pages[0][2]]
+    page_sizes = [items for _, items, _ in pages[1:]]
+    metrics = {
+        "items": sum(items for _, items, _ in pages),
+        "pages": len(pages) - 1,
+        "traversal-seconds": sum(seconds for _, _, seconds in pages),
+        "page-size": _distribution(sorted(page_sizes)),
+        "page-seconds": _distribution(sorted(latencies)),
+        "depth-ratio": None,
+        "seconds-per-1000-items": None,
+        "latency-grows-with-depth": None,
+        "curve": _curve(pages[1:]),
+    }
+    if len(latencies) >= 8:
+        quarter = len(latencies) // 4
+        first = statistics.fmean(latencies[:quarter])
+        last = statistics.fmean(latencies[-quarter:])
+        metrics["depth-ratio"] = last / first if first else None
+        offsets = [offset for offset, _, _ in pages[1:]]
+        if len(set(offsets)) > 1:
+            slope = statistics.linear_regression(offsets, latencies).slope
+            metrics["seconds-per-1000-items"] = slope * 1000
+        metrics["latency-grows-with-depth"] = bool(
+            metrics["depth-ratio"] and metrics["depth-ratio"] >= DEPTH_GROWTH_RATIO
+        )
+    return metrics
+
+
+def _curve(pages: list[tuple]) -> list[dict[str, float]]:
+    """Mean page latency by offset, in at most CURVE_POINTS buckets."""
+    bucket_size = max(1, -(-len(pages) // CURVE_POINTS))
+    curve = []
+    for start in range(0, len(pages), bucket_size):
+        bucket = pages[start : start + bucket_size]
+        curve.append(
+            {
+                "offset": bucket[0][0],
+                "pages": len(bucket),
+                "seconds": statistics.fmean(seconds for _, _, seconds in bucket),
+            }
+        )
+    return curve
+
+
+def _metrics_table(metrics: dict[str, Any]) -> str:
+    rows = [
+        ("Collection", metrics["uri"]),
+        ("Items", metrics["items"]),
+        ("Pages", metrics["pages"]),
+        ("Seeded", f"{metrics['seeded']} ({metrics['seed-failures']} failed)"),
+        ("Traversal", f"{metrics['traversal-seconds']:.3f}s"),
+    ]
+    if metrics["page-seconds"]:
+        rows.extend(
+            (f"Page latency {name}", f"{seconds:.3f}s")
+            for name, seconds in metrics["page-seconds"].items()
+        )
+    if metrics["depth-ratio"] is not None:
+        rows.append(("Last/first quarter latency", f"{metrics['depth-ratio']:.2f}"))
+    if metrics["latency-grows-with-depth"]:
+        rows.append(("Latency grows with depth", "yes (offset-based paging?)"))
+    if metrics["truncated"]:
+        rows.append(("Stopped at page limit", "yes"))
+    cells = "".join(f"<tr><td>{name}</td><td>{value}</td></tr>" for name, value in rows)
+    return f"<h3>Pagination probe</h3><table>{cells}</table>"
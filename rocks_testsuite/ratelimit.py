@@ -0,0 +1,216 @@
+import asyncio
+import email.utils
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Iterator
+
+import httpx
+
+_logger = logging.getLogger("rocks.ratelimit")
+
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+DEFAULT_MAX_RETRIES = 5
+MIN_RATE = 0.1
+# Longest Retry-After that is waited for instead of returning the 429, and
+# the longest a host's requests are paused
+MAX_RETRY_AFTER = 120.0
+
+
+class ThrottleStats:
+    __slots__ = ("seconds", "responses_429")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.responses_429 = 0
+
+
+_stats: ContextVar[ThrottleStats | None] = ContextVar("rocks_throttle", default=None)
+
+
+@contextmanager
+def throttle_stats() -> Iterator[ThrottleStats]:
+    """Collect the time requests made in this context waited for rate limits."""
+    stats = ThrottleStats()
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+class HostLimiter:
+    """Token bucket for one host that adapts to the host's rate limiting.
+
+    The rate is halved on each 429 and creeps back up with successful
+    responses (up to the configured rate). ``Retry-After`` and
+    ``RateLimit-*``/``X-RateLimit-*`` headers pause or pace the requests.
+    Waiting requests are served in order.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Wait for a request slot. Returns the seconds waited."""
+        started = time.monotonic()
+        async with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                self._refill(time.monotonic())
+            self._tokens -= 1
+        return time.monotonic() - started
+
+    def _block(self, now: float, delay: float):
+        # Capped, so a huge delay (which the transport returns to the caller
+        # rather than waiting for) doesn't stall the host's requests
+        delay = min(delay, MAX_RETRY_AFTER)
+        self._blocked_until = max(self._blocked_until, now + delay)
+
+    def update(self, response: httpx.Response):
+        now = time.monotonic()
+        if response.status_code == 429:
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self._tokens = 0
+            retry_after = _retry_after(response.headers)
+            self._block(now, retry_after or 1 / self.rate)
+            return
+        self.rate = min(self.max_rate, self.rate + 0.5)
+        remaining, reset = _rate_limit_headers(response.headers)
+        if remaining is None or reset is None:
+            return
+        if remaining < 1:
+            self._block(now, reset)
+        elif reset > 0:
+            # Spread the remaining requests over the window
+            self.rate = max(MIN_RATE, min(self.rate, remaining / reset))
+
+
+def _parse_delay(value: str) -> float | None:
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        # Epoch timestamps are used by some servers for X-RateLimit-Reset
+        return seconds - time.time() if seconds > 1e9 else seconds
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return (when - datetime.now(timezone.utc)).total_seconds()
+
+
+def _retry_after(headers: httpx.Headers) -> float | None:
+    for name in ["retry-after", "ratelimit-reset", "x-ratelimit-reset"]:
+        if name in headers:
+            delay = _parse_delay(headers[name])
+            if delay is not None:
+                return max(0.0, delay)
+    return None
+
+
+def _rate_limit_headers(headers: httpx.Headers) -> tuple[float | None, float | None]:
+    for prefix in ["ratelimit-", "x-ratelimit-"]:
+        if prefix + "remaining" in headers and prefix + "reset" in headers:
+            try:
+                remaining = float(headers[prefix + "remaining"])
+            except ValueError:
+                continue
+            reset = _parse_delay(headers[prefix + "reset"])
+            return remaining, max(0.0, reset) if reset is not None else None
+    return None, None
+
+
+class RateLimiters:
+    """Limiters for all target hosts, shared by the sessions in the process."""
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._hosts: dict[str, HostLimiter] = {}
+
+    def get(self, host: str) -> HostLimiter:
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = HostLimiter(self.rate, self.burst)
+        return limiter
+
+
+_limiters = RateLimiters()
+
+
+def configure(config: dict[str, Any]) -> RateLimiters:
+    global _limiters
+    _limiters = RateLimiters(
+        float(config.get("rate-limit-per-second", DEFAULT_RATE)),
+        int(config.get("rate-limit-burst", DEFAULT_BURST)),
+        int(config.get("rate-limit-max-retries", DEFAULT_MAX_RETRIES)),
+    )
+    return _limiters
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Paces requests per host and retries the ones answered with 429."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = _limiters.get(request.url.netloc.decode("ascii"))
+        stats = _stats.get()
+        # Streamed bodies (like media uploads) can't be sent again
+        retries = (
+            _limiters.max_retries if isinstance(request.stream, httpx.ByteStream) else 0
+        )
+        while True:
+            waited = await limiter.acquire()
+            if stats is not None:
+                stats.seconds += waited
+            response = await self._transport.handle_async_request(request)
+            limiter.update(response)
+            if response.status_code != 429:
+                return response
+            if stats is not None:
+                stats.responses_429 += 1
+            retry_after = _retry_after(response.headers)
+            if retries <= 0 or (retry_after or 0) > MAX_RETRY_AFTER:
+                return response
+            retries -= 1
+            _logger.info(
+                "Rate limited by %s, retrying in %.1fs",
+                request.url.host,
+                retry_after or 1 / limiter.rate,
+            )
+            await response.aclose()
+
+    async def aclose(self):
+        await self._transport.aclose()
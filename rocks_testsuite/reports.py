@@ -0,0 +1,125 @@
+import logging
+import os
+import re
+import time
+from typing import Any
+
+_logger = logging.getLogger("rocks.reports")
+
+REPORT_ID = re.compile(r"[0-9a-f]{32}")
+REPORT_SUFFIXES = [".json", ".cassette.json.gz", ".results.ndjson"]
+# Where reports were saved before they moved out of the package. Still
+# searched so links to them keep working.
+LEGACY_REPORT_DIR = os.path.join(os.path.dirname(__file__), "reports")
+
+
+def default_report_root() -> str:
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(data_home, "rocks-testsuite", "reports")
+
+
+class ReportStore:
+    """Report files sharded by id prefix (``ab/cd/abcd....json``)."""
+
+    def __init__(self, root: str, legacy_root: str | None = LEGACY_REPORT_DIR):
+        self.root = os.path.abspath(root)
+        self.legacy_root = legacy_root
+
+    def _shard(self, report_id: str) -> str:
+        return os.path.join(self.root, report_id[:2], report_id[2:4])
+
+    def path(self, report_id: str, suffix: str = ".json") -> str:
+        """Path for writing a report file. Creates the shard directory."""
+        shard = self._shard(report_id)
+        os.makedirs(shard, exist_ok=True)
+        return os.path.join(shard, report_id + suffix)
+
+    def find(self, report_id: str, suffix: str = ".json") -> str | None:
+        """Path of an existing report file, or None."""
+        if not REPORT_ID.fullmatch(report_id) or suffix not in REPORT_SUFFIXES:
+            return None
+        paths = [
+            os.path.join(self._shard(report_id), report_id + suffix),
+            # Reports saved before sharding
+            os.path.join(self.root, report_id + suffix),
+        ]
+        if self.legacy_root:
+            paths.append(os.path.join(self.legacy_root, report_id + suffix))
+        for path in paths:
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def collect(
+        self, max_age: float | None = None, max_total_bytes: int | None = None
+    ) -> int:
+        """Delete reports older than max_age seconds, then the oldest ones
+        until the total size is within max_total_bytes. Returns the number
+        of files deleted."""
+        entries = []
+        for root, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - max_age if max_age else None
+        deleted = 0
+        for mtime, size, path in entries:
+            expired = cutoff is not None and mtime < cutoff
+            oversize = max_total_bytes is not None and total > max_total_bytes
+            if not (expired or oversize):
+                # Oldest first, so nothing after this is expired either
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted += 1
+        self._remove_empty_shards()
+        return deleted
+
+    def _remove_empty_shards(self):
+        # Bottom-up, so a shard emptied by removing its subdirectory goes too
+        for root, _, _ in os.walk(self.root, topdown=False):
+            if root != self.root and not os.listdir(root):
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+
+_store = ReportStore(os.environ.get("TESTSUITE_REPORT_DIR") or default_report_root())
+
+
+def configure(config: dict[str, Any]) -> ReportStore:
+    global _store
+    root = (
+        config.get("report-dir")
+        or os.environ.get("TESTSUITE_REPORT_DIR")
+        or default_report_root()
+    )
+    _store = ReportStore(root)
+    os.makedirs(_store.root, exist_ok=True)
+    return _store
+
+
+def get_store() -> ReportStore:
+    return _store
+
+
+def report_path(report_id: str) -> str:
+    return _store.path(report_id)
+
+
+def cassette_path(report_id: str) -> str:
+    return _store.path(report_id, ".cassette.json.gz")
+
+
+def results_path(report_id: str) -> str:
+    return _store.path(report_id, ".results.ndjson")
@@ -1,23 +1,129 @@
-class ResultCode(dict):  # dict so it's JSON-serializable
+import enum
+import json
+import sys
+from collections.abc import Mapping
+from typing import Any, ClassVar, Iterator
+
+
+class Outcome(enum.IntEnum):
+    PASSED = 0
+    FAILED = 1
+    INCONCLUSIVE = 2
+    NOT_APPLICABLE = 3
+
+
+class ResultCode(Mapping):
+    """Compact result record.
+
+    Behaves as a read-only ``{"code": ..., "comment": ...}`` mapping so the
+    report JSON shape and the template checks (``result.code``) are unchanged.
+    """
+
+    __slots__ = ("comment",)
+
+    code: ClassVar[str] = "ResultCode"
+    outcome: ClassVar[Outcome] = Outcome.FAILED
+    _keys: ClassVar[tuple[str, str]] = ("code", "comment")
+    _registry: ClassVar[dict[str, type["ResultCode"]]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.code = sys.intern(cls.__name__)
+        ResultCode._registry[cls.code] = cls
+
     def __init__(self, comment: str):
-        self["code"] = type(self).__name__
-        self["comment"] = comment
+        self.comment = comment
+
+    def __getitem__(self, key: str):
+        if key == "code":
+            return self.code
+        if key == "comment":
+            return self.comment
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return 2
+
+    def __eq__(self, other):
+        if isinstance(other, ResultCode):
+            return self.code == other.code and self.comment == other.comment
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return hash((self.code, self.comment))
 
     def __repr__(self):
-        return f"<{self['code']} '{self['comment']}'>"
+        return f"<{self.code} '{self.comment}'>"
+
+    def to_json(self) -> dict[str, str]:
+        return {"code": self.code, "comment": self.comment}
 
 
 class TestFailure(ResultCode):
-    ...
+    __slots__ = ()
+    outcome = Outcome.FAILED
 
 
 class TestInconclusive(ResultCode):
-    ...
+    __slots__ = ()
+    outcome = Outcome.INCONCLUSIVE
 
 
 class TestNotApplicable(ResultCode):
-    ...
+    __slots__ = ()
+    outcome = Outcome.NOT_APPLICABLE
 
 
 TestResult = bool | ResultCode
-TestResults = dict[str, TestResult]
+
+
+class TestResults(dict[str, TestResult]):
+    """Result map keyed by interned test ids."""
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key: str, value: TestResult):
+        super().__setitem__(sys.intern(key), value)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+def outcome_of(result: TestResult) -> Outcome:
+    if isinstance(result, ResultCode):
+        return result.outcome
+    return Outcome.PASSED if result else Outcome.FAILED
+
+
+def load_result(value: Any) -> TestResult:
+    """Convert a result value read from report JSON back into a result."""
+    if isinstance(value, Mapping) and "code" in value:
+        result_type = ResultCode._registry.get(value["code"], TestFailure)
+        return result_type(value.get("comment", ""))
+    return bool(value)
+
+
+def _encode(obj: Any):
+    if isinstance(obj, ResultCode):
+        return obj.to_json()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(
+    default=_encode, ensure_ascii=False, check_circular=False, separators=(",", ":")
+)
+
+
+def dumps(obj: Any) -> str:
+    """Serialize reports and payloads containing result records."""
+    return _encoder.encode(obj)
@@ -0,0 +1,82 @@
+import json
+import time
+from typing import IO, Any, Iterable, Iterator
+from xml.sax.saxutils import escape, quoteattr
+
+from rocks_testsuite.reports import results_path
+from rocks_testsuite.result import Outcome, TestResults, dumps, outcome_of
+
+
+class ResultStream:
+    """Appends results to a report's NDJSON file as they are produced.
+
+    Each line is one result, so the file can be tailed during the run and
+    what was written survives a crash. The file is created with the first
+    result.
+    """
+
+    def __init__(self, report_id: str):
+        self.report_id = report_id
+        self._fp: IO[str] | None = None
+
+    def write(self, group: str, results: TestResults, seconds: float | None = None):
+        if not results:
+            return
+        if self._fp is None:
+            # Line buffered, so every result is flushed
+            self._fp = open(results_path(self.report_id), "a", buffering=1)
+        now = time.time()
+        for test_id, result in results.items():
+            record: dict[str, Any] = {
+                "group": group,
+                "id": test_id,
+                "outcome": outcome_of(result).name.lower(),
+                "result": result,
+                "time": now,
+            }
+            if seconds is not None:
+                record["seconds"] = round(seconds, 3)
+            self._fp.write(dumps(record) + "\n")
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+def junit_xml(lines: Iterable[str], name: str) -> Iterator[str]:
+    """Convert NDJSON result lines to JUnit XML, one test case at a time.
+
+    The suite totals aren't known until the end, so they are left out;
+    JUnit consumers count the test cases instead. Inconclusive results
+    are reported as skipped.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f"<testsuite name={quoteattr(name)}>\n"
+    for line in lines:
+        # A last line without a newline may still be being written
+        if line.endswith("\n") and line.strip():
+            yield _testcase(json.loads(line))
+    yield "</testsuite>\n"
+
+
+def _testcase(record: dict[str, Any]) -> str:
+    attributes = (
+        f"classname={quoteattr(record['group'])} name={quoteattr(record['id'])}"
+    )
+    if "seconds" in record:
+        attributes += f' time="{record["seconds"]}"'
+    result = record["result"]
+    comment = result.get("comment", "") if isinstance(result, dict) else ""
+    outcome = Outcome[record["outcome"].upper()]
+    if outcome == Outcome.PASSED:
+        return f"  <testcase {attributes}/>\n"
+    if outcome == Outcome.FAILED:
+        code = result.get("code", "") if isinstance(result, dict) else ""
+        element = f"<failure type={quoteattr(code or 'TestFailure')}"
+        element += f" message={quoteattr(comment)}>{escape(comment)}</failure>"
+    elif outcome == Outcome.INCONCLUSIVE:
+        element = f"<skipped message={quoteattr('Inconclusive: ' + comment)}/>"
+    else:
+        element = f"<skipped message={quoteattr(comment or 'Not applicable')}/>"
+    return f"  <testcase {attributes}>{element}</testcase>\n"
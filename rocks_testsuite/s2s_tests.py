@@ -0,0 +1,333 @@
+import asyncio
+import collections
+import logging
+import statistics
+import time
+import uuid
+from typing import Any
+
+from fastapi import Request
+
+from rocks_testsuite.c2s_tests import APClient, _get_json
+
+_logger = logging.getLogger("rocks.session")
+
+DEFAULT_FAN_OUT_ACTORS = 20
+DEFAULT_FAN_OUT_TIMEOUT = 60
+DEFAULT_FAN_OUT_CONCURRENCY = 10
+
+PUBLIC = "https://www.w3.org/ns/activitystreams#Public"
+
+
+class S2SFanOutBenchmark:
+    """Measures how fast the server under test delivers a post to its followers.
+
+    A number of local test actors follow the target actor. The target then
+    posts a note (through its outbox if a C2S token is available, otherwise
+    the user is asked to post one) and the deliveries of the note to the
+    actors' inboxes are timed.
+    """
+
+    def __init__(self, session):
+        self._session = session
+        config = session.config
+        self.actor_count = int(
+            config.get("s2s-benchmark-actors", DEFAULT_FAN_OUT_ACTORS)
+        )
+        self.timeout = float(
+            config.get("s2s-benchmark-timeout", DEFAULT_FAN_OUT_TIMEOUT)
+        )
+        self._semaphore = asyncio.Semaphore(
+            int(config.get("s2s-benchmark-concurrency", DEFAULT_FAN_OUT_CONCURRENCY))
+        )
+        self._actors = []
+        self._accepted: set[str] = set()
+        self._follow_ids: dict[str, str] = {}
+        self._followers: set[str] = set()
+        # Delivery times and activity/object ids per follower
+        self._deliveries: dict[str, list[tuple[float, set[str]]]] = (
+            collections.defaultdict(list)
+        )
+        self._post_id: str | None = None
+        self._unsigned = 0
+        self._target_uri: str | None = None
+        self._accepted_all = asyncio.Event()
+        self._delivered_all = asyncio.Event()
+        self._posting = False
+        self._match_first_post = False
+
+    async def run(self):
+        session = self._session
+        if session.cassette_mode == "replay":
+            await session.send_notice_str(
+                "Skipping the fan-out benchmark: incoming deliveries can't be replayed."
+            )
+            return
+        target = await self._get_target()
+        if target is None:
+            return
+        if not isinstance(target.get("id"), str) or not isinstance(
+            target.get("inbox"), str
+        ):
+            raise ValueError("The actor has no id or inbox")
+        self._target_uri = target["id"]
+        await session.send_notice_str(
+            f"Fan-out benchmark: following {self._target_uri} "
+            f"with {self.actor_count} actors..."
+        )
+        for _ in range(self.actor_count):
+            actor = await session.create_actor()
+            actor.delivery_listener = self._on_delivery
+            self._actors.append(actor)
+        try:
+            await self._follow(target)
+            metrics = await self._measure(target)
+        finally:
+            await self._unfollow(target)
+            for actor in self._actors:
+                actor.delivery_listener = None
+        if metrics:
+            session.metrics["s2s-fan-out"] = metrics
+            await session.send_notice_str(_metrics_table(metrics))
+
+    async def _get_target(self) -> dict[str, Any] | None:
+        actor_uri = self._session.config.get("actor-id")
+        while True:
+            if not actor_uri:
+                answer = await self._session.send_question(
+                    "get_actor_uri.jinja", {"actor_uri": actor_uri}
+                )
+                actor_uri = answer["actor-id"]
+            try:
+                return await _get_json(actor_uri)
+            except Exception:
+                _logger.error("Failed to retrieve actor %s", actor_uri, exc_info=True)
+                await self._session.send_notice_str(
+                    "<span class='result-log-fail'>Failed to "
+                    "retrieve actor profile</span>"
+                )
+                if self._session.config.get("actor-id") == actor_uri:
+                    # Configured, so asking again would just repeat it
+                    return None
+                actor_uri = None
+
+    async def _follow(self, target: dict[str, Any]):
+        async def follow(actor):
+            follow_id = f"{actor.uri}/follow-{uuid.uuid4()}"
+            self._follow_ids[actor.uri] = follow_id
+            async with self._semaphore:
+                response = await actor.post(
+                    target["inbox"],
+                    {
+                        "@context": "https://www.w3.org/ns/activitystreams",
+                        "id": follow_id,
+                        "type": "Follow",
+                        "object": target["id"],
+                    },
+                )
+            if not response.is_success:
+                _logger.error(
+                    "Follow from %s failed: %s", actor.uri, response.status_code
+                )
+
+        await asyncio.gather(*(follow(actor) for actor in self._actors))
+        try:
+            await asyncio.wait_for(self._accepted_all.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            await self._session.send_notice_str(
+                f"Only {len(self._accepted)} of {len(self._actors)} "
+                "follows were accepted. Continuing with those."
+            )
+
+    async def _measure(self, target: dict[str, Any]) -> dict[str, Any] | None:
+        self._followers = self._accepted or {actor.uri for actor in self._actors}
+        client = await self._get_client(target)
+        inbox_stats = collections.Counter(self._session.inbox_stats)
+        self._posting = True
+        if client is not None:
+            started = time.monotonic()
+            response = await client.post_to_outbox(
+                {
+                    "type": "Create",
+                    "to": [PUBLIC],
+                    "cc": [target["followers"]] if target.get("followers") else [],
+                    "object": {
+                        "type": "Note",
+                        "content": f"Fan-out benchmark {uuid.uuid4()}",
+                        "to": [PUBLIC],
+                    },
+                }
+            )
+            self._post_id = response.headers.get("Location")
+            # Without a Location, the first delivered post is assumed to be it
+            self._match_first_post = self._post_id is None
+        else:
+            # Without a token, the user posts the note and timing starts
+            # with the first delivery.
+            started = None
+            self._match_first_post = True
+            await self._session.send_question(
+                "s2s_benchmark_post.jinja", {"actor_uri": target["id"]}
+            )
+        self._check_delivered()
+        try:
+            await asyncio.wait_for(self._delivered_all.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._posting = False
+        inbox_stats = self._session.inbox_stats - inbox_stats
+
+        deliveries = {
+            uri: [t for t, activity_ids in times if self._post_id in activity_ids]
+            for uri, times in self._deliveries.items()
+            if uri in self._followers
+        }
+        first_deliveries = sorted(times[0] for times in deliveries.values() if times)
+        if not first_deliveries:
+            await self._session.send_notice_str(
+                "<span class='result-log-fail'>No deliveries were received "
+                f"within {self.timeout:g} seconds.</span>"
+            )
+            return None
+        if started is None:
+            started = first_deliveries[0]
+        completion_times = [t - started for t in first_deliveries]
+        duration = completion_times[-1]
+        return {
+            "followers": len(self._followers),
+            "follows-accepted": len(self._accepted),
+            "delivered": len(completion_times),
+            "missing": len(self._followers) - len(completion_times),
+            "duplicates": sum(max(0, len(times) - 1) for times in deliveries.values()),
+            "unsigned": self._unsigned,
+            "inbox-requests": inbox_stats["inbox-requests"],
+            "shared-inbox-requests": inbox_stats["shared-inbox-requests"],
+            "saved-by-shared-inbox": inbox_stats["shared-inbox-deliveries"]
+            - inbox_stats["shared-inbox-requests"],
+            "seconds": duration,
+            "deliveries-per-second": (
+                len(completion_times) / duration if duration else None
+            ),
+            "completion-seconds": _distribution(completion_times),
+        }
+
+    async def _get_client(self, target: dict[str, Any]) -> APClient | None:
+        client = self._session.c2s_client
+        if client is not None and client.uri == target["id"]:
+            return client
+        if "outbox" not in target:
+            return None
+        answers = await self._session.send_question(
+            "get_auth_token.jinja",
+            {
+                "auth_token_endpoint": (target.get("endpoints") or {}).get(
+                    "oauthAuthorizationEndpoint"
+                )
+            },
+        )
+        token = answers.get("auth-token")
+        return APClient(target, token) if token else None
+
+    def _check_delivered(self):
+        if self._post_id is None:
+            return
+        if all(
+            any(
+                self._post_id in activity_ids
+                for _, activity_ids in self._deliveries[uri]
+            )
+            for uri in self._followers
+        ):
+            self._delivered_all.set()
+
+    async def _unfollow(self, target: dict[str, Any]):
+        async def unfollow(actor):
+            async with self._semaphore:
+                await actor.post(
+                    target["inbox"],
+                    {
+                        "@context": "https://www.w3.org/ns/activitystreams",
+                        "id": f"{actor.uri}/undo-{uuid.uuid4()}",
+                        "type": "Undo",
+                        "object": {
+                            "id": self._follow_ids[actor.uri],
+                            "type": "Follow",
+                            "actor": actor.uri,
+                            "object": target["id"],
+                        },
+                    },
+                )
+
+        results = await asyncio.gather(
+            *(
+                unfollow(actor)
+                for actor in self._actors
+                if actor.uri in self._follow_ids
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                _logger.error("Undo follow failed: %s", result)
+
+    def _on_delivery(self, actor, activity: dict[str, Any], request: Request):
+        if activity.get("actor") != self._target_uri:
+            return
+        if activity.get("type") == "Accept":
+            self._accepted.add(actor.uri)
+            if len(self._accepted) == len(self._actors):
+                self._accepted_all.set()
+        elif activity.get("type") == "Create" and self._posting:
+            # The C2S tests may be posting at the same time, so deliveries
+            # are matched to the benchmark post later, by activity or object id.
+            object_ = activity.get("object")
+            activity_ids = {
+                activity.get("id"),
+                object_.get("id") if isinstance(object_, dict) else object_,
+            }
+            if self._post_id is None and self._match_first_post:
+                self._post_id = activity.get("id")
+            if self._post_id in activity_ids and "signature" not in request.headers:
+                self._unsigned += 1
+            self._deliveries[actor.uri].append((time.monotonic(), activity_ids))
+            self._check_delivered()
+
+
+def _distribution(values: list[float]) -> dict[str, float] | None:
+    if not values:
+        return None
+    if len(values) == 1:
+        p50 = p90 = p99 = values[0]
+    else:
+        percentiles = statistics.quantiles(values, n=100, method="inclusive")
+        p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+    return {
+        "min": values[0],
+        "p50": p50,
+        "p90": p90,
+        "p99": p99,
+        "max": values[-1],
+    }
+
+
+def _metrics_table(metrics: dict[str, Any]) -> str:
+    rows = [
+        ("Followers", metrics["followers"]),
+        ("Delivered", metrics["delivered"]),
+        ("Missing", metrics["missing"]),
+        ("Duplicates", metrics["duplicates"]),
+        ("Unsigned", metrics["unsigned"]),
+        ("Inbox requests", metrics["inbox-requests"]),
+        ("Shared inbox requests", metrics["shared-inbox-requests"]),
+        ("Saved by shared inbox", metrics["saved-by-shared-inbox"]),
+    ]
+    if metrics["deliveries-per-second"]:
+        rows.append(("Deliveries/second", f"{metrics['deliveries-per-second']:.1f}"))
+    distribution = metrics["completion-seconds"]
+    if distribution:
+        rows.extend(
+            (f"Completion {name}", f"{seconds:.3f}s")
+            for name, seconds in distribution.items()
+        )
+    cells = "".join(f"<tr><td>{name}</td><td>{value}</td></tr>" for name, value in rows)
+    return f"<h3>Fan-out benchmark</h3><table>{cells}</table>"
@@ -0,0 +1,63 @@
+import fnmatch
+import re
+from typing import Any, Iterable
+
+REQUIREMENT_LEVELS = ["MUST", "SHOULD", "MAY", "NON-NORMATIVE"]
+
+
+def _as_list(value: str | Iterable[str] | None) -> list[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r"[,\s]+", value)
+    return [item.strip() for item in value if item and item.strip()]
+
+
+class TestSelection:
+    """Selects tests by id glob pattern and requirement level.
+
+    An empty pattern or level list selects everything.
+    """
+
+    def __init__(
+        self,
+        patterns: list[str],
+        levels: list[str],
+        metadata: dict[str, dict[str, Any]],
+    ):
+        self.patterns = patterns
+        self.levels = [level.upper() for level in levels]
+        unknown = set(self.levels) - set(REQUIREMENT_LEVELS)
+        if unknown:
+            raise ValueError(f"Unknown requirement levels: {', '.join(unknown)}")
+        self._regex = (
+            re.compile("|".join(fnmatch.translate(p) for p in patterns))
+            if patterns
+            else None
+        )
+        self._metadata = metadata
+
+    @classmethod
+    def from_config(
+        cls, config: dict[str, Any], metadata: dict[str, dict[str, Any]]
+    ) -> "TestSelection":
+        return cls(
+            _as_list(config.get("select-tests")),
+            _as_list(config.get("select-levels")),
+            metadata,
+        )
+
+    @property
+    def selects_all(self) -> bool:
+        return self._regex is None and not self.levels
+
+    def includes(self, test_id: str) -> bool:
+        if self._regex is not None and not self._regex.match(test_id):
+            return False
+        if self.levels:
+            entry = self._metadata.get(test_id)
+            return entry is not None and entry["requirement_level"] in self.levels
+        return True
+
+    def __repr__(self):
+        return f"<TestSelection patterns={self.patterns} levels={self.levels}>"
@@ -1,28 +1,51 @@
 import base64
 from email.utils import formatdate
+from functools import lru_cache
 from hashlib import sha256
-from typing import Generator
+from typing import Generator, Iterable
 from urllib.parse import urlparse
 
 from cryptography.hazmat.backends import default_backend as crypto_default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization as crypto_serialization
 from cryptography.hazmat.primitives.asymmetric import padding
-from httpx import Auth, Request, Response
+from httpx import Auth, Request, RequestNotRead, Response
 from starlette.requests import HTTPConnection
 
 
+def digest_header(chunks: Iterable[bytes | memoryview]) -> str:
+    """Compute a SHA-256 Digest header value without joining the chunks."""
+    digest = sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return "SHA-256=" + base64.b64encode(digest.digest()).decode("utf-8")
+
+
+def _request_content(conn: HTTPConnection) -> bytes | None:
+    try:
+        return conn.content
+    except RequestNotRead:
+        # Streamed bodies must supply their own Digest header
+        return None
+
+
+@lru_cache
+def load_private_key(private_key: str):
+    """Parse a PEM private key. Test actors share keys, so this is cached."""
+    return crypto_serialization.load_pem_private_key(
+        private_key.encode("utf-8"),
+        password=None,
+        backend=crypto_default_backend(),
+    )
+
+
 class HttpSignatureAuth(Auth):
     DEFAULT_HEADERS = ["(request-target)", "host", "date"]
     POST_HEADERS = DEFAULT_HEADERS + ["digest"]
 
     def __init__(self, key_id: str, private_key: str):
         self._key_id = key_id
-        self._private_key = crypto_serialization.load_pem_private_key(
-            private_key.encode("utf-8"),
-            password=None,
-            backend=crypto_default_backend(),
-        )
+        self._private_key = load_private_key(private_key)
 
     @classmethod
     def _headers(cls, conn: HTTPConnection) -> list[str]:
@@ -60,10 +83,10 @@ class HttpSignatureAuth(Auth):
                     conn.headers["Date"] = formatdate(
                         timeval=None, localtime=False, usegmt=True
                     )
-                elif header.lower() == "digest" and conn.content is not None:
-                    conn.headers["Digest"] = "SHA-256=" + base64.b64encode(
-                        sha256(conn.content).digest()
-                    ).decode("utf-8")
+                elif header.lower() == "digest":
+                    content = _request_content(conn)
+                    if content is not None:
+                        conn.headers["Digest"] = digest_header([content])
                 elif header.lower() == "host":
                     conn.headers["Host"] = urlparse(conn.url).netloc
 
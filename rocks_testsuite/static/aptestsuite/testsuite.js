@@ -44,7 +44,14 @@ function displayMessage(data) {
         function () {
             new_entry.setAttribute("class", "stream-entry");
             new_entry.innerHTML = data;
-            document.getElementById("stream").appendChild(new_entry);
+            // Test progress can arrive while a prompt is waiting for
+            // input. Keep the prompt at the bottom of the stream.
+            var prompt = getActivePrompt();
+            if (prompt) {
+                prompt.parentNode.before(new_entry);
+            } else {
+                document.getElementById("stream").appendChild(new_entry);
+            }
         });
 }
 
@@ -58,7 +65,31 @@ function handleNoticeMessage(message_json, ws) {
     displayMessage(message_json["content"], false);
 }
 
+function getSpectatedSession() {
+    return document.body.dataset.spectate;
+}
+
+function handleSpectatedPromptMessage(message_json) {
+    var centered_wrapper = document.createElement("div");
+    var prompt = document.createElement("div");
+    centered_wrapper.setAttribute("class", "simple-centered-wrap");
+    prompt.setAttribute("class", "prompt-user prompt-disabled");
+    prompt.innerHTML = message_json["content"];
+    disableInputs(prompt);
+    centered_wrapper.appendChild(prompt);
+    withMaybeScroll(
+        function () {
+            document.getElementById("stream").appendChild(
+                centered_wrapper);
+        }
+    );
+}
+
 function handleInputPromptMessage(message_json, ws) {
+    if (getSpectatedSession()) {
+        handleSpectatedPromptMessage(message_json);
+        return;
+    }
     var centered_wrapper = document.createElement("div");
     var new_prompt = document.createElement("div");
     var button_metabox = document.createElement("div");
@@ -119,17 +150,28 @@ function installWebsocket() {
         protocol = "wss://";
     }
     var address = protocol.concat(window.location.hostname, ":", window.location.port);
+    var spectated = getSpectatedSession();
+    if (spectated) {
+        address = address.concat("/spectate/", spectated);
+    }
     var ws = new WebSocket(address);
     ws.onmessage = function (evt) {
         console.log(evt.data);
         delegateMessage(JSON.parse(evt.data), ws);
     };
     ws.onopen = function () {
-        setConnectedText("connected", "connected");
+        setConnectedText(spectated ? "spectating" : "connected", "connected");
         console.log("connected");
     };
-    ws.onclose = function () {
+    ws.onclose = function (evt) {
         setConnectedText("disconnected", "disconnected");
+        if (spectated) {
+            displayMessage(
+                evt.code == 1013
+                    ? "* Fell too far behind the session. Refresh to catch up."
+                    : "* The session has ended.");
+            return;
+        }
         // kludge, we shouldn't be using self_sent like this because it
         // wipes the input
         const metabox = document.getElementById("stream-metabox")
@@ -197,8 +239,7 @@ function submitCurrentPrompt(ws) {
     }));
 }
 
-function disableActivePrompt() {
-    var prompt = getActivePrompt();
+function disableInputs(prompt) {
     var inputs = prompt.getElementsByTagName("input");
     var textareas = prompt.getElementsByTagName("textarea");
 
@@ -209,6 +250,11 @@ function disableActivePrompt() {
     for (var i = 0; i < textareas.length; i++) {
         textareas[i].setAttribute("disabled", "true");
     };
+}
+
+function disableActivePrompt() {
+    var prompt = getActivePrompt();
+    disableInputs(prompt);
 
     // Set buttons to text that says *submitted*
     prompt.getElementsByClassName(
@@ -0,0 +1,179 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from hashlib import sha256
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSIBLE_TYPES = [
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "font/ttf",
+    "application/x-font-ttf",
+]
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+_CSS_URL = re.compile(r"""url\((['"]?)([^'")]+)\1\)""")
+
+
+class Asset:
+    __slots__ = ("media_type", "digest", "etag", "bodies")
+
+    def __init__(self, content: bytes, media_type: str, digest: str):
+        self.media_type = media_type
+        self.digest = digest
+        self.etag = f'"{digest}"'
+        # Ordered by preference when the client accepts several encodings
+        self.bodies: dict[str, bytes] = {"identity": content}
+
+    def compress(self):
+        if not any(self.media_type.startswith(t) for t in COMPRESSIBLE_TYPES):
+            return
+        content = self.bodies["identity"]
+        bodies = {}
+        if brotli is not None:
+            bodies["br"] = brotli.compress(content, quality=11)
+        bodies["gzip"] = gzip.compress(content, 9, mtime=0)
+        bodies = {
+            encoding: body
+            for encoding, body in bodies.items()
+            if len(body) < len(content)
+        }
+        bodies["identity"] = content
+        # Swapped in whole so requests never see a partial set
+        self.bodies = bodies
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match matches the (strong) ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ["q=0", "q=0.0", "q=0.00", "q=0.000"]:
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class StaticAssets:
+    """Serves a static directory from memory with precompressed variants.
+
+    Compressed (gzip and, if the optional ``brotli`` package is installed,
+    brotli) variants are built by ``precompress``.
+
+    Every file is also available under a content-fingerprinted name
+    (``name.<hash>.ext``) that is cached as immutable. Use ``url`` to get
+    the fingerprinted path for templates. CSS ``url()`` references to other
+    assets are rewritten to their fingerprinted names.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._assets: dict[str, tuple[Asset, str]] = {}
+        self._fingerprinted: dict[str, str] = {}
+        paths = []
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.relpath(os.path.join(root, filename), directory)
+                paths.append(path.replace(os.sep, "/"))
+        # Stylesheets last so the assets they reference are fingerprinted first
+        for path in sorted(paths, key=lambda p: p.endswith(".css")):
+            self._load(path)
+
+    def _load(self, path: str):
+        with open(os.path.join(self.directory, path), "rb") as fp:
+            content = fp.read()
+        if path.endswith(".css"):
+            content = self._rewrite_css(path, content)
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        digest = sha256(content).hexdigest()[:16]
+        asset = Asset(content, media_type, digest)
+        base, ext = posixpath.splitext(path)
+        fingerprinted = f"{base}.{digest}{ext}"
+        self._assets[path] = (asset, REVALIDATE_CACHE_CONTROL)
+        self._assets[fingerprinted] = (asset, IMMUTABLE_CACHE_CONTROL)
+        self._fingerprinted[path] = fingerprinted
+
+    def _rewrite_css(self, path: str, content: bytes) -> bytes:
+        css_dir = posixpath.dirname(path)
+
+        def replace(match: re.Match) -> str:
+            target = posixpath.normpath(posixpath.join(css_dir, match.group(2)))
+            if target not in self._fingerprinted:
+                return match.group(0)
+            relative = posixpath.relpath(self._fingerprinted[target], css_dir)
+            return f"url({match.group(1)}{relative}{match.group(1)})"
+
+        return _CSS_URL.sub(replace, content.decode("utf-8")).encode("utf-8")
+
+    def precompress(self):
+        """Generate the compressed variants. Until then, files are sent as is."""
+        for asset in {id(asset): asset for asset, _ in self._assets.values()}.values():
+            asset.compress()
+
+    def url(self, path: str) -> str:
+        return self._fingerprinted.get(path, path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        request = Request(scope, receive)
+        response = self.response(request)
+        await response(scope, receive, send)
+
+    def response(self, request: Request) -> Response:
+        if request.method not in ["GET", "HEAD"]:
+            return Response(status_code=405, headers={"Allow": "GET, HEAD"})
+        entry = self._assets.get(_route_path(request.scope).lstrip("/"))
+        if entry is None:
+            return Response("Not Found", status_code=404)
+        asset, cache_control = entry
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding, body in asset.bodies.items():
+            if encoding == "identity" or encoding in accepted or "*" in accepted:
+                break
+        etag = asset.etag if encoding == "identity" else f'"{asset.digest}-{encoding}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        headers["Content-Length"] = str(len(body))
+        return Response(
+            body if request.method == "GET" else None,
+            headers=headers,
+            media_type=asset.media_type,
+        )
+
+
+def _route_path(scope: Scope) -> str:
+    # Older Starlette versions strip the mount prefix from "path",
+    # newer ones leave it and put the prefix in "root_path".
+    path, root_path = scope["path"], scope.get("root_path", "")
+    if root_path and path.startswith(root_path + "/"):
+        return path[len(root_path) :]
+    return path
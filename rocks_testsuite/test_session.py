@@ -1,3 +1,5 @@
+import asyncio
+import bisect
 import collections
 import json
 import logging
@@ -5,19 +7,40 @@ import os
 import uuid
 from datetime import datetime
 from functools import lru_cache
-from typing import Any, Tuple
+from hashlib import sha256
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Tuple
 
-import httpx
 import jinja2
-from cryptography.hazmat.backends import default_backend as crypto_default_backend
-from cryptography.hazmat.primitives import serialization as crypto_serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi import HTTPException, Request, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
 
-from rocks_testsuite.c2s_tests import C2SServerTests
-from rocks_testsuite.result import ResultCode
-from rocks_testsuite.signatures import HttpSignatureAuth
+from rocks_testsuite.broadcast import (
+    DEFAULT_SPECTATOR_BUFFER,
+    DEFAULT_SPECTATOR_HISTORY,
+    Broadcaster,
+)
+from rocks_testsuite.logs import log_context
+from rocks_testsuite.reports import REPORT_ID, cassette_path, get_store, report_path
+from rocks_testsuite.result import (
+    Outcome,
+    TestNotApplicable,
+    TestResults,
+    dumps,
+    load_result,
+    outcome_of,
+)
+from rocks_testsuite.result_stream import ResultStream
+from rocks_testsuite.selection import TestSelection
+from rocks_testsuite.static_assets import not_modified
+
+# httpx, cryptography and the test cases are imported where they're used so
+# that the app can start serving pages before they're loaded.
+if TYPE_CHECKING:
+    import httpx
+
+    from rocks_testsuite.c2s_tests import APClient
+    from rocks_testsuite.cassette import Cassette
+    from rocks_testsuite.faults import FaultInjectionTransport
+    from rocks_testsuite.transport import SessionTransport
 
 _logger = logging.getLogger("rocks.session")
 
@@ -27,7 +50,23 @@ class TestSessionManager:
         self.sessions: dict[str, "TestSession"] = {}
 
 
-ResultsType = dict[str, dict[str, bool | ResultCode]]
+ResultsType = dict[str, TestResults]
+
+
+def load_report(report_ref: str) -> dict[str, Any] | None:
+    """Load a saved report by id or download link, with results restored."""
+    match = REPORT_ID.search(report_ref or "")
+    path = match and get_store().find(match.group())
+    if not path:
+        return None
+    with open(path) as fp:
+        report = json.load(fp)
+    report["id"] = match.group()
+    report["results"] = {
+        group: TestResults({key: load_result(value) for key, value in items.items()})
+        for group, items in report.get("results", {}).items()
+    }
+    return report
 
 
 class TestSession:
@@ -35,17 +74,59 @@ class TestSession:
         self.id = uuid.uuid4().hex
         self.websocket = websocket
         self._templates = env
-        self.results: ResultsType = collections.defaultdict(dict)
+        self.results: ResultsType = collections.defaultdict(TestResults)
         self.metadata, self.questionnaire = self._load_test_data()
-        self.actors: dict[str, "TestActor"] = {}
+        self.actors = ActorRegistry(self)
+        self.metrics: dict[str, Any] = {}
+        self.previous_report: dict[str, Any] | None = None
+        self.carried_over: dict[str, list[str]] = collections.defaultdict(list)
+        self.selection = TestSelection([], [], self.metadata)
+        self.transport: "SessionTransport | None" = None
+        self.fault_injection: "FaultInjectionTransport | None" = None
+        self.cassette: "Cassette | None" = None
+        self.cassette_mode: str | None = None
+        # Set up by the C2S tests, reused by the S2S benchmark
+        self.c2s_client: "APClient | None" = None
+        # Requests to the actor inboxes and to the shared inbox, and the
+        # actor deliveries made from the shared inbox requests
+        self.inbox_stats: collections.Counter[str] = collections.Counter()
         self.config: dict[str, Any] = config or {}
+        # Work owned by the session, cancelled when it ends
+        self._tasks: set[asyncio.Task] = set()
+        self._answers: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self.ended = False
+        self.result_stream = ResultStream(self.id)
+        self.spectators = Broadcaster(
+            int(self.config.get("spectator-buffer", DEFAULT_SPECTATOR_BUFFER)),
+            int(self.config.get("spectator-history", DEFAULT_SPECTATOR_HISTORY)),
+        )
         _logger.info(
-            f"Test session created: id={self.id}, "
-            + f"remote_addr={websocket.client.host}, "
-            + f"forwarded={websocket.headers.get('X-Forwarded-For')}, "
-            + f"user-agent={websocket.headers.get('User-Agent')} "
+            "Test session created: %s",
+            self._describe_client(),
+            extra={"session": self.id},
         )
 
+    def _describe_client(self) -> str:
+        return (
+            f"remote_addr={self.websocket.client.host}, "
+            + f"forwarded={self.websocket.headers.get('X-Forwarded-For')}, "
+            + f"user-agent={self.websocket.headers.get('User-Agent')} "
+        )
+
+    @property
+    def base_url(self) -> str:
+        url = self.websocket.base_url
+        # TODO The request info for reverse-proxy WS is not clear
+        return (
+            ("http" if url.scheme == "ws" else "https") + "://" + url.netloc + url.path
+        )
+
+    @property
+    def shared_inbox_uri(self) -> str | None:
+        if not self.config.get("shared-inbox", True):
+            return None
+        return self.base_url + "ap/u/" + self.id + "/inbox"
+
     def _load_data(self, filename: str):
         filepath = os.path.join(os.path.dirname(__file__), "data", filename)
         with open(filepath) as fp:
@@ -61,13 +142,62 @@ class TestSession:
         return self.questionnaire[group_name]
 
     async def run(self):
+        """Run the session.
+
+        The test flow and the background work it starts (see ``create_task``)
+        are cancelled together when the session ends. A browser disconnect
+        ends it right away, even while the tests are waiting on the server.
+        """
+        with log_context(session=self.id):
+            flow = self.create_task(self._run())
+            tasks = {flow}
+            if self.websocket is not None:
+                tasks.add(self.create_task(self._receive()))
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                if flow.done():
+                    flow.result()
+            finally:
+                self.ended = True
+                await self._cancel_tasks()
+                self.spectators.close()
+                self.result_stream.close()
+
+    def create_task(self, coro: Coroutine[Any, Any, Any]) -> asyncio.Task:
+        """Run work owned by the session. It's cancelled when the session ends."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _cancel_tasks(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _receive(self):
+        # Answers are read here rather than when a question is asked, so a
+        # disconnect is noticed while no question is waiting.
+        try:
+            while True:
+                try:
+                    answer = await self.websocket.receive_json()
+                except ValueError:
+                    _logger.warning("Ignored a message that isn't JSON")
+                    continue
+                await self._answers.put(answer)
+        except WebSocketDisconnect:
+            _logger.info("Browser disconnected")
+
+    async def _run(self):
         try:
             await self.send_notice("greeting.jinja")
             while True:
                 self.config.update(await self.send_question("setup.jinja"))
                 # This validation could be done in the browser,
                 # but this was the original way
-                if any(
+                if not any(
                     self.config[key]
                     for key in [
                         "testing-client",
@@ -75,23 +205,25 @@ class TestSession:
                         "testing-s2s-server",
                     ]
                 ):
+                    await self.send_notice_str(
+                        "It looks like you didn't select anything. "
+                        "Please select at least one implementation type to test."
+                    )
+                    continue
+                try:
+                    self.selection = TestSelection.from_config(
+                        self.config, self.metadata
+                    )
                     break
-                await self.send_notice_str(
-                    "It looks like you didn't select anything. "
-                    "Please select at least one implementation type to test."
-                )
-            # TODO: support verbose-debugging option?
-            if self.config.get("testing-client"):
-                await self.run_client_tests()
-            if self.config.get("testing-c2s-server"):
-                case = C2SServerTests(self, self.results["c2s-server-test-items"])
-                await case.run()
-            if self.config.get("testing-s2s-server"):
-                await self.run_s2s_tests()
-            if self.config.get("testing-c2s-server") or self.config.get(
-                "testing-s2s-server"
-            ):
-                await self.run_server_common_tests()
+                except ValueError as ex:
+                    await self.send_notice_str(f"Invalid test selection: {ex}")
+            if self.config.get("rerun-report"):
+                await self.load_previous_report(self.config["rerun-report"])
+            await self.setup_transport()
+            from rocks_testsuite.transport import use_transport
+
+            with use_transport(self.transport):
+                await self.run_tests()
             _logger.info("Tests complete. Querying project information.")
             project_info = await self.get_project_info()
             await self.save_report(project_info)
@@ -102,18 +234,210 @@ class TestSession:
         except WebSocketDisconnect:
             pass
 
+    async def run_tests(self):
+        # TODO: support verbose-debugging option?
+        c2s_tests = None
+        automated_tests = None
+        if self.config.get("testing-c2s-server"):
+            from rocks_testsuite.c2s_tests import C2SServerTests
+
+            c2s_tests = C2SServerTests(self, self.results["c2s-server-test-items"])
+            await c2s_tests.setup()
+            # The automated tests run in the background while the
+            # remaining questions are asked.
+            automated_tests = self.create_task(c2s_tests.run_tests())
+        if self.config.get("testing-client"):
+            await self.run_client_tests()
+        if c2s_tests:
+            await c2s_tests.ask_questions()
+        if self.config.get("testing-s2s-server"):
+            await self.run_s2s_tests()
+        if self.config.get("testing-c2s-server") or self.config.get(
+            "testing-s2s-server"
+        ):
+            await self.run_server_common_tests()
+        if automated_tests:
+            if not automated_tests.done():
+                await self.send_notice_str(
+                    self._center("<h2>Waiting for the outbox tests...</h2>")
+                )
+            await automated_tests
+
+    async def setup_transport(self):
+        from rocks_testsuite.inprocess import target_transport
+        from rocks_testsuite.ratelimit import RateLimitedTransport
+        from rocks_testsuite.transport import SessionTransport
+
+        # Requests are paced per host below the recorder, so cassettes only
+        # hold the responses the tests saw and replays aren't throttled.
+        # An app tested in-process isn't paced. Faults are injected below
+        # the pacing, like a bad link, so its retries see them.
+        in_process = target_transport(self.base_url)
+        network = await self.setup_fault_injection(in_process)
+        if in_process is None:
+            network = RateLimitedTransport(network)
+        if not (self.config.get("replay-cassette") or self.config.get("record-http")):
+            self.transport = SessionTransport(network)
+            return
+        from rocks_testsuite.cassette import (
+            Cassette,
+            RecordingTransport,
+            ReplayTransport,
+        )
+
+        if self.config.get("replay-cassette"):
+            match = REPORT_ID.search(self.config["replay-cassette"])
+            path = match and get_store().find(match.group(), ".cassette.json.gz")
+            try:
+                self.cassette = Cassette.load(path) if path else None
+            except (OSError, ValueError):
+                _logger.error("Failed to load cassette %s", path, exc_info=True)
+            if self.cassette is None:
+                await self.send_notice_str(
+                    "<span class='result-log-fail'>Cassette "
+                    f"{self.config['replay-cassette']} not found or invalid. "
+                    "Using the network.</span>"
+                )
+            else:
+                await network.aclose()
+                self.transport = ReplayTransport(self.cassette)
+                self.cassette_mode = "replay"
+                if self.cassette.info.get("actor-id"):
+                    self.config.setdefault("actor-id", self.cassette.info["actor-id"])
+                await self.send_notice_str(
+                    f"Replaying recorded HTTP interactions from {match.group()}"
+                )
+                return
+        if self.config.get("record-http"):
+            self.cassette = Cassette(info={"session": self.id})
+            self.transport = RecordingTransport(self.cassette, network)
+            self.cassette_mode = "record"
+        else:
+            self.transport = SessionTransport(network)
+
+    async def setup_fault_injection(
+        self, transport: "httpx.AsyncBaseTransport | None"
+    ) -> "httpx.AsyncBaseTransport | None":
+        if not self.config.get("fault-injection"):
+            return transport
+        from rocks_testsuite.faults import FaultInjectionTransport, parse_rules
+
+        try:
+            rules = parse_rules(self.config)
+        except ValueError as ex:
+            await self.send_notice_str(
+                f"<span class='result-log-fail'>{ex}. "
+                "Running without fault injection.</span>"
+            )
+            return transport
+        self.fault_injection = FaultInjectionTransport(
+            rules, transport, self.config.get("fault-injection-seed")
+        )
+        await self.send_notice_str(
+            f"Injecting faults into requests matching {len(rules)} route(s)"
+        )
+        return self.fault_injection
+
+    async def close(self):
+        if self.transport is not None:
+            await self.transport.close()
+
+    async def load_previous_report(self, report_ref: str):
+        self.previous_report = load_report(report_ref)
+        if self.previous_report is None:
+            await self.send_notice_str(
+                "<span class='result-log-fail'>Previous report "
+                f"{report_ref} not found. Running all tests.</span>"
+            )
+            return
+        if self.previous_report.get("actor-id"):
+            self.config.setdefault("actor-id", self.previous_report["actor-id"])
+        await self.send_notice_str(
+            f"Re-running failed and inconclusive tests from report "
+            f"{self.previous_report['id']}"
+        )
+
+    def previous_results(self, group_name: str) -> TestResults:
+        if self.previous_report:
+            return self.previous_report["results"].get(group_name, TestResults())
+        return TestResults()
+
+    def carry_over(self, group_name: str, test_ids: list[str]) -> bool:
+        """Copy results from the previous report if all are present and
+        passed (or were not applicable). Others are run or asked again."""
+        previous = self.previous_results(group_name)
+        if not test_ids or not all(
+            test_id in previous
+            and outcome_of(previous[test_id])
+            in [Outcome.PASSED, Outcome.NOT_APPLICABLE]
+            for test_id in test_ids
+        ):
+            return False
+        carried = TestResults({test_id: previous[test_id] for test_id in test_ids})
+        self.results[group_name].update(carried)
+        self.result_stream.write(group_name, carried)
+        self.carried_over[group_name].extend(test_ids)
+        return True
+
+    def skip(self, group_name: str, test_ids: list[str]):
+        """Record tests excluded by the test selection as not applicable."""
+        skipped = TestResults(
+            {test_id: TestNotApplicable("Not selected") for test_id in test_ids}
+        )
+        self.results[group_name].update(skipped)
+        self.result_stream.write(group_name, skipped)
+
     async def save_report(self, project_info: dict[str, Any]):
         report = dict(project_info)
         report["date"] = datetime.now().isoformat()
         report.update(self.config)
         report["results"] = self.results
-        filepath = os.path.join(os.path.dirname(__file__), "reports", f"{self.id}.json")
-        with open(filepath, "w") as fp:
-            json.dump(report, fp, indent=2)
+        if self.inbox_stats:
+            self.metrics["inbox-deliveries"] = {
+                **self.inbox_stats,
+                "saved-by-shared-inbox": self.inbox_stats["shared-inbox-deliveries"]
+                - self.inbox_stats["shared-inbox-requests"],
+            }
+        if self.fault_injection is not None:
+            self.metrics["fault-injection"] = self.fault_injection_metrics()
+        report["metrics"] = self.metrics
+        if self.previous_report:
+            report["carried-over"] = {
+                "report": self.previous_report["id"],
+                "results": self.carried_over,
+            }
+        if self.cassette_mode == "record":
+            self.cassette.info["actor-id"] = self.config.get("actor-id")
+            self.cassette.save(cassette_path(self.id))
+            report["cassette"] = f"/download-report/{self.id}.cassette.json.gz"
+        with open(report_path(self.id), "w") as fp:
+            fp.write(dumps(report))
         return f"/download-report/{self.id}"
 
+    def fault_injection_metrics(self) -> dict[str, Any]:
+        from rocks_testsuite.faults import result_changes
+
+        metrics: dict[str, Any] = {
+            "scale": float(self.config.get("fault-injection-scale", 1)),
+            "routes": self.fault_injection.metrics(),
+        }
+        baseline_ref = self.config.get("fault-injection-baseline")
+        baseline = load_report(baseline_ref) if baseline_ref else None
+        if baseline is not None:
+            metrics["baseline"] = baseline["id"]
+            metrics["changes"] = result_changes(baseline["results"], self.results)
+        elif baseline_ref:
+            _logger.warning("Fault injection baseline %s not found", baseline_ref)
+        return metrics
+
     async def get_project_info(self):
         answers = {}
+        if self.previous_report:
+            answers = {
+                key: self.previous_report[key]
+                for key in ["project-name", "website", "repo", "interop", "notes"]
+                if key in self.previous_report
+            }
         message = None
         while True:
             answers = await self.send_question(
@@ -144,7 +468,7 @@ class TestSession:
         if "session" not in context:
             context["session"] = self
         content = self._templates.get_template(template_name).render(context)
-        await self.websocket.send_json(
+        await self.send_json(
             {
                 "type": "notice",
                 "content": content,
@@ -152,13 +476,18 @@ class TestSession:
         )
 
     async def send_notice_str(self, content: str):
-        await self.websocket.send_json(
+        await self.send_json(
             {
                 "type": "notice",
                 "content": content,
             }
         )
 
+    async def send_json(self, payload: dict[str, Any]):
+        message = dumps(payload)
+        self.spectators.publish(message)
+        await self.websocket.send_text(message)
+
     async def send_question(
         self,
         template_name: str,
@@ -169,53 +498,90 @@ class TestSession:
             context["session"] = self
         content = self._templates.get_template(template_name).render(context)
         answers = await self.send_question_str(content)
-        _logger.info(
-            f"Question: id={self.id}, template={template_name}, answers={answers}"
-        )
+        _logger.info("Question: template=%s, answers=%s", template_name, answers)
         return answers
 
     async def send_question_str(
         self,
         content: str,
     ) -> dict[str, Any]:
-        await self.websocket.send_json(
+        await self.send_json(
             {
                 "type": "input-prompt",
                 "content": content,
                 "can-go-back": False,
             }
         )
-        answer = await self.websocket.receive_json()
+        answer = await self._answers.get()
         if "data" not in answer:
             raise HTTPException(500, detail="Missing 'data' property in answer")
         return answer["data"]
 
     async def create_actor(self) -> "TestActor":
-        # create uri from websocket?
-        url = self.websocket.base_url
-        # TODO The request info for reverse-proxy WS is not clear
-        actor_id = uuid.uuid4().hex
-        actor_uri = (
-            ("http" if url.scheme == "ws" else "https")
-            + "://"
-            + url.netloc
-            + url.path
-            + "ap/u/"
-            + self.id
-            + "/"
-            + actor_id
-        )
-        actor = TestActor(self, actor_uri)
-        self.actors[actor_id] = actor
+        actor_uri = None
+        if self.cassette_mode == "replay" and len(self.actors) < len(
+            self.cassette.actors
+        ):
+            # Reuse the recorded URIs since they appear in the recorded responses
+            actor_uri = self.cassette.actors[len(self.actors)]
+        actor = self.actors.create(actor_uri)
+        if self.cassette_mode == "record":
+            self.cassette.actors.append(actor.uri)
         return actor
 
     async def process_actor_request(self, request: Request) -> Response:
-        actor = self.actors.get(request.path_params["actor_id"])
+        if self.ended:
+            raise HTTPException(404, detail="Unknown test session")
+        actor_id = request.path_params["actor_id"]
+        if actor_id == "inbox" and not request.path_params.get("path"):
+            return await self.process_shared_inbox(request)
+        actor = self.actors.get(actor_id)
         if actor:
             return await actor.process_request(request)
         else:
             raise HTTPException(404, "Actor not found")
 
+    async def process_shared_inbox(self, request: Request) -> Response:
+        if self.shared_inbox_uri is None:
+            raise HTTPException(404, "Shared inbox not enabled")
+        if request.method != "POST":
+            raise HTTPException(405, "Shared inbox only accepts POST")
+        activity = await request.json()
+        recipients = self._shared_inbox_recipients(activity)
+        self.inbox_stats["shared-inbox-requests"] += 1
+        self.inbox_stats["shared-inbox-deliveries"] += len(recipients)
+        for actor in recipients:
+            await actor.receive(activity, request)
+        return Response("Accepted", 202)
+
+    def _shared_inbox_recipients(self, activity: dict[str, Any]) -> list["TestActor"]:
+        """Test actors an activity sent to the shared inbox is for.
+
+        Actors addressed directly (or as the object, like in a Follow) and,
+        if the activity is addressed to anything else (like Public or a
+        followers collection), the actors following the sender.
+        """
+        addressed = set()
+        for key in ["to", "cc", "bto", "bcc", "audience"]:
+            values = activity.get(key) or []
+            for value in values if isinstance(values, list) else [values]:
+                addressed.add(value.get("id") if isinstance(value, dict) else value)
+        object_ = activity.get("object")
+        if isinstance(object_, str) and self.actors.by_uri(object_):
+            addressed.add(object_)
+        recipients = {}
+        for uri in addressed:
+            actor = self.actors.by_uri(uri) if isinstance(uri, str) else None
+            if actor is not None:
+                recipients[uri] = actor
+        if addressed - recipients.keys():
+            sender = activity.get("actor")
+            if isinstance(sender, dict):
+                sender = sender.get("id")
+            for actor in self.actors.following(sender):
+                recipients[actor.uri] = actor
+        return list(recipients.values())
+
     async def run_client_tests(self):
         await self.send_notice_str(self._center("<h2>Client tests...</h2>"))
         await self.ask_questions("client-test-items")
@@ -227,6 +593,9 @@ class TestSession:
             )
         )
 
+        if self.config.get("s2s-benchmark"):
+            await self.run_s2s_benchmark()
+
         if self.config.get("testing-c2s-server"):
             await self.ask_questions(
                 "server-inbox-delivery-c2s", "server-inbox-test-items"
@@ -240,6 +609,19 @@ class TestSession:
 
         await self.ask_questions("server-inbox-accept", "server-inbox-test-items")
 
+    async def run_s2s_benchmark(self):
+        from rocks_testsuite.s2s_tests import S2SFanOutBenchmark
+
+        with log_context(test="s2s-fan-out"):
+            try:
+                await S2SFanOutBenchmark(self).run()
+            except Exception as ex:
+                _logger.error("Fan-out benchmark failed", exc_info=True)
+                await self.send_notice_str(
+                    f"<span class='result-log-fail'>Fan-out benchmark failed: "
+                    f"{ex}</span>"
+                )
+
     async def run_server_common_tests(self):
         await self.send_notice_str(self._center("<h2>Common server tests...</h2>"))
         await self.ask_questions("server-common-test-items")
@@ -251,16 +633,36 @@ class TestSession:
     async def ask_questions(
         self, question_group_name: str, result_group_name: str | None = None
     ):
-        results = self.results[result_group_name or question_group_name]
+        result_group_name = result_group_name or question_group_name
+        results = self.results[result_group_name]
         for group in self.get_questions(question_group_name):
+            question_ids = [question["id"] for question in group["questions"]]
+            if self.carry_over(result_group_name, question_ids):
+                continue
+            if not self.selection.selects_all:
+                selected = [
+                    q for q in group["questions"] if self.selection.includes(q["id"])
+                ]
+                self.skip(
+                    result_group_name,
+                    [q["id"] for q in group["questions"] if q not in selected],
+                )
+                if not selected:
+                    continue
+                group = dict(group, questions=selected)
             answer = await self.send_question("questions.jinja", group)
             results.update(answer)
-        _logger.info(f"Question group: id={self.id}, results={results}")
+            self.result_stream.write(result_group_name, TestResults(answer))
+        _logger.info("Question group: %s, results=%s", result_group_name, results)
 
 
 # Use same keys for all test actors
 @lru_cache
 def get_key_pair() -> Tuple[str, str]:
+    from cryptography.hazmat.backends import default_backend as crypto_default_backend
+    from cryptography.hazmat.primitives import serialization as crypto_serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
     pair = rsa.generate_private_key(
         backend=crypto_default_backend(), public_exponent=65537, key_size=2048
     )
@@ -280,73 +682,389 @@ def get_key_pair() -> Tuple[str, str]:
     )
 
 
+ACTIVITY_JSON = "application/activity+json"
+LD_JSON = 'application/ld+json; profile="https://www.w3.org/ns/activitystreams"'
+
+
+class StaticDocument:
+    """A JSON document serialized once and served with validators."""
+
+    __slots__ = ("body", "etag", "cache_control")
+
+    def __init__(self, document: dict[str, Any], max_age: int = 300):
+        self.body = dumps(document).encode("utf-8")
+        self.etag = '"' + sha256(self.body).hexdigest()[:32] + '"'
+        self.cache_control = f"public, max-age={max_age}"
+
+    def response(self, request: Request) -> Response:
+        accept = request.headers.get("accept", "")
+        media_type = (
+            LD_JSON
+            if "application/ld+json" in accept and ACTIVITY_JSON not in accept
+            else ACTIVITY_JSON
+        )
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept",
+        }
+        if not_modified(request, self.etag):
+            return Response(status_code=304, headers=headers)
+        headers["Content-Length"] = str(len(self.body))
+        if request.method == "HEAD":
+            return Response(None, headers=headers, media_type=media_type)
+        return Response(self.body, headers=headers, media_type=media_type)
+
+
+class ActorCollection:
+    """An OrderedCollection of ids (or activities), newest first.
+
+    Items get increasing sequence numbers, which are used as page cursors
+    (``?page=true&max_id=N`` returns the items older than N), so pages stay
+    stable while items are added. Serialized pages are cached until the
+    collection changes.
+    """
+
+    PAGE_SIZE = 50
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self._next_seq = 1
+        self._seqs: dict[str, int] = {}
+        # Sequence number -> item, and the sequence numbers in order, for
+        # bisecting to a page
+        self._items: dict[int, str | dict[str, Any]] = {}
+        self._order: list[int] = []
+        self._documents: dict[int | None, StaticDocument] = {}
+
+    def __len__(self) -> int:
+        return len(self._seqs)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._seqs
+
+    def add(self, item: str | dict[str, Any]):
+        item_id = item["id"] if isinstance(item, dict) else item
+        if item_id in self._seqs:
+            return
+        self._seqs[item_id] = self._next_seq
+        self._items[self._next_seq] = item
+        self._order.append(self._next_seq)
+        self._next_seq += 1
+        self._documents.clear()
+
+    def get(self, item_id: str) -> str | dict[str, Any] | None:
+        seq = self._seqs.get(item_id)
+        return None if seq is None else self._items[seq]
+
+    def remove(self, item_id: str):
+        seq = self._seqs.pop(item_id, None)
+        if seq is not None:
+            del self._items[seq]
+            del self._order[bisect.bisect_left(self._order, seq)]
+            self._documents.clear()
+
+    def response(self, request: Request) -> Response:
+        if request.method not in ["GET", "HEAD"]:
+            raise HTTPException(405, "Collections are read-only")
+        if request.query_params.get("page") is None:
+            key = None
+        else:
+            try:
+                key = self._cursor(
+                    int(request.query_params.get("max_id") or self._next_seq)
+                )
+            except ValueError:
+                raise HTTPException(400, "Invalid max_id")
+        document = self._documents.get(key)
+        if document is None:
+            document = self._documents[key] = StaticDocument(
+                self._collection() if key is None else self._page(key), max_age=0
+            )
+        return document.response(request)
+
+    def _cursor(self, max_id: int) -> int:
+        """The lowest item sequence number (or the next one) at or above
+        max_id. The pages are the same, so at most one page per item is
+        cached, whatever clients send."""
+        if max_id in self._items or max_id >= self._next_seq:
+            return min(max_id, self._next_seq)
+        index = bisect.bisect_left(self._order, max_id)
+        return self._order[index] if index < len(self._order) else self._next_seq
+
+    def _collection(self) -> dict[str, Any]:
+        return {
+            "@context": "https://www.w3.org/ns/activitystreams",
+            "id": self.uri,
+            "type": "OrderedCollection",
+            "totalItems": len(self),
+            "first": f"{self.uri}?page=true",
+        }
+
+    def _page(self, max_id: int) -> dict[str, Any]:
+        end = bisect.bisect_left(self._order, max_id)
+        # Newest first, with one more to tell if there's a next page
+        seqs = self._order[max(0, end - self.PAGE_SIZE - 1) : end][::-1]
+        page = {
+            "@context": "https://www.w3.org/ns/activitystreams",
+            "id": f"{self.uri}?page=true"
+            + ("" if max_id == self._next_seq else f"&max_id={max_id}"),
+            "type": "OrderedCollectionPage",
+            "partOf": self.uri,
+            "totalItems": len(self),
+            "orderedItems": [self._items[seq] for seq in seqs[: self.PAGE_SIZE]],
+        }
+        if len(seqs) > self.PAGE_SIZE:
+            page["next"] = f"{self.uri}?page=true&max_id={seqs[self.PAGE_SIZE - 1]}"
+        return page
+
+
+class ActorRegistry:
+    """The test actors of a session.
+
+    Actors are named ``actor-1``, ``actor-2``... in creation order, so
+    lookups by id or URI are list lookups. Local actors following a remote
+    actor are indexed by the remote actor's URI for shared inbox deliveries.
+    """
+
+    ID_PREFIX = "actor-"
+
+    def __init__(self, session: TestSession):
+        self._session = session
+        self._actors: list[TestActor] = []
+        # Ids that don't follow the naming, from replayed cassettes
+        self._other_ids: dict[str, int] = {}
+        self._following: dict[str, set[int]] = collections.defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._actors)
+
+    def create(self, uri: str | None = None) -> "TestActor":
+        number = len(self._actors) + 1
+        if uri is None:
+            session = self._session
+            uri = f"{session.base_url}ap/u/{session.id}/{self.ID_PREFIX}{number}"
+        elif not uri.endswith(f"/{self.ID_PREFIX}{number}"):
+            self._other_ids[uri.rsplit("/", 1)[-1]] = number - 1
+        actor = TestActor(self._session, uri, number)
+        self._actors.append(actor)
+        return actor
+
+    def get(self, actor_id: str) -> "TestActor | None":
+        index = self._other_ids.get(actor_id)
+        if index is None:
+            number = actor_id.removeprefix(self.ID_PREFIX)
+            if number == actor_id or not number.isdigit():
+                return None
+            index = int(number) - 1
+        return self._actors[index] if 0 <= index < len(self._actors) else None
+
+    def by_uri(self, uri: str) -> "TestActor | None":
+        actor = self.get(uri.rsplit("/", 1)[-1])
+        return actor if actor is not None and actor.uri == uri else None
+
+    def following(self, uri: str | None) -> list["TestActor"]:
+        """Local actors following the given actor."""
+        return [self._actors[index] for index in self._following.get(uri, ())]
+
+    def _followed(self, actor: "TestActor", uri: str, following: bool):
+        if following:
+            self._following[uri].add(actor.number - 1)
+        elif uri in self._following:
+            self._following[uri].discard(actor.number - 1)
+
+
 class TestActor:
-    _id_counter = 1
+    """A test actor of a session.
 
-    def __init__(self, session: TestSession, uri: str):
+    Actors are kept small so sessions can have very many: all of them share
+    one key pair, the profile is built when first requested and the inbox
+    and collections are created when first used.
+    """
+
+    __slots__ = (
+        "session",
+        "uri",
+        "number",
+        "delivery_listener",
+        "_inbox",
+        "_outbox",
+        "_followers",
+        "_following",
+        "_profile_document",
+    )
+
+    def __init__(self, session: TestSession, uri: str, number: int):
         self.session = session
         self.uri = uri
-        public_key, private_key = get_key_pair()
-        key_id = f"{uri}#main-key"
-        self.profile = {
+        self.number = number
+        # Called with (actor, activity, request) for each inbox delivery
+        self.delivery_listener: (
+            Callable[["TestActor", dict[str, Any], Request], None] | None
+        ) = None
+        self._inbox: list[dict[str, Any]] | None = None
+        self._outbox: ActorCollection | None = None
+        self._followers: ActorCollection | None = None
+        self._following: ActorCollection | None = None
+        self._profile_document: StaticDocument | None = None
+
+    @property
+    def key_id(self) -> str:
+        return f"{self.uri}#main-key"
+
+    @property
+    def profile(self) -> dict[str, Any]:
+        uri = self.uri
+        profile = {
             "@context": "https://www.w3.org/ns/activitystreams",
             "id": uri,
-            "preferredUsername": f"actor-{TestActor._id_counter}",
+            "preferredUsername": f"actor-{self.number}",
             "inbox": f"{uri}/inbox",
             "outbox": f"{uri}/outbox",
+            "followers": f"{uri}/followers",
+            "following": f"{uri}/following",
             "publicKey": {
-                "id": key_id,
+                "id": self.key_id,
                 "owner": uri,
-                "publicKeyPem": public_key,
+                "publicKeyPem": get_key_pair()[0],
             },
         }
-        self.auth = HttpSignatureAuth(key_id, private_key)
-        self.private_key = private_key
-        TestActor._id_counter += 1
-        self.inbox: list[dict[str, Any]] = []
+        if self.session.shared_inbox_uri:
+            profile["endpoints"] = {"sharedInbox": self.session.shared_inbox_uri}
+        return profile
+
+    @property
+    def auth(self):
+        from rocks_testsuite.signatures import HttpSignatureAuth
+
+        # Cheap, the private key is only parsed once
+        return HttpSignatureAuth(self.key_id, get_key_pair()[1])
+
+    @property
+    def inbox(self) -> list[dict[str, Any]]:
+        if self._inbox is None:
+            self._inbox = []
+        return self._inbox
+
+    @property
+    def outbox(self) -> ActorCollection:
+        if self._outbox is None:
+            self._outbox = ActorCollection(f"{self.uri}/outbox")
+        return self._outbox
+
+    @property
+    def followers(self) -> ActorCollection:
+        if self._followers is None:
+            self._followers = ActorCollection(f"{self.uri}/followers")
+        return self._followers
+
+    @property
+    def following(self) -> ActorCollection:
+        """Actors that accepted a follow from this actor."""
+        if self._following is None:
+            self._following = ActorCollection(f"{self.uri}/following")
+        return self._following
+
+    def _set_following(self, uri: str, following: bool):
+        if following:
+            self.following.add(uri)
+        else:
+            self.following.remove(uri)
+        self.session.actors._followed(self, uri, following)
 
     async def process_request(self, request: Request) -> Response:
         path = request.path_params.get("path")
         if path == "" or path is None:
-            return JSONResponse(self.profile, media_type="application/activity+json")
+            if self._profile_document is None:
+                self._profile_document = StaticDocument(self.profile)
+            return self._profile_document.response(request)
+        elif path in ["outbox", "followers", "following"]:
+            return getattr(self, path).response(request)
         elif path == "inbox":
-            activity = await request.json()
-            self.inbox.append(activity)
-            # Auto accept follow
-            if activity["type"] == "Follow":
-                async with httpx.AsyncClient() as client:
-                    # get following actor
-                    response = await client.get(
-                        activity["actor"],
-                        headers={"Accept": "application/activity+json"},
-                        timeout=None,
-                        auth=self.auth,
-                    )
-                    response.raise_for_status()
-                    following_actor = response.json()
-                    response = await self.post(
-                        following_actor["inbox"],
-                        {
-                            "@context": "https://www.w3.org/ns/activitystreams",
-                            "id": f"{self.uri}/accept-{uuid.uuid4()}",
-                            "type": "Accept",
-                            "actor": self.uri,
-                            "object": activity["id"],
-                        },
-                    )
-                    if response.is_success:
-                        _logger.info(f"Accept sent: session={self.session.id}")
-                    else:
-                        _logger.error(
-                            "Sending accept response failed: "
-                            f"{response.status_code} {response.reason_phrase}"
-                        )
+            self.session.inbox_stats["inbox-requests"] += 1
+            await self.receive(await request.json(), request)
             return Response("Accepted", 202)
         else:
             raise HTTPException(404, "Actor path not found")
 
+    async def receive(self, activity: dict[str, Any], request: Request):
+        """Handle an activity delivered to the inbox or the shared inbox."""
+        self.inbox.append(activity)
+        if self.delivery_listener:
+            self.delivery_listener(self, activity, request)
+        actor = activity.get("actor")
+        if isinstance(actor, dict):
+            actor = actor.get("id")
+        if not isinstance(actor, str):
+            return
+        activity_type = activity.get("type")
+        if activity_type == "Accept":
+            if self._accepted_follow(activity) == actor:
+                self._set_following(actor, True)
+        elif activity_type == "Undo":
+            object_ = activity.get("object")
+            if isinstance(object_, dict) and object_.get("type") == "Follow":
+                self.followers.remove(actor)
+        # Auto accept follow. The Accept is sent by the session in the
+        # background, so it stops if the session ends.
+        elif activity_type == "Follow":
+            self.session.create_task(self._accept_follow(activity, actor))
+
+    def _accepted_follow(self, accept: dict[str, Any]) -> str | None:
+        """The actor followed by the Follow an Accept refers to, if this actor
+        sent it. The Follow is looked up by id or embedded in the Accept."""
+        object_ = accept.get("object")
+        follow_id = object_.get("id") if isinstance(object_, dict) else object_
+        follow = self.outbox.get(follow_id) if isinstance(follow_id, str) else None
+        if follow is None and isinstance(object_, dict):
+            follow = object_
+        if (
+            not isinstance(follow, dict)
+            or follow.get("type") != "Follow"
+            or follow.get("actor") != self.uri
+        ):
+            return None
+        followed = follow.get("object")
+        return followed.get("id") if isinstance(followed, dict) else followed
+
+    async def _accept_follow(self, activity: dict[str, Any], actor: str):
+        try:
+            following_actor = await self.get_json(actor)
+            response = await self.post(
+                following_actor["inbox"],
+                {
+                    "@context": "https://www.w3.org/ns/activitystreams",
+                    "id": f"{self.uri}/accept-{uuid.uuid4()}",
+                    "type": "Accept",
+                    "actor": self.uri,
+                    "object": activity["id"],
+                },
+            )
+        except Exception:
+            _logger.error(
+                "Sending accept response failed",
+                exc_info=True,
+                extra={"session": self.session.id},
+            )
+            return
+        if response.is_success:
+            self.followers.add(actor)
+            _logger.info("Accept sent", extra={"session": self.session.id})
+        else:
+            _logger.error(
+                "Sending accept response failed: %s %s",
+                response.status_code,
+                response.reason_phrase,
+                extra={"session": self.session.id},
+            )
+
+    def _client(self):
+        from rocks_testsuite.transport import async_client
+
+        return async_client(self.session.transport)
+
     async def get_json(self, url: str):
-        async with httpx.AsyncClient() as client:
+        async with self._client() as client:
             response = await client.get(
                 url,
                 headers={"Accept": "application/activity+json"},
@@ -361,7 +1079,19 @@ class TestActor:
             json_data["id"] = f"{self.uri}/accept-{uuid.uuid4()}"
         if "actor" not in json_data:
             json_data["actor"] = self.uri
-        async with httpx.AsyncClient() as client:
+        self.outbox.add(json_data)
+        object_ = json_data.get("object")
+        if (
+            json_data.get("type") == "Undo"
+            and isinstance(object_, dict)
+            and object_.get("type") == "Follow"
+        ):
+            followed = object_.get("object")
+            if isinstance(followed, dict):
+                followed = followed.get("id")
+            if isinstance(followed, str):
+                self._set_following(followed, False)
+        async with self._client() as client:
             return await client.post(
                 url,
                 json=json_data,
@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+import httpx
+
+# Transport used for the outbound requests of the current test session
+_transport: ContextVar[httpx.AsyncBaseTransport | None] = ContextVar(
+    "rocks_transport", default=None
+)
+
+
+class SessionTransport(httpx.AsyncBaseTransport):
+    """A transport shared by the short-lived clients of a test session.
+
+    Clients close their transport when they exit, so closing is deferred to
+    ``close`` which the session calls when it ends.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        if isinstance(self._transport, SessionTransport):
+            await self._transport.close()
+        else:
+            await self._transport.aclose()
+
+
+def async_client(
+    transport: httpx.AsyncBaseTransport | None = None, **kwargs: Any
+) -> httpx.AsyncClient:
+    """Create a client that uses the given or the session's transport."""
+    return httpx.AsyncClient(transport=transport or _transport.get(), **kwargs)
+
+
+def current_transport() -> httpx.AsyncBaseTransport | None:
+    return _transport.get()
+
+
+@contextmanager
+def use_transport(transport: httpx.AsyncBaseTransport | None) -> Iterator[None]:
+    token = _transport.set(transport)
+    try:
+        yield
+    finally:
+        _transport.reset(token)
@@ -0,0 +1,19 @@
+import jinja2
+import pytest
+
+from rocks_testsuite import jobs, reports
+
+
+@pytest.fixture
+def report_store(tmp_path):
+    return reports.configure({"report-dir": str(tmp_path / "reports")})
+
+
+@pytest.fixture
+def session(report_store):
+    """A job session, saving its report to a temporary directory."""
+    session = jobs.JobSession(
+        jobs.Job({}), jinja2.Environment(), {}, "http://testserver/"
+    )
+    yield session
+    session.result_stream.close()
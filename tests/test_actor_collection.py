@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from rocks_testsuite import test_session
+
+URI = "https://suite.example/ap/u/s/actor-1/outbox"
+
+
+def get(collection, query: str = "page=true") -> dict:
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "query_string": query.encode(),
+            "headers": [],
+        }
+    )
+    return json.loads(collection.response(request).body)
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    monkeypatch.setattr(test_session.ActorCollection, "PAGE_SIZE", 2)
+    collection = test_session.ActorCollection(URI)
+    for n in range(1, 6):
+        collection.add(f"https://suite.example/item-{n}")
+    return collection
+
+
+def test_pages_are_newest_first(collection):
+    assert get(collection, "")["totalItems"] == 5
+    first = get(collection)
+    assert first["id"] == f"{URI}?page=true"
+    assert first["orderedItems"] == [
+        "https://suite.example/item-5",
+        "https://suite.example/item-4",
+    ]
+    second = get(collection, first["next"].partition("?")[2])
+    assert second["orderedItems"] == [
+        "https://suite.example/item-3",
+        "https://suite.example/item-2",
+    ]
+    last = get(collection, second["next"].partition("?")[2])
+    assert last["orderedItems"] == ["https://suite.example/item-1"]
+    assert "next" not in last
+
+
+def test_unknown_cursors_share_the_cached_pages(collection):
+    collection.remove("https://suite.example/item-3")
+    pages = [
+        get(collection, f"page=true&max_id={max_id}")
+        for max_id in [-5, 0, 1, 2, 3, 4, 6, 1000, 10**30]
+    ]
+    assert [page["orderedItems"][:1] for page in pages] == [
+        [],
+        [],
+        [],
+        ["https://suite.example/item-1"],
+        ["https://suite.example/item-2"],
+        ["https://suite.example/item-2"],
+        ["https://suite.example/item-5"],
+        ["https://suite.example/item-5"],
+        ["https://suite.example/item-5"],
+    ]
+    # The pages for max_id 1, 2, 4 and 6 (the next sequence number)
+    assert sorted(collection._documents) == [1, 2, 4, 6]
+
+
+def test_invalid_cursors_are_rejected(collection):
+    with pytest.raises(HTTPException) as error:
+        get(collection, "page=true&max_id=abc")
+    assert error.value.status_code == 400
+
+
+def test_walking_the_pages_returns_each_item_once(collection):
+    for n in range(6, 21):
+        collection.add(f"https://suite.example/item-{n}")
+    for n in [20, 11, 10, 1]:
+        collection.remove(f"https://suite.example/item-{n}")
+    items = []
+    page = get(collection)
+    while True:
+        items += page["orderedItems"]
+        if "next" not in page:
+            break
+        page = get(collection, page["next"].partition("?")[2])
+    assert items == [
+        f"https://suite.example/item-{n}" for n in range(19, 1, -1) if n not in [11, 10]
+    ]
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+REMOTE = "https://server.example/users/alice"
+
+
+@pytest.fixture
+def actor(session):
+    return session.actors.create()
+
+
+def receive(actor, activity):
+    asyncio.run(actor.receive(activity, None))
+
+
+def sent_follow(actor, followed=REMOTE):
+    follow = {
+        "id": f"{actor.uri}/follow-1",
+        "type": "Follow",
+        "actor": actor.uri,
+        "object": followed,
+    }
+    actor.outbox.add(follow)
+    return follow
+
+
+def accept(object_, actor=REMOTE):
+    return {
+        "id": "https://server.example/accept-1",
+        "type": "Accept",
+        "actor": actor,
+        "object": object_,
+    }
+
+
+def test_accept_of_a_sent_follow_by_id(session, actor):
+    follow = sent_follow(actor)
+    receive(actor, accept(follow["id"]))
+    assert REMOTE in actor.following
+    assert session.actors.following(REMOTE) == [actor]
+
+
+def test_accept_with_the_follow_embedded(session, actor):
+    follow = sent_follow(actor)
+    receive(actor, accept({**follow, "object": {"id": REMOTE}}))
+    assert REMOTE in actor.following
+    # Servers may not keep the Follow id
+    other = session.actors.create()
+    receive(other, accept({"type": "Follow", "actor": other.uri, "object": REMOTE}))
+    assert REMOTE in other.following
+
+
+@pytest.mark.parametrize(
+    "activity",
+    [
+        # Not a Follow of this actor
+        accept("https://server.example/follow-unknown"),
+        accept({"type": "Follow", "actor": "https://x.example/bob", "object": REMOTE}),
+        accept({"type": "Like", "actor": "{uri}", "object": REMOTE}),
+        # Accepted by another actor than the one followed
+        accept("{uri}/follow-1", actor="https://server.example/users/mallory"),
+        # Without an actor or type
+        accept("{uri}/follow-1", actor=None),
+        {"actor": REMOTE, "object": "{uri}/follow-1"},
+    ],
+)
+def test_other_accepts_are_ignored(session, actor, activity):
+    sent_follow(actor)
+    if isinstance(activity.get("object"), dict):
+        activity["object"] = {
+            k: v.format(uri=actor.uri) for k, v in activity["object"].items()
+        }
+    elif activity.get("object"):
+        activity["object"] = activity["object"].format(uri=actor.uri)
+    receive(actor, activity)
+    assert not actor.following
+    assert session.actors.following(REMOTE) == []
+    assert actor.inbox == [activity]
+
+
+def test_undo_follow_removes_the_follower(actor):
+    actor.followers.add(REMOTE)
+    receive(
+        actor,
+        {
+            "type": "Undo",
+            "actor": {"id": REMOTE},
+            "object": {"type": "Follow", "actor": REMOTE, "object": actor.uri},
+        },
+    )
+    assert REMOTE not in actor.followers
+
+
+@pytest.mark.parametrize("followed", [REMOTE, {"id": REMOTE, "type": "Person"}])
+def test_sending_undo_follow_stops_following(session, actor, monkeypatch, followed):
+    class Client:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            pass
+
+        async def post(self, url, **kwargs):
+            return None
+
+    monkeypatch.setattr(type(actor), "_client", lambda self: Client())
+    receive(actor, accept(sent_follow(actor)["id"]))
+    undo = {"type": "Undo", "object": {"type": "Follow", "object": followed}}
+    asyncio.run(actor.post(f"{REMOTE}/inbox", undo))
+    assert REMOTE not in actor.following
+    assert session.actors.following(REMOTE) == []
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from rocks_testsuite import reports
+from rocks_testsuite.app import _report_retention, app
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.delenv("TESTSUITE_CONFIG", raising=False)
+    monkeypatch.setenv("TESTSUITE_REPORT_DIR", str(tmp_path / "reports"))
+    with TestClient(app) as client:
+        yield client
+
+
+def test_job_report_of_deleted_report_is_not_found(client, session):
+    job = session.job
+    job.session = session
+    job.status = "complete"
+    client.app.state.job_manager.jobs[job.id] = job
+    response = client.get(f"/jobs/{job.id}/report")
+    assert response.status_code == 404
+    with open(reports.get_store().path(session.id), "w") as fp:
+        fp.write("{}")
+    response = client.get(f"/jobs/{job.id}/report")
+    assert response.status_code == 200
+    assert response.json() == {}
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get("/jobs/unknown/report").status_code == 404
+
+
+def test_report_retention_keeps_running_after_a_failed_pass():
+    calls = []
+
+    class FailingStore:
+        def collect(self, max_age, max_total):
+            calls.append((max_age, max_total))
+            if len(calls) == 1:
+                raise OSError("disk went away")
+            if len(calls) == 3:
+                raise asyncio.CancelledError
+            return 0
+
+    config = {"report-max-age-days": 1, "report-gc-interval": 0}
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(_report_retention(FailingStore(), config))
+    assert calls == [(86400, None)] * 3
@@ -0,0 +1,51 @@
+import asyncio
+
+from rocks_testsuite.broadcast import Broadcaster
+
+
+async def collect(subscriber) -> list[str]:
+    return [message async for message in subscriber.messages()]
+
+
+def test_spectators_get_the_history_then_new_messages():
+    async def run():
+        broadcaster = Broadcaster(buffer=10, history=2)
+        for message in ["a", "b", "c"]:
+            broadcaster.publish(message)
+        with broadcaster.subscribe() as subscriber:
+            assert len(broadcaster) == 1
+            broadcaster.publish("d")
+            broadcaster.close()
+            messages = await collect(subscriber)
+        assert len(broadcaster) == 0
+        return messages, subscriber.dropped
+
+    assert asyncio.run(run()) == (["b", "c", "d"], False)
+
+
+def test_slow_spectators_are_dropped_without_holding_up_others():
+    async def run():
+        broadcaster = Broadcaster(buffer=2, history=0)
+        with broadcaster.subscribe() as slow, broadcaster.subscribe() as fast:
+            reader = asyncio.create_task(collect(fast))
+            for message in ["a", "b", "c", "d"]:
+                broadcaster.publish(message)
+                # Let the fast spectator keep up
+                await asyncio.sleep(0)
+            assert len(broadcaster) == 1
+            broadcaster.close()
+            return await collect(slow), slow.dropped, await reader, fast.dropped
+
+    assert asyncio.run(run()) == ([], True, ["a", "b", "c", "d"], False)
+
+
+def test_spectators_of_ended_sessions_get_the_history():
+    async def run():
+        broadcaster = Broadcaster()
+        broadcaster.publish("a")
+        broadcaster.close()
+        with broadcaster.subscribe() as subscriber:
+            assert len(broadcaster) == 0
+            return await collect(subscriber)
+
+    assert asyncio.run(run()) == ["a"]
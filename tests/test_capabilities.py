@@ -0,0 +1,152 @@
+import asyncio
+
+import httpx
+import pytest
+
+from rocks_testsuite import c2s_tests, capabilities, transport
+
+ACTOR = "https://server.example/users/alice"
+PROFILE = {
+    "id": ACTOR,
+    "inbox": f"{ACTOR}/inbox",
+    "outbox": f"{ACTOR}/outbox",
+    "following": f"{ACTOR}/following",
+    "liked": f"{ACTOR}/liked",
+    "endpoints": {"uploadMedia": "https://server.example/upload"},
+}
+
+
+class Server:
+    def __init__(self):
+        self.requests: list[str] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.requests.append(url)
+        if url == f"{ACTOR}/inbox":
+            return httpx.Response(401)
+        if url == f"{ACTOR}/liked":
+            return httpx.Response(404)
+        if url == f"{ACTOR}/following":
+            raise httpx.ConnectError("Connection refused", request=request)
+        if url == "https://server.example/.well-known/nodeinfo":
+            return httpx.Response(
+                200,
+                json={
+                    "links": [
+                        {
+                            "rel": "http://nodeinfo.diaspora.software/ns/schema/2.0",
+                            "href": "/nodeinfo/2.0",
+                        },
+                        {
+                            "rel": "http://nodeinfo.diaspora.software/ns/schema/2.1",
+                            "href": "/nodeinfo/2.1",
+                        },
+                    ]
+                },
+            )
+        if url == "https://server.example/nodeinfo/2.1":
+            return httpx.Response(
+                200,
+                json={
+                    "software": {"name": "example", "version": "1.0"},
+                    "protocols": ["activitypub"],
+                },
+            )
+        return httpx.Response(200, json={})
+
+
+@pytest.fixture
+def server(session, monkeypatch):
+    monkeypatch.setattr(capabilities, "_cache", capabilities.CapabilityCache())
+    monkeypatch.setattr(capabilities, "_ttl", capabilities.DEFAULT_CAPABILITY_TTL)
+    server = Server()
+    session.transport = transport.SessionTransport(httpx.MockTransport(server))
+    return server
+
+
+def preflight(session):
+    async def run():
+        with transport.use_transport(session.transport):
+            return await capabilities.preflight(session, PROFILE, "token")
+
+    return asyncio.run(run())
+
+
+def test_probes_collections_endpoints_and_nodeinfo(session, server):
+    found = preflight(session)
+    assert found.map["collections"] == {
+        "inbox": None,
+        "outbox": True,
+        "followers": None,
+        "following": None,
+        "liked": False,
+    }
+    assert found.get("endpoints", "uploadMedia") is True
+    assert found.get("endpoints", "sharedInbox") is False
+    assert found.map["nodeinfo"] == {
+        "software": "example",
+        "version": "1.0",
+        "protocols": ["activitypub"],
+    }
+    assert not found.map["cached"]
+    assert session.metrics["capabilities"] is found.map
+
+
+def test_only_missing_capabilities_make_tests_not_applicable(session, server):
+    found = preflight(session)
+    assert found.unsupported("test_outbox_activity_like") == "Like not supported"
+    # Not in the profile, which doesn't show it's missing
+    assert found.get("collections", "followers") is None
+    # Unknown, since the probe failed
+    assert found.unsupported("test_outbox_activity_follow_undo") is None
+    assert found.unsupported("test_outbox_upload_media") is None
+    assert found.unsupported("test_outbox_activity_add_remove") is None
+    found.record("objects", "Collection", False)
+    assert found.unsupported("test_outbox_activity_add_remove") is not None
+
+
+def test_probes_are_cached_with_recorded_findings(session, server):
+    preflight(session).record("objects", "Collection", False)
+    requests = len(server.requests)
+    cached = preflight(session)
+    assert len(server.requests) == requests
+    assert cached.map["cached"]
+    assert cached.get("objects", "Collection") is False
+    # Sessions get copies, only recorded findings are shared
+    cached.map["collections"]["outbox"] = False
+    assert preflight(session).get("collections", "outbox") is True
+    # Only the server config sets how long probes are reused
+    session.config["capability-cache-ttl"] = -1
+    assert preflight(session).map["cached"]
+    capabilities.configure({"capability-cache-ttl": -1})
+    assert not preflight(session).map["cached"]
+
+
+def test_recording_sessions_probe_again(session, server):
+    preflight(session)
+    session.cassette_mode = "record"
+    assert not preflight(session).map["cached"]
+
+
+@pytest.mark.parametrize(
+    "status, recorded", [(400, False), (501, False), (403, None), (429, None)]
+)
+def test_only_unsupported_responses_record_missing_collections(
+    session, status, recorded
+):
+    class Client:
+        async def post_to_outbox(self, activity):
+            request = httpx.Request("POST", f"{ACTOR}/outbox")
+            response = httpx.Response(status, request=request)
+            raise httpx.HTTPStatusError("", request=request, response=response)
+
+    tests = c2s_tests.C2SServerTests(session, {})
+    tests._apclient = Client()
+    tests._capabilities = capabilities.Capabilities(session, ACTOR, {})
+    if recorded is None:
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(tests.test_outbox_activity_add_remove())
+    else:
+        asyncio.run(tests.test_outbox_activity_add_remove())
+    assert tests._capabilities.get("objects", "Collection") is recorded
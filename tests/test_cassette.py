@@ -0,0 +1,80 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+
+from rocks_testsuite import cassette, transport
+
+ACTOR = "https://server.example/users/alice"
+
+
+class Server:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/avatar.png":
+            return httpx.Response(200, content=b"\x89PNG\xff")
+        self.count += 1
+        return httpx.Response(
+            200,
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/json"},
+            content=gzip.compress(b'{"count": %d}' % self.count),
+        )
+
+
+def fetch(session_transport, *urls: str) -> list[httpx.Response]:
+    async def run():
+        with transport.use_transport(session_transport):
+            async with transport.async_client() as client:
+                responses = [await client.get(url) for url in urls]
+        await session_transport.close()
+        return responses
+
+    return asyncio.run(run())
+
+
+def test_recorded_interactions_are_replayed(tmp_path):
+    server = Server()
+    recorded = cassette.Cassette(actors=["https://suite.example/actor-1"])
+    responses = fetch(
+        cassette.RecordingTransport(recorded, httpx.MockTransport(server)),
+        ACTOR,
+        ACTOR,
+        "https://server.example/avatar.png",
+    )
+    assert [r.json() for r in responses[:2]] == [{"count": 1}, {"count": 2}]
+    assert "content-encoding" not in responses[0].headers
+    path = str(tmp_path / "session.cassette.json.gz")
+    recorded.save(path)
+
+    loaded = cassette.Cassette.load(path)
+    assert loaded.actors == ["https://suite.example/actor-1"]
+    replayed = fetch(
+        cassette.ReplayTransport(loaded),
+        ACTOR,
+        ACTOR,
+        # Used up, so the last recorded response is repeated
+        ACTOR,
+        "https://server.example/avatar.png",
+    )
+    assert [r.json() for r in replayed[:3]] == [
+        {"count": 1},
+        {"count": 2},
+        {"count": 2},
+    ]
+    assert replayed[3].content == b"\x89PNG\xff"
+    assert server.count == 2
+
+
+def test_unrecorded_requests_fail():
+    with pytest.raises(httpx.ConnectError, match="No recorded interaction"):
+        fetch(cassette.ReplayTransport(cassette.Cassette()), ACTOR)
+
+
+def test_unknown_cassette_versions_are_rejected(tmp_path):
+    path = tmp_path / "old.cassette.json.gz"
+    path.write_bytes(gzip.compress(b'{"version": 0}'))
+    with pytest.raises(ValueError, match="Unsupported cassette version"):
+        cassette.Cassette.load(str(path))
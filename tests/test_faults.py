@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+import pytest
+
+from rocks_testsuite import faults, result
+
+
+def rules(*specs, **config):
+    return faults.parse_rules({"fault-injection": list(specs), **config})
+
+
+def test_rules_match_routes_and_methods():
+    [outbox, anything] = rules(
+        {"route": "*/outbox*", "methods": ["post"]}, {"latency": 0.1}
+    )
+    assert outbox.methods == {"POST"}
+    assert outbox.matches(httpx.Request("POST", "https://a.example/u/1/outbox"))
+    assert not outbox.matches(httpx.Request("GET", "https://a.example/u/1/outbox"))
+    assert not outbox.matches(httpx.Request("POST", "https://a.example/u/1/inbox"))
+    assert anything.matches(httpx.Request("DELETE", "https://b.example/"))
+
+
+@pytest.mark.parametrize(
+    "spec, message",
+    [
+        ("slow", "must be objects"),
+        ({"methods": "GET"}, "'methods' must be a list"),
+        ({"methods": [1]}, "'methods' must be a list"),
+        ({"route": ["*"]}, "'route' must be a URL pattern"),
+        ({"latency": "1s"}, "'latency' must be seconds"),
+        ({"latency": {"distribution": "pareto"}}, "Unknown latency distribution"),
+        ({"error-rate": 2}, "'error-rate' must be between 0 and 1"),
+        ({"drop-rate": None}, "Invalid fault injection rule"),
+    ],
+)
+def test_invalid_rules_are_rejected(spec, message):
+    with pytest.raises(ValueError, match=message):
+        rules(spec)
+
+
+def test_invalid_rule_lists_and_scales():
+    with pytest.raises(ValueError, match="must be a list"):
+        faults.parse_rules({"fault-injection": {"route": "*"}})
+    with pytest.raises(ValueError, match="can't be negative"):
+        rules({"route": "*"}, **{"fault-injection-scale": -1})
+    assert faults.parse_rules({}) == []
+
+
+def test_scale_applies_to_all_rules():
+    [rule] = rules(
+        {"latency": 0.2, "bandwidth": 1000, "error-rate": 0.4, "drop-rate": 0.1},
+        **{"fault-injection-scale": 3},
+    )
+    assert rule.latency.mean == pytest.approx(0.6)
+    assert rule.bandwidth == pytest.approx(1000 / 3)
+    assert rule.error_rate == 1.0
+    assert rule.drop_rate == pytest.approx(0.3)
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    def __init__(self):
+        self.requests = 0
+
+    async def handle_async_request(self, request):
+        self.requests += 1
+        return httpx.Response(200, text="ok", request=request)
+
+
+def outcomes(seed, count: int = 40) -> tuple[list[str], list[dict], int]:
+    stub = StubTransport()
+    transport = faults.FaultInjectionTransport(
+        rules({"route": "*", "error-rate": 0.3, "drop-rate": 0.2}), stub, seed
+    )
+
+    async def run():
+        results = []
+        for _ in range(count):
+            request = httpx.Request("GET", "https://a.example/")
+            try:
+                response = await transport.handle_async_request(request)
+                results.append(str(response.status_code))
+            except httpx.ReadError:
+                results.append("dropped")
+        return results
+
+    return asyncio.run(run()), transport.metrics(), stub.requests
+
+
+def test_seeded_faults_are_repeatable():
+    first, metrics, sent = outcomes(seed=7)
+    assert outcomes(seed=7)[0] == first
+    assert outcomes(seed=8)[0] != first
+    [rule_metrics] = metrics
+    assert rule_metrics["requests"] == 40
+    assert rule_metrics["errors"] == first.count("503") > 0
+    assert rule_metrics["drops"] == first.count("dropped") > 0
+    # Injected errors aren't sent, dropped requests are
+    assert sent == 40 - rule_metrics["errors"]
+
+
+def test_unmatched_requests_pass_through():
+    stub = StubTransport()
+    transport = faults.FaultInjectionTransport(
+        rules({"route": "*/inbox", "error-rate": 1}), stub, 1
+    )
+
+    async def send(url):
+        return await transport.handle_async_request(httpx.Request("GET", url))
+
+    assert asyncio.run(send("https://a.example/outbox")).status_code == 200
+    assert asyncio.run(send("https://a.example/inbox")).status_code == 503
+    assert stub.requests == 1
+
+
+def test_result_changes():
+    baseline = {
+        "c2s": result.TestResults({"a": True, "b": True, "c": False}),
+        "s2s": result.TestResults({"d": True}),
+    }
+    results = {
+        "c2s": result.TestResults(
+            {"a": True, "b": result.TestFailure("timeout"), "e": True}
+        ),
+        "s2s": result.TestResults({"d": True}),
+    }
+    assert faults.result_changes(baseline, results) == {
+        "c2s": {
+            "b": {"baseline": "passed", "result": "failed"},
+            "c": {"baseline": "failed", "result": None},
+            "e": {"baseline": None, "result": "passed"},
+        }
+    }
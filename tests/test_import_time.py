@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Imported where they are used, or during the startup warm-up
+DEFERRED_MODULES = [
+    "httpx",
+    "cryptography",
+    "coloredlogs",
+    "uvicorn",
+    "rocks_testsuite.c2s_tests",
+    "rocks_testsuite.s2s_tests",
+    "rocks_testsuite.signatures",
+]
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import microseconds by module, from a fresh interpreter."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(__file__)),
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.fixture(scope="module")
+def app_import_times():
+    return import_times("rocks_testsuite.app")
+
+
+def test_app_is_imported(app_import_times):
+    assert "rocks_testsuite.app" in app_import_times
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_heavy_modules_are_deferred(app_import_times, module):
+    assert module not in app_import_times
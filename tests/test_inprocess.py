@@ -0,0 +1,112 @@
+import asyncio
+import textwrap
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from rocks_testsuite import inprocess
+
+SUITE_URL = "http://suite.test/"
+
+TARGET_APP = """
+import contextlib
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+events = []
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    events.append("startup")
+    yield {"greeting": "hello"}
+    events.append("shutdown")
+
+
+async def home(request):
+    return PlainTextResponse(f"{request.state.greeting} from {request.url.hostname}")
+
+
+async def fail(request):
+    raise RuntimeError("broken")
+
+
+app = Starlette(
+    routes=[Route("/", home), Route("/fail", fail)], lifespan=lifespan
+)
+
+
+def wsgi_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"wsgi " + environ["PATH_INFO"].encode()]
+"""
+
+
+async def suite_home(request):
+    return PlainTextResponse("suite")
+
+
+suite = Starlette(routes=[Route("/", suite_home)])
+
+
+@pytest.fixture
+def target_module(tmp_path, monkeypatch):
+    (tmp_path / "inprocess_target.py").write_text(textwrap.dedent(TARGET_APP))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return inprocess.load_app("inprocess_target:events")
+
+
+def fetch(config, *urls):
+    async def run():
+        async with inprocess.serve(suite, config):
+            transport = inprocess.target_transport(SUITE_URL)
+            async with httpx.AsyncClient(transport=transport) as client:
+                return [await client.get(url) for url in urls]
+
+    return asyncio.run(run())
+
+
+def test_requests_go_to_the_app_under_test_or_the_suite(target_module):
+    responses = fetch(
+        {"target-app": "inprocess_target:app"},
+        "https://server.example/",
+        SUITE_URL,
+        "https://server.example/fail",
+    )
+    assert [r.text for r in responses[:2]] == ["hello from server.example", "suite"]
+    assert responses[2].status_code == 500
+    assert target_module == ["startup", "shutdown"]
+    assert inprocess.target_transport(SUITE_URL) is None
+
+
+def test_wsgi_apps_are_adapted(target_module):
+    [response] = fetch(
+        {"target-app": "inprocess_target:wsgi_app"}, "https://server.example/x"
+    )
+    assert response.text == "wsgi /x"
+
+
+def test_without_a_target_app_nothing_is_served():
+    async def run():
+        async with inprocess.serve(suite, {}):
+            return inprocess.target_transport(SUITE_URL)
+
+    assert asyncio.run(run()) is None
+    with pytest.raises(RuntimeError):
+        inprocess.suite_transport()
+
+
+@pytest.mark.parametrize("path", ["inprocess_target", ":app", "os:"])
+def test_invalid_app_paths(path):
+    with pytest.raises(ValueError):
+        inprocess.load_app(path)
+
+
+def test_unknown_interfaces_are_rejected():
+    with pytest.raises(ValueError, match="Unknown app interface"):
+        inprocess.as_asgi(suite, "rsgi")
@@ -0,0 +1,62 @@
+import pytest
+
+from rocks_testsuite.jobs import RUN_CONFIG_KEYS, run_config, validate_spec
+
+SPEC = {
+    "testing-c2s-server": True,
+    "actor-id": "https://example.com/actor",
+    "auth-token": "token",
+    "answers": {},
+    "project-info": {"project-name": "x", "website": "w", "repo": "r"},
+}
+
+
+def test_valid_spec():
+    assert validate_spec(dict(SPEC, **{"select-tests": "outbox:*"}))
+
+
+@pytest.mark.parametrize(
+    "key",
+    [
+        "upload-media-file",
+        "job-workers",
+        "rate-limit-per-second",
+        "report-dir",
+        "target-app",
+        "capability-cache-ttl",
+    ],
+)
+def test_server_settings_are_rejected(key):
+    with pytest.raises(ValueError, match=key):
+        validate_spec(dict(SPEC, **{key: "x"}))
+
+
+def test_invalid_specs():
+    for spec in [
+        [],
+        dict(SPEC, **{"testing-c2s-server": False}),
+        {k: v for k, v in SPEC.items() if k != "actor-id"},
+        dict(SPEC, **{"project-info": {"project-name": "x"}}),
+        dict(SPEC, **{"upload-media-size": 10**12}),
+        dict(SPEC, **{"fault-injection": [{"error-rate": 2}]}),
+        dict(SPEC, **{"fault-injection": [{"methods": "GET"}]}),
+        dict(SPEC, **{"s2s-benchmark": True}),
+        dict(SPEC, **{"pagination-probe-size": 0}),
+        dict(SPEC, **{"pagination-probe-max-pages": 10**9}),
+        dict(SPEC, **{"pagination-probe-concurrency": "10"}),
+        dict(SPEC, **{"s2s-benchmark-actors": -1}),
+        dict(SPEC, **{"s2s-benchmark-concurrency": True}),
+    ]:
+        with pytest.raises(ValueError):
+            validate_spec(spec)
+
+
+def test_run_config_only_takes_per_run_settings():
+    config = run_config(
+        {"job-workers": 2, "upload-media-file": "/srv/media.png"},
+        dict(SPEC, **{"upload-media-file": "/etc/passwd", "s2s-benchmark": True}),
+    )
+    assert config["upload-media-file"] == "/srv/media.png"
+    assert config["s2s-benchmark"] is True
+    assert "auth-token" not in config and "answers" not in config
+    assert set(config) <= set(RUN_CONFIG_KEYS) | {"job-workers", "upload-media-file"}
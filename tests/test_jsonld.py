@@ -0,0 +1,103 @@
+from rocks_testsuite import jsonld
+
+AS = "https://www.w3.org/ns/activitystreams"
+ACTOR = "https://server.example/users/alice"
+NOTE = "https://server.example/notes/1"
+
+PLAIN = {
+    "@context": AS,
+    "id": "https://server.example/activities/1",
+    "type": "Create",
+    "actor": ACTOR,
+    "to": ["https://www.w3.org/ns/activitystreams#Public"],
+    "object": {"id": NOTE, "type": "Note", "content": "Hello"},
+}
+
+
+def test_compacted_with_prefixes_is_equivalent():
+    document = {
+        "@context": [AS, {"as": AS + "#"}],
+        "@id": "https://server.example/activities/1",
+        "@type": "as:Create",
+        "as:actor": {"id": ACTOR},
+        "to": "as:Public",
+        "object": {"@id": NOTE, "type": "Note", "as:content": "Hello"},
+    }
+    for doc in [PLAIN, document]:
+        assert jsonld.id_of(doc) == "https://server.example/activities/1"
+        assert jsonld.has_type(doc, "Create")
+        assert jsonld.ids(doc, "actor") == [ACTOR]
+        assert jsonld.ids(doc, "to") == [jsonld.AS_PUBLIC]
+        assert jsonld.id_list(doc, "object") == [NOTE]
+        [note] = jsonld.values(doc, "object")
+        assert jsonld.literal(note, "content") == "Hello"
+        assert note[AS + "#content"] == [{"@value": "Hello"}]
+
+
+def test_expanded_documents_are_equivalent():
+    document = [
+        {
+            "@id": "https://server.example/activities/1",
+            "@type": [AS + "#Create"],
+            AS + "#actor": [{"@id": ACTOR}],
+            AS + "#to": [{"@id": AS + "#Public"}],
+        }
+    ]
+    assert jsonld.id_of(document) == "https://server.example/activities/1"
+    assert jsonld.has_type(document, "Create")
+    assert jsonld.ids(document, "actor") == [ACTOR]
+    assert jsonld.same_ids(jsonld.ids(document, "to"), ["Public"])
+
+
+def test_documents_without_a_context_use_activitystreams():
+    document = {"type": "Note", "content": "Hi", "name": None}
+    assert jsonld.has_type(document, "Note")
+    assert jsonld.literal(document, "content") == "Hi"
+    assert not jsonld.has(document, "name")
+
+
+def test_language_maps_and_lists():
+    document = {
+        "@context": AS,
+        "contentMap": {"en": "Hello", "fr": "Bonjour"},
+        "orderedItems": {"@list": ["https://a.example/2", "https://a.example/1"]},
+    }
+    assert jsonld.values(document, "content") == [
+        {"@value": "Hello", "@language": "en"},
+        {"@value": "Bonjour", "@language": "fr"},
+    ]
+    assert jsonld.id_list(document, "items") == [
+        "https://a.example/2",
+        "https://a.example/1",
+    ]
+
+
+def test_security_context_terms():
+    document = {
+        "@context": [AS, "https://w3id.org/security/v2"],
+        "id": ACTOR,
+        "publicKey": {"id": ACTOR + "#main-key", "owner": ACTOR},
+    }
+    [key] = jsonld.values(document, "https://w3id.org/security#publicKey")
+    assert key["@id"] == ACTOR + "#main-key"
+
+
+def test_expansions_are_memoized_by_content():
+    jsonld._expand_json.cache_clear()
+    document = dict(PLAIN)
+    assert jsonld.ids(document, "actor") == [ACTOR]
+    assert jsonld.ids(document, "to") == [jsonld.AS_PUBLIC]
+    assert jsonld.has_type(document, "Create")
+    info = jsonld._expand_json.cache_info()
+    assert (info.misses, info.hits) == (1, 2)
+    # Changed documents are expanded again
+    document["actor"] = "https://server.example/users/bob"
+    assert jsonld.ids(document, "actor") == ["https://server.example/users/bob"]
+    assert jsonld._expand_json.cache_info().misses == 2
+
+
+def test_large_documents_are_not_memoized(monkeypatch):
+    monkeypatch.setattr(jsonld, "MAX_MEMOIZED_JSON", 10)
+    jsonld._expand_json.cache_clear()
+    assert jsonld.ids(PLAIN, "actor") == [ACTOR]
+    assert jsonld._expand_json.cache_info().currsize == 0
@@ -0,0 +1,106 @@
+import logging
+import logging.handlers
+import queue
+import threading
+
+from rocks_testsuite import logs
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages: list[tuple[str, str]] = []
+
+    def emit(self, record):
+        self.messages.append((threading.current_thread().name, self.format(record)))
+
+
+def log_through_queue(*records: logging.LogRecord) -> list[tuple[str, str]]:
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = RecordingHandler()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    queue_handler = logs._QueueHandler(log_queue)
+    listener.start()
+    try:
+        for record in records:
+            queue_handler.handle(record)
+    finally:
+        listener.stop()
+    return handler.messages
+
+
+def make_record(msg, *args):
+    return logging.LogRecord("rocks.test", logging.INFO, __file__, 1, msg, args, None)
+
+
+def test_immutable_arguments_are_passed_to_the_writer_thread():
+    url = "https://server.example/actor"
+    record = logs._QueueHandler(None).prepare(make_record("%s %d %.1f", url, 2, 0.5))
+    assert record.args[0] is url
+    assert record.args[1:] == (2, 0.5)
+    assert record.msg == "%s %d %.1f"
+
+
+def test_messages_are_formatted_on_the_writer_thread():
+    [(thread, message)] = log_through_queue(make_record("Got %d items", 3))
+    assert message == "Got 3 items"
+    assert thread != threading.current_thread().name
+
+
+def test_mutable_arguments_are_captured_when_logged():
+    items = ["a"]
+    record = make_record("Items: %s %r", items, items)
+    prepared = logs._QueueHandler(None).prepare(record)
+    items.append("b")
+    assert [message for _, message in log_through_queue(prepared)] == [
+        "Items: ['a'] ['a']"
+    ]
+
+
+def test_mapping_arguments():
+    state = {"count": 1}
+    prepared = logs._QueueHandler(None).prepare(
+        make_record("%(name)s: %(state)s", {"name": "rocks", "state": state})
+    )
+    state["count"] = 2
+    assert prepared.args["name"] == "rocks"
+    assert prepared.getMessage() == "rocks: {'count': 1}"
+
+
+def test_non_string_messages_and_exceptions():
+    try:
+        raise ValueError("bad")
+    except ValueError as ex:
+        record = make_record(ex)
+        record.exc_info = (type(ex), ex, ex.__traceback__)
+    prepared = logs._QueueHandler(None).prepare(record)
+    assert prepared.msg == "bad"
+    assert prepared.exc_info is None
+    assert "ValueError: bad" in prepared.exc_text
+
+
+def test_only_the_conversions_used_are_made():
+    class Counted:
+        calls: list[str] = []
+
+        def __str__(self):
+            self.calls.append("str")
+            return "text"
+
+        def __repr__(self):
+            self.calls.append("repr")
+            return "representation"
+
+    prepared = logs._QueueHandler(None).prepare(make_record("%r", Counted()))
+    assert Counted.calls == ["repr"]
+    assert prepared.getMessage() == "representation"
+
+
+def test_child_loggers_share_the_configured_rate_limit():
+    limit = logs.RateLimitFilter({"rocks.session": {"per-second": 1}})
+    records = [
+        logging.LogRecord(name, logging.INFO, __file__, 1, "x", (), None)
+        for name in ["rocks.session.a", "rocks.session.b", "rocks.other"]
+    ]
+    assert [limit.filter(record) for record in records] == [True, False, True]
+    assert limit.dropped == 1
@@ -0,0 +1,82 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from rocks_testsuite import media
+from rocks_testsuite.c2s_tests import C2SServerTests
+from rocks_testsuite.result import Outcome, outcome_of
+
+
+class FakeSession:
+    def __init__(self, config):
+        self.config = config
+        self.metrics = {}
+
+
+class FakeClient:
+    uri = "https://example.com/actor"
+    profile = {"endpoints": {"uploadMedia": "https://example.com/upload"}}
+
+    def __init__(self):
+        self.uploads = []
+
+    async def upload_media(self, upload):
+        self.uploads.append((upload.payload.path, upload.payload.size))
+        async for _ in upload.stream():
+            pass
+        return httpx.Response(500)
+
+
+def run_upload_test(config):
+    tests = C2SServerTests(FakeSession(config), {})
+    tests._apclient = FakeClient()
+    results = asyncio.run(tests.test_outbox_upload_media())
+    return results, tests._apclient.uploads
+
+
+@pytest.fixture(autouse=True)
+def no_configured_file():
+    yield
+    media.configure({})
+
+
+def test_upload_media_size_is_limited():
+    assert media.upload_media_size() == media.DEFAULT_UPLOAD_MEDIA_SIZE
+    assert media.upload_media_size("1024") == 1024
+    for value in [media.MAX_UPLOAD_MEDIA_SIZE + 1, -1, "big", [1]]:
+        with pytest.raises(ValueError):
+            media.upload_media_size(value)
+
+
+def test_oversized_payloads_are_not_generated(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    with pytest.raises(ValueError):
+        media.MappedPayload(size=media.MAX_UPLOAD_MEDIA_SIZE + 1)
+    assert os.listdir(tmp_path) == []
+
+
+def test_sessions_cant_choose_the_uploaded_file():
+    results, uploads = run_upload_test(
+        {"upload-media-file": __file__, "upload-media-size": 10}
+    )
+    [(path, size)] = uploads
+    assert path != __file__
+    assert size == 10
+    assert not os.path.exists(path)
+
+
+def test_the_operator_can_choose_the_uploaded_file():
+    media.configure({"upload-media-file": __file__})
+    _, uploads = run_upload_test({})
+    assert uploads == [(__file__, os.path.getsize(__file__))]
+
+
+def test_oversized_uploads_are_inconclusive():
+    results, uploads = run_upload_test(
+        {"upload-media-size": media.MAX_UPLOAD_MEDIA_SIZE + 1}
+    )
+    assert uploads == []
+    assert set(results) == set(C2SServerTests.TESTS["test_outbox_upload_media"])
+    assert all(outcome_of(r) == Outcome.INCONCLUSIVE for r in results.values())
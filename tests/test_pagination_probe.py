@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from rocks_testsuite import pagination_probe
+
+OUTBOX = "https://server.example/users/alice/outbox"
+PAGE_SIZE = 10
+
+
+class FakeResponse:
+    def __init__(self, location: str):
+        self.headers = {"Location": location}
+
+
+class FakeClient:
+    """An actor whose outbox is paged newest first, PAGE_SIZE items a page."""
+
+    def __init__(self, items: int = 0, loop: bool = False):
+        self.profile = {"id": "https://server.example/users/alice", "outbox": OUTBOX}
+        self.items = [f"{OUTBOX}/{n}" for n in range(items)]
+        self.loop = loop
+        self.fetched: list[str] = []
+
+    async def post_to_outbox(self, activity):
+        self.items.append(f"{OUTBOX}/{len(self.items)}")
+        return FakeResponse(self.items[-1])
+
+    async def get_json(self, url):
+        self.fetched.append(url)
+        if url == OUTBOX:
+            return {
+                "type": "OrderedCollection",
+                "totalItems": len(self.items),
+                "first": f"{OUTBOX}?page=0",
+            }
+        index = int(url.rpartition("=")[2])
+        start = index * PAGE_SIZE
+        page = {
+            "type": "OrderedCollectionPage",
+            "orderedItems": self.items[::-1][start : start + PAGE_SIZE],
+        }
+        if self.loop:
+            page["next"] = f"{OUTBOX}?page=0"
+        elif start + PAGE_SIZE < len(self.items):
+            page["next"] = f"{OUTBOX}?page={index + 1}"
+        return page
+
+
+def probe(session, client, **config):
+    session.config.update(config)
+    asyncio.run(pagination_probe.PaginationProbe(session, client).run())
+    return session.metrics.get("pagination-probe")
+
+
+def test_seeds_and_walks_the_outbox(session):
+    client = FakeClient(items=5)
+    metrics = probe(session, client, **{"pagination-probe-size": 25})
+    assert len(client.items) == 25
+    assert metrics["seeded"] == 20
+    assert metrics["seed-failures"] == 0
+    assert metrics["items"] == 25
+    assert metrics["pages"] == 3
+    assert metrics["page-size"]["max"] == PAGE_SIZE
+    assert not metrics["truncated"]
+    assert [point["offset"] for point in metrics["curve"]] == [0, 10, 20]
+
+
+def test_walks_stop_at_loops_and_the_page_limit(session):
+    metrics = probe(
+        session, FakeClient(items=30, loop=True), **{"pagination-probe-size": 0}
+    )
+    assert metrics["pages"] == 1
+    client = FakeClient(items=100)
+    metrics = probe(
+        session,
+        client,
+        **{"pagination-probe-size": 0, "pagination-probe-max-pages": 3},
+    )
+    assert metrics["truncated"]
+    assert metrics["pages"] == 3
+    # The collection is fetched for its size, then for the walk
+    assert len(client.fetched) == 2 + 3
+
+
+def test_collections_missing_from_the_profile_are_skipped(session):
+    metrics = probe(
+        session, FakeClient(), **{"pagination-probe-collection": "followers"}
+    )
+    assert metrics is None
+    assert "no followers collection" in session.job.events[-1]["content"]
+
+
+def test_latency_growing_with_depth():
+    pages = [(0, 0, 0.01)] + [(n * 10, 10, 0.01 * (n + 1)) for n in range(8)]
+    metrics = pagination_probe._metrics(pages)
+    assert metrics["depth-ratio"] == pytest.approx(0.075 / 0.015)
+    assert metrics["latency-grows-with-depth"]
+    assert metrics["seconds-per-1000-items"] == pytest.approx(1.0)
+    flat = pagination_probe._metrics([(0, 0, 0.01)] + [(n, 1, 0.01) for n in range(8)])
+    assert not flat["latency-grows-with-depth"]
@@ -0,0 +1,187 @@
+import asyncio
+import email.utils
+import time
+import types
+
+import httpx
+import pytest
+
+from rocks_testsuite import ratelimit
+
+
+class FakeClock:
+    """Monotonic time that only advances by (instant) sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(
+        ratelimit,
+        "time",
+        types.SimpleNamespace(monotonic=clock.monotonic, time=time.time),
+    )
+    monkeypatch.setattr(
+        ratelimit,
+        "asyncio",
+        types.SimpleNamespace(sleep=clock.sleep, Lock=asyncio.Lock),
+    )
+    return clock
+
+
+def response(status: int = 200, **headers: str) -> httpx.Response:
+    return httpx.Response(
+        status, headers={k.replace("_", "-"): v for k, v in headers.items()}
+    )
+
+
+def acquire(limiter: ratelimit.HostLimiter, count: int = 1) -> list[float]:
+    async def run():
+        return [round(await limiter.acquire(), 3) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_bursts_then_paces_requests(clock):
+    limiter = ratelimit.HostLimiter(rate=2, burst=2)
+    assert acquire(limiter, 4) == [0, 0, 0.5, 0.5]
+    clock.now += 10
+    # Refilled up to the burst size only
+    assert acquire(limiter, 3) == [0, 0, 0.5]
+
+
+def test_429_halves_the_rate_and_waits_for_retry_after(clock):
+    limiter = ratelimit.HostLimiter(rate=4, burst=4)
+    limiter.update(response(429, retry_after="3"))
+    assert limiter.rate == 2
+    assert acquire(limiter) == [3]
+    limiter.update(response(429))
+    assert limiter.rate == 1
+    # Without Retry-After, one request interval
+    assert acquire(limiter) == [1]
+    for _ in range(10):
+        limiter.update(response())
+    assert limiter.rate == 4
+
+
+def test_huge_delays_are_capped(clock):
+    limiter = ratelimit.HostLimiter(rate=4, burst=4)
+    limiter.update(response(429, retry_after=str(10**9)))
+    assert acquire(limiter) == [ratelimit.MAX_RETRY_AFTER]
+    limiter.update(response(ratelimit_remaining="0", ratelimit_reset=str(10**8)))
+    assert acquire(limiter) == [ratelimit.MAX_RETRY_AFTER]
+
+
+def test_the_rate_is_never_below_the_minimum(clock):
+    limiter = ratelimit.HostLimiter(rate=1, burst=1)
+    for _ in range(10):
+        limiter.update(response(429, retry_after="0"))
+    assert limiter.rate == ratelimit.MIN_RATE
+
+
+def test_rate_limit_headers_pace_requests(clock):
+    limiter = ratelimit.HostLimiter(rate=10, burst=1)
+    limiter.update(response(ratelimit_remaining="5", ratelimit_reset="10"))
+    assert limiter.rate == 0.5
+    limiter.update(response(x_ratelimit_remaining="0", x_ratelimit_reset="7"))
+    assert acquire(limiter) == [7]
+
+
+def test_delays_in_seconds_dates_and_timestamps():
+    assert ratelimit._parse_delay(" 12 ") == 12
+    assert ratelimit._parse_delay(str(time.time() + 30)) == pytest.approx(30, abs=2)
+    http_date = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert ratelimit._parse_delay(http_date) == pytest.approx(60, abs=2)
+    assert ratelimit._parse_delay("2000-01-01T00:00:00Z") < 0
+    assert ratelimit._parse_delay("soon") is None
+    assert ratelimit._retry_after(httpx.Headers({"Retry-After": "soon"})) is None
+    assert ratelimit._retry_after(httpx.Headers({"Retry-After": "-5"})) == 0
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    def __init__(self, *responses: httpx.Response):
+        self.responses = list(responses)
+        self.requests: list[httpx.Request] = []
+
+    async def handle_async_request(self, request):
+        self.requests.append(request)
+        return self.responses.pop(0)
+
+
+def send(
+    transport, request: httpx.Request
+) -> tuple[httpx.Response, ratelimit.ThrottleStats]:
+    async def run():
+        with ratelimit.throttle_stats() as stats:
+            return await transport.handle_async_request(request), stats
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    limiters = ratelimit.RateLimiters(rate=10, burst=10, max_retries=2)
+    monkeypatch.setattr(ratelimit, "_limiters", limiters)
+    return limiters
+
+
+def test_transport_retries_429_responses(clock, limiters):
+    stub = StubTransport(response(429, retry_after="2"), response(200))
+    result, stats = send(
+        ratelimit.RateLimitedTransport(stub),
+        httpx.Request("POST", "https://server.example/inbox", json={}),
+    )
+    assert result.status_code == 200
+    assert len(stub.requests) == 2
+    assert stats.responses_429 == 1
+    assert stats.seconds == pytest.approx(2)
+    assert limiters.get("server.example").rate == 5.5
+
+
+def test_transport_gives_up_after_the_retries(clock, limiters):
+    stub = StubTransport(*(response(429, retry_after="1") for _ in range(3)))
+    result, stats = send(
+        ratelimit.RateLimitedTransport(stub),
+        httpx.Request("GET", "https://server.example/outbox"),
+    )
+    assert result.status_code == 429
+    assert len(stub.requests) == 3
+    assert stats.responses_429 == 3
+
+
+def test_transport_returns_long_retry_after_429s(clock, limiters):
+    retry_after = str(ratelimit.MAX_RETRY_AFTER + 1)
+    stub = StubTransport(response(429, retry_after=retry_after))
+    result, _ = send(
+        ratelimit.RateLimitedTransport(stub),
+        httpx.Request("GET", "https://server.example/outbox"),
+    )
+    assert result.status_code == 429
+    assert len(stub.requests) == 1
+
+
+def test_transport_does_not_retry_streamed_bodies(clock, limiters):
+    async def body():
+        yield b"data"
+
+    stub = StubTransport(response(429, retry_after="1"))
+    result, _ = send(
+        ratelimit.RateLimitedTransport(stub),
+        httpx.Request("POST", "https://server.example/upload", content=body()),
+    )
+    assert result.status_code == 429
+    assert len(stub.requests) == 1
+
+
+def test_hosts_are_limited_separately(clock, limiters):
+    assert limiters.get("a.example") is limiters.get("a.example")
+    assert limiters.get("a.example") is not limiters.get("b.example")
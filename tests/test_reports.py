@@ -0,0 +1,87 @@
+import os
+import time
+
+from rocks_testsuite import reports
+
+REPORT_ID = "0123456789abcdef0123456789abcdef"
+OTHER_ID = "fedcba9876543210fedcba9876543210"
+
+
+def write(store, report_id, suffix=".json", size=10, age=0.0):
+    path = store.path(report_id, suffix)
+    with open(path, "w") as fp:
+        fp.write("x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_reports_are_sharded_by_id_prefix(tmp_path):
+    store = reports.ReportStore(str(tmp_path))
+    path = store.path(REPORT_ID, ".results.ndjson")
+    assert path == str(tmp_path / "01" / "23" / f"{REPORT_ID}.results.ndjson")
+    assert os.path.isdir(os.path.dirname(path))
+    assert store.find(REPORT_ID, ".results.ndjson") is None
+    write(store, REPORT_ID, ".results.ndjson")
+    assert store.find(REPORT_ID, ".results.ndjson") == path
+
+
+def test_reports_saved_before_sharding_are_found(tmp_path):
+    store = reports.ReportStore(str(tmp_path))
+    (tmp_path / f"{REPORT_ID}.json").write_text("{}")
+    assert store.find(REPORT_ID) == str(tmp_path / f"{REPORT_ID}.json")
+
+
+def test_reports_saved_in_the_package_are_found(tmp_path):
+    legacy = tmp_path / "package-reports"
+    legacy.mkdir()
+    (legacy / f"{REPORT_ID}.json").write_text("{}")
+    store = reports.ReportStore(str(tmp_path / "reports"), str(legacy))
+    assert store.find(REPORT_ID) == str(legacy / f"{REPORT_ID}.json")
+    assert store.find(OTHER_ID) is None
+
+
+def test_only_report_ids_and_suffixes_are_found(tmp_path):
+    store = reports.ReportStore(str(tmp_path))
+    (tmp_path / "secret.txt").write_text("")
+    for report_id, suffix in [
+        ("../secret", ".txt"),
+        ("secret", ".txt"),
+        (REPORT_ID.upper(), ".json"),
+        (REPORT_ID, ".txt"),
+    ]:
+        assert store.find(report_id, suffix) is None
+
+
+def test_collect_deletes_expired_reports(tmp_path):
+    store = reports.ReportStore(str(tmp_path))
+    old = write(store, REPORT_ID, age=3600)
+    new = write(store, OTHER_ID)
+    assert store.collect(max_age=60) == 1
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
+    # The emptied shard directories are removed too
+    assert sorted(os.listdir(tmp_path)) == ["fe"]
+
+
+def test_collect_deletes_the_oldest_reports_over_the_size_limit(tmp_path):
+    store = reports.ReportStore(str(tmp_path))
+    oldest = write(store, REPORT_ID, size=100, age=30)
+    older = write(store, REPORT_ID, ".results.ndjson", size=100, age=20)
+    newest = write(store, OTHER_ID, size=100, age=10)
+    assert store.collect(max_total_bytes=250) == 1
+    assert [os.path.exists(path) for path in [oldest, older, newest]] == [
+        False,
+        True,
+        True,
+    ]
+    assert store.collect(max_total_bytes=100) == 1
+    assert store.collect(max_total_bytes=100) == 0
+    assert store.find(OTHER_ID) == newest
+
+
+def test_collect_without_limits_keeps_everything(tmp_path):
+    store = reports.ReportStore(str(tmp_path))
+    path = write(store, REPORT_ID, age=10**6)
+    assert store.collect() == 0
+    assert os.path.exists(path)
@@ -0,0 +1,78 @@
+import asyncio
+
+from rocks_testsuite import result
+from rocks_testsuite.c2s_tests import C2SServerTests
+
+GROUP = "c2s-server-test-items"
+
+
+def set_previous(session, group, results):
+    session.previous_report = {
+        "id": "previous",
+        "results": {group: result.TestResults(results)},
+    }
+
+
+def test_passed_and_not_applicable_results_are_carried_over(session):
+    set_previous(session, GROUP, {"a": True, "b": result.TestNotApplicable("n/a")})
+    assert session.carry_over(GROUP, ["a", "b"])
+    assert session.results[GROUP] == {"a": True, "b": result.TestNotApplicable("n/a")}
+    assert session.carried_over[GROUP] == ["a", "b"]
+
+
+def test_failed_inconclusive_or_missing_results_are_not_carried_over(session):
+    set_previous(
+        session,
+        GROUP,
+        {
+            "a": True,
+            "b": False,
+            "c": result.TestInconclusive("?"),
+            "d": result.TestFailure("x"),
+        },
+    )
+    for test_ids in [["a", "b"], ["a", "c"], ["a", "d"], ["a", "e"], []]:
+        assert not session.carry_over(GROUP, test_ids)
+    assert not session.results[GROUP]
+
+
+def test_question_groups_with_failed_answers_are_asked_again(session):
+    group_name = "server-common-test-items"
+    groups = session.get_questions(group_name)
+    passed, failed = [
+        [question["id"] for question in group["questions"]] for group in groups[:2]
+    ]
+    set_previous(
+        session,
+        group_name,
+        {**{i: True for i in passed}, **{i: i != failed[0] for i in failed}},
+    )
+    asked = []
+
+    async def send_question(template_name, group):
+        ids = [question["id"] for question in group["questions"]]
+        asked.append(ids)
+        return {i: True for i in ids}
+
+    session.send_question = send_question
+    asyncio.run(session.ask_questions(group_name))
+    assert passed not in asked
+    assert failed in asked
+    assert session.carried_over[group_name] == passed
+    assert all(session.results[group_name][i] is True for i in failed)
+
+
+def test_c2s_tests_are_rerun_unless_all_results_passed(session):
+    tests = C2SServerTests(session, session.results[GROUP])
+    name = "test_outbox_activity_follow_undo"
+    ids = C2SServerTests.TESTS[name]
+    set_previous(session, GROUP, {i: True for i in ids})
+    assert tests._carried_result_ids(name) == ids
+    # Results of tests that were added later don't prevent reuse
+    set_previous(session, GROUP, {ids[0]: True})
+    assert tests._carried_result_ids(name) == ids
+    set_previous(session, GROUP, {**{i: True for i in ids}, ids[1]: False})
+    assert tests._carried_result_ids(name) == []
+    # The test raised an exception last time
+    set_previous(session, GROUP, {name: result.TestFailure("Test exception: x")})
+    assert tests._carried_result_ids(name) == []
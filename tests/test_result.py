@@ -0,0 +1,45 @@
+import json
+
+from rocks_testsuite import result
+
+
+def test_result_codes_serialize_as_records():
+    results = result.TestResults(
+        {"a": True, "b": result.TestFailure("broken"), "c": False}
+    )
+    assert json.loads(result.dumps(results)) == {
+        "a": True,
+        "b": {"code": "TestFailure", "comment": "broken"},
+        "c": False,
+    }
+
+
+def test_loaded_results_keep_their_type():
+    for value in [
+        True,
+        False,
+        result.TestFailure("f"),
+        result.TestInconclusive("i"),
+        result.TestNotApplicable("n"),
+    ]:
+        loaded = result.load_result(json.loads(result.dumps(value)))
+        assert loaded == value
+        assert type(loaded) is type(value)
+
+
+def test_unknown_codes_load_as_failures():
+    loaded = result.load_result({"code": "Unknown", "comment": "x"})
+    assert isinstance(loaded, result.TestFailure)
+    assert loaded.comment == "x"
+
+
+def test_outcomes():
+    assert result.outcome_of(True) == result.Outcome.PASSED
+    assert result.outcome_of(False) == result.Outcome.FAILED
+    assert (
+        result.outcome_of(result.TestInconclusive("x")) == result.Outcome.INCONCLUSIVE
+    )
+    assert (
+        result.outcome_of(result.TestNotApplicable("x"))
+        == result.Outcome.NOT_APPLICABLE
+    )
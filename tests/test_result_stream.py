@@ -0,0 +1,61 @@
+import json
+import xml.etree.ElementTree as ET
+
+from rocks_testsuite import result
+from rocks_testsuite.reports import results_path
+from rocks_testsuite.result_stream import ResultStream, junit_xml
+
+REPORT_ID = "0123456789abcdef0123456789abcdef"
+
+
+def test_results_are_appended_as_lines(report_store):
+    stream = ResultStream(REPORT_ID)
+    stream.write("c2s", result.TestResults())
+    assert report_store.find(REPORT_ID, ".results.ndjson") is None
+    stream.write("c2s", result.TestResults({"a": True}), seconds=1.23456)
+    # Written through, while the stream is still open
+    with open(results_path(REPORT_ID)) as fp:
+        [record] = [json.loads(line) for line in fp]
+    assert record["group"] == "c2s"
+    assert record["outcome"] == "passed"
+    assert record["seconds"] == 1.235
+    stream.write("c2s", result.TestResults({"b": result.TestFailure("x")}))
+    stream.close()
+    with open(results_path(REPORT_ID)) as fp:
+        assert [json.loads(line)["id"] for line in fp] == ["a", "b"]
+
+
+def test_junit_xml(report_store):
+    stream = ResultStream(REPORT_ID)
+    stream.write(
+        "c2s",
+        result.TestResults(
+            {
+                "passed": True,
+                "failed": result.TestFailure("Wrong <type>"),
+                "no": False,
+                "inconclusive": result.TestInconclusive("Timed out"),
+                "n/a": result.TestNotApplicable("No liked collection"),
+            }
+        ),
+        seconds=0.5,
+    )
+    stream.close()
+    with open(results_path(REPORT_ID)) as fp:
+        lines = list(fp)
+    # A partly written last line is left out
+    lines.append('{"group": "c2s", "id": "partial"')
+    suite = ET.fromstring("".join(junit_xml(lines, "rocks-testsuite run")))
+    assert suite.get("name") == "rocks-testsuite run"
+    cases = {case.get("name"): case for case in suite}
+    assert list(cases) == ["passed", "failed", "no", "inconclusive", "n/a"]
+    assert cases["passed"].get("time") == "0.5"
+    assert len(cases["passed"]) == 0
+    failure = cases["failed"].find("failure")
+    assert failure.get("type") == "TestFailure"
+    assert failure.text == "Wrong <type>"
+    assert cases["no"].find("failure") is not None
+    assert cases["inconclusive"].find("skipped").get("message") == (
+        "Inconclusive: Timed out"
+    )
+    assert cases["n/a"].find("skipped").get("message") == "No liked collection"
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from rocks_testsuite import s2s_tests, test_session
+
+TARGET = {
+    "id": "https://server.example/actor",
+    "inbox": "https://server.example/actor/inbox",
+}
+
+
+@pytest.fixture
+def benchmark_session(session):
+    session.config.update(
+        {
+            "s2s-benchmark": True,
+            "s2s-benchmark-actors": 2,
+            "actor-id": TARGET["id"],
+        }
+    )
+    return session
+
+
+def notices(session) -> list[str]:
+    return [event["content"] for event in session.job.events if "content" in event]
+
+
+def use_target(monkeypatch, target):
+    async def get_json(url, token=None):
+        return target
+
+    monkeypatch.setattr(s2s_tests, "_get_json", get_json)
+
+
+def test_failed_benchmark_is_reported_and_the_session_continues(
+    benchmark_session, monkeypatch
+):
+    use_target(monkeypatch, TARGET)
+
+    async def post(self, url, json_data):
+        raise httpx.ConnectError("Connection refused")
+
+    monkeypatch.setattr(test_session.TestActor, "post", post)
+    asyncio.run(benchmark_session.run_s2s_tests())
+    assert "Fan-out benchmark failed: Connection refused" in "".join(
+        notices(benchmark_session)
+    )
+    assert "s2s-fan-out" not in benchmark_session.metrics
+    # The questions after the benchmark were still asked
+    assert benchmark_session.results["server-inbox-test-items"]
+
+
+def test_benchmark_needs_the_actor_inbox(benchmark_session, monkeypatch):
+    use_target(monkeypatch, {"id": TARGET["id"]})
+    asyncio.run(benchmark_session.run_s2s_benchmark())
+    assert "Fan-out benchmark failed: The actor has no id or inbox" in "".join(
+        notices(benchmark_session)
+    )
+    assert not benchmark_session.actors
@@ -0,0 +1,77 @@
+import pytest
+
+from rocks_testsuite import selection
+
+METADATA = {
+    "outbox:undo": {"requirement_level": "NON-NORMATIVE"},
+    "outbox:like": {"requirement_level": "SHOULD"},
+    "outbox:like:adds-object-to-liked": {"requirement_level": "SHOULD"},
+    "outbox:removes-bto-and-bcc": {"requirement_level": "MUST"},
+    "inbox:accept:deduplicate": {"requirement_level": "MUST"},
+}
+
+
+def select(**config):
+    return selection.TestSelection.from_config(config, METADATA)
+
+
+def selected(test_selection):
+    return [test_id for test_id in METADATA if test_selection.includes(test_id)]
+
+
+def test_an_empty_selection_selects_everything():
+    test_selection = select()
+    assert test_selection.selects_all
+    assert selected(test_selection) == list(METADATA)
+    # Tests without metadata too
+    assert test_selection.includes("server:unknown")
+
+
+def test_glob_patterns_match_whole_ids():
+    assert selected(select(**{"select-tests": "outbox:like*"})) == [
+        "outbox:like",
+        "outbox:like:adds-object-to-liked",
+    ]
+    assert selected(select(**{"select-tests": "outbox:like"})) == ["outbox:like"]
+    assert selected(select(**{"select-tests": "*:dedup"})) == []
+    assert selected(select(**{"select-tests": "*:deduplicate"})) == [
+        "inbox:accept:deduplicate"
+    ]
+
+
+def test_patterns_can_be_a_list_or_a_separated_string():
+    expected = ["outbox:undo", "inbox:accept:deduplicate"]
+    for patterns in [
+        "outbox:undo, inbox:*",
+        "outbox:undo inbox:*",
+        ["outbox:undo", " inbox:* ", ""],
+    ]:
+        test_selection = select(**{"select-tests": patterns})
+        assert not test_selection.selects_all
+        assert selected(test_selection) == expected
+
+
+def test_levels_are_case_insensitive():
+    assert selected(select(**{"select-levels": "must"})) == [
+        "outbox:removes-bto-and-bcc",
+        "inbox:accept:deduplicate",
+    ]
+    assert selected(select(**{"select-levels": ["SHOULD", "non-normative"]})) == [
+        "outbox:undo",
+        "outbox:like",
+        "outbox:like:adds-object-to-liked",
+    ]
+
+
+def test_levels_exclude_tests_without_metadata():
+    assert not select(**{"select-levels": "MUST"}).includes("server:unknown")
+
+
+def test_patterns_and_levels_must_both_match():
+    test_selection = select(**{"select-tests": "outbox:*", "select-levels": "MUST"})
+    assert selected(test_selection) == ["outbox:removes-bto-and-bcc"]
+
+
+def test_unknown_levels_are_rejected():
+    with pytest.raises(ValueError, match="OPTIONAL"):
+        select(**{"select-levels": "MUST, optional"})
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from rocks_testsuite.c2s_tests import C2SServerTests
+
+
+def test_automated_tests_run_while_questions_are_asked(session, monkeypatch):
+    session.config.update({"testing-c2s-server": True, "testing-client": True})
+    done = asyncio.Event()
+    asked = []
+
+    async def setup(self):
+        pass
+
+    async def run_tests(self):
+        # Finishes only after the questionnaire has been answered
+        await done.wait()
+        self._results.update({"outbox:removes-bto-and-bcc": True})
+
+    async def ask_questions(group_name, result_group_name=None):
+        results = session.results["c2s-server-test-items"]
+        asked.append((group_name, bool(results)))
+        if group_name == "server-common-test-items":
+            done.set()
+
+    monkeypatch.setattr(C2SServerTests, "setup", setup)
+    monkeypatch.setattr(C2SServerTests, "run_tests", run_tests)
+    monkeypatch.setattr(session, "ask_questions", ask_questions)
+    # Running the tests first would never finish
+    asyncio.run(asyncio.wait_for(session.run_tests(), 5))
+    assert asked == [
+        ("client-test-items", False),
+        ("outbox-remaining-questions", False),
+        ("server-common-test-items", False),
+    ]
+    assert session.results["c2s-server-test-items"] == {
+        "outbox:removes-bto-and-bcc": True
+    }
+
+
+def test_background_work_is_cancelled_when_the_session_ends(session, monkeypatch):
+    cancelled = []
+
+    async def background():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def flow():
+        session.create_task(background())
+        await asyncio.sleep(0)
+
+    monkeypatch.setattr(session, "_run", flow)
+    asyncio.run(asyncio.wait_for(session.run(), 5))
+    assert cancelled == [True]
+    assert session.ended
+
+
+def test_flow_errors_end_the_session(session, monkeypatch):
+    async def flow():
+        session.create_task(asyncio.sleep(60))
+        raise RuntimeError("Test flow failed")
+
+    monkeypatch.setattr(session, "_run", flow)
+    with pytest.raises(RuntimeError, match="Test flow failed"):
+        asyncio.run(asyncio.wait_for(session.run(), 5))
+    assert session.ended
+    assert not session._tasks
+
+
+def test_messages_that_are_not_json_are_ignored(session):
+    class WebSocket:
+        frames = ['{"answer": "no"}', "not json", '{"answer": "yes"}']
+
+        async def receive_json(self):
+            if not self.frames:
+                raise WebSocketDisconnect()
+            return json.loads(self.frames.pop(0))
+
+    session.websocket = WebSocket()
+    asyncio.run(session._receive())
+    assert session._answers.get_nowait() == {"answer": "no"}
+    assert session._answers.get_nowait() == {"answer": "yes"}
+    assert session._answers.empty()
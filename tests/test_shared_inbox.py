@@ -0,0 +1,72 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+REMOTE = "https://server.example/users/alice"
+PUBLIC = "https://www.w3.org/ns/activitystreams#Public"
+
+
+def post(session, activity, method="POST"):
+    body = json.dumps(activity).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    request = Request({"type": "http", "method": method, "headers": []}, receive)
+    return asyncio.run(session.process_shared_inbox(request))
+
+
+@pytest.fixture
+def actors(session):
+    actors = [session.actors.create() for _ in range(3)]
+    for actor in actors[:2]:
+        actor._set_following(REMOTE, True)
+    return actors
+
+
+def test_actors_advertise_the_shared_inbox(session, actors):
+    assert actors[0].profile["endpoints"] == {
+        "sharedInbox": f"http://testserver/ap/u/{session.id}/inbox"
+    }
+    session.config["shared-inbox"] = False
+    assert "endpoints" not in actors[0].profile
+
+
+def test_public_posts_go_to_the_followers_of_the_sender(session, actors):
+    create = {"type": "Create", "actor": REMOTE, "to": [PUBLIC], "object": "x"}
+    assert post(session, create).status_code == 202
+    assert [actor.inbox for actor in actors] == [[create], [create], []]
+    assert session.inbox_stats["shared-inbox-requests"] == 1
+    assert session.inbox_stats["shared-inbox-deliveries"] == 2
+
+
+def test_addressed_actors_and_objects_get_the_activity(session, actors):
+    note = {"type": "Create", "actor": REMOTE, "to": {"id": actors[2].uri}}
+    follow = {
+        "type": "Follow",
+        "actor": "https://x.example/bob",
+        "object": actors[2].uri,
+    }
+    post(session, note)
+    post(session, follow)
+    assert [actor.inbox for actor in actors] == [[], [], [note, follow]]
+
+
+def test_other_senders_reach_nobody(session, actors):
+    create = {"type": "Create", "actor": "https://x.example/bob", "to": [PUBLIC]}
+    post(session, create)
+    assert not any(actor.inbox for actor in actors)
+    assert session.inbox_stats["shared-inbox-deliveries"] == 0
+
+
+def test_shared_inbox_can_be_disabled(session, actors):
+    with pytest.raises(HTTPException) as error:
+        post(session, {}, method="GET")
+    assert error.value.status_code == 405
+    session.config["shared-inbox"] = False
+    with pytest.raises(HTTPException) as error:
+        post(session, {"type": "Create", "actor": REMOTE, "to": [PUBLIC]})
+    assert error.value.status_code == 404
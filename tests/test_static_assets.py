@@ -0,0 +1,80 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from rocks_testsuite.static_assets import (
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+    StaticAssets,
+)
+
+CSS = "body { background: url('../images/logo.png') } /* " + "x" * 500 + " */"
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "images" / "logo.png").write_bytes(b"\x89PNG")
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css" / "style.css").write_text(CSS)
+    return StaticAssets(str(tmp_path))
+
+
+@pytest.fixture
+def client(assets):
+    return TestClient(Starlette(routes=[Mount("/static", assets)]))
+
+
+def test_fingerprinted_names_are_immutable(assets, client):
+    url = assets.url("images/logo.png")
+    assert url.startswith("images/logo.") and url != "images/logo.png"
+    response = client.get(f"/static/{url}")
+    assert response.content == b"\x89PNG"
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    response = client.get("/static/images/logo.png")
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    assert client.get("/static/images/missing.png").status_code == 404
+    assert client.post("/static/images/logo.png").status_code == 405
+
+
+def test_css_references_are_fingerprinted(assets, client):
+    css = client.get("/static/css/style.css").text
+    assert f"url('../{assets.url('images/logo.png')}')" in css
+
+
+def test_compressed_variants_after_precompress(assets, client):
+    headers = {"Accept-Encoding": "gzip"}
+    response = client.get("/static/css/style.css", headers=headers)
+    assert "content-encoding" not in response.headers
+    assets.precompress()
+    response = client.get(
+        "/static/css/style.css", headers={"Accept-Encoding": "gzip, br;q=0"}
+    )
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"].endswith('-gzip"')
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert "background" in response.text
+    raw = client.get("/static/css/style.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert raw.headers["etag"] != response.headers["etag"]
+    # Images aren't compressed
+    response = client.get("/static/images/logo.png", headers=headers)
+    assert "content-encoding" not in response.headers
+
+
+def test_etags_are_revalidated(assets, client):
+    etag = client.get("/static/images/logo.png").headers["etag"]
+    response = client.get(
+        "/static/images/logo.png", headers={"If-None-Match": f'"other", W/{etag}'}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not response.content
+
+
+def test_head_requests_have_no_body(client):
+    response = client.head("/static/images/logo.png")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "4"
+    assert not response.content
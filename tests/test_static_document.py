@@ -0,0 +1,62 @@
+from starlette.requests import Request
+
+from rocks_testsuite.test_session import ACTIVITY_JSON, LD_JSON, StaticDocument
+
+
+def make_request(method: str = "GET", **headers: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": method,
+            "path": "/",
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+def test_serves_the_document_with_validators():
+    document = StaticDocument({"id": "https://example.com/a"})
+    response = document.response(make_request())
+    assert response.status_code == 200
+    assert response.body == document.body
+    assert response.headers["etag"] == document.etag
+    assert response.headers["content-type"] == ACTIVITY_JSON
+    assert "max-age=300" in response.headers["cache-control"]
+
+
+def test_etag_depends_on_the_content():
+    first = StaticDocument({"id": "https://example.com/a"})
+    assert first.etag == StaticDocument({"id": "https://example.com/a"}).etag
+    assert first.etag != StaticDocument({"id": "https://example.com/b"}).etag
+
+
+def test_matching_if_none_match_is_not_modified():
+    document = StaticDocument({"id": "https://example.com/a"})
+    for if_none_match in [document.etag, f'"x", W/{document.etag}', "*"]:
+        response = document.response(make_request(if_none_match=if_none_match))
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == document.etag
+
+
+def test_other_etags_get_the_document():
+    document = StaticDocument({"id": "https://example.com/a"})
+    response = document.response(make_request(if_none_match='"other"'))
+    assert response.status_code == 200
+    assert response.body == document.body
+
+
+def test_head_has_headers_only():
+    document = StaticDocument({"id": "https://example.com/a"})
+    response = document.response(make_request("HEAD"))
+    assert response.body == b""
+    assert response.headers["content-length"] == str(len(document.body))
+
+
+def test_ld_json_is_served_when_preferred():
+    document = StaticDocument({})
+    response = document.response(make_request(accept="application/ld+json"))
+    assert response.headers["content-type"].startswith(LD_JSON)